@@ -0,0 +1,16 @@
+from pywasmjit import wasmjit
+
+# Many small functions of the same shape, for the tests measuring compile, link and startup times
+KERNEL_SOURCE = '''def kernel_{i}(n: int) -> int:
+    acc = 0
+    for j in range(n):
+        if j % {divisor} == 0:
+            acc += j * {i}
+        else:
+            acc += 1
+    return acc
+'''
+
+
+def declare_kernels(count: int = 50, **options) -> list:
+    return [wasmjit(KERNEL_SOURCE.format(i=i, divisor=i + 2), **options) for i in range(count)]
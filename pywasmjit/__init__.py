@@ -1 +1,7 @@
-from .main import wasmjit, wasmreg, warmup, cleanup
+from .main import JITContext, default_context
+from .main import wasmjit, wasmreg, warmup, cleanup, ready, set_eager, set_int_mode, set_opt_level, \
+    set_inline_threshold
+from .main import enable_cache, disable_cache, cache_stats
+from .main import compile_stats, set_compile_hook
+from .main import enable_tiering, disable_tiering, tier_stats
+from .main import enable_instance_pool, disable_instance_pool, pool_stats
@@ -1,22 +1,28 @@
 import ast
+from typing import Optional
 
 
 class FuncDef(ast.AST):
-    _fields = ['func_name', 'params', 'stmts', 'return_type']
+    _fields = ['func_name', 'params', 'stmts', 'return_type', 'int_type', 'checked', 'opt_level']
 
-    def __init__(self, func_name: str, params, stmts, return_type=None):
+    def __init__(self, func_name: str, params, stmts, return_type=None, int_type='i32', checked=False,
+                 opt_level=0):
         self.func_name = func_name
         self.params = params
         self.stmts = stmts
         self.return_type = return_type
+        self.int_type = int_type  # 'i32' or 'i64'
+        self.checked = checked  # trap on integer overflow instead of wrapping
+        self.opt_level = opt_level
 
 
 class FuncCall(ast.AST):
-    _fields = ['func_name', 'args']
+    _fields = ['func_name', 'args', 'type']
 
-    def __init__(self, func_name: str, args):
+    def __init__(self, func_name: str, args, type=None):
         self.func_name = func_name
         self.args = args
+        self.type = type
 
 
 class Var(ast.AST):
@@ -27,25 +33,37 @@ class Var(ast.AST):
         self.type = type
 
 
+class Subscript(ast.AST):
+    _fields = ['value', 'index', 'type']
+
+    def __init__(self, value, index, type=None):
+        self.value = value
+        self.index = index
+        self.type = type
+
+
 class IntLiteral(ast.AST):
-    _fields = ['value']
+    _fields = ['value', 'type']
 
     def __init__(self, value: int):
         self.value = value
+        self.type = 'int'
 
 
 class FloatLiteral(ast.AST):
-    _fields = ['value']
+    _fields = ['value', 'type']
 
     def __init__(self, value: float):
         self.value = value
+        self.type = 'float'
 
 
 class BoolLiteral(ast.AST):
-    _fields = ['value']
+    _fields = ['value', 'type']
 
     def __init__(self, value: bool):
         self.value = bool(value)
+        self.type = 'bool'
 
 
 class Assign(ast.AST):
@@ -65,12 +83,13 @@ class Expr(ast.AST):
 
 
 class Compare(ast.AST):
-    _fields = ['left', 'op', 'comparator']
+    _fields = ['left', 'op', 'comparator', 'type']
 
-    def __init__(self, left, op, comparator):
+    def __init__(self, left, op, comparator, type=None):
         self.left = left
         self.op = op
         self.comparator = comparator
+        self.type = type
 
 
 class If(ast.AST):
@@ -83,20 +102,22 @@ class If(ast.AST):
 
 
 class BinOp(ast.AST):
-    _fields = ['left', 'op', 'right']
+    _fields = ['left', 'op', 'right', 'type']
 
-    def __init__(self, left, op, right):
+    def __init__(self, left, op, right, type=None):
         self.left = left
         self.op = op
         self.right = right
+        self.type = type
 
 
 class UnaryOp(ast.AST):
-    _fields = ['op', 'right']
+    _fields = ['op', 'right', 'type']
 
-    def __init__(self, op, right):
+    def __init__(self, op, right, type=None):
         self.op = op
         self.right = right
+        self.type = type
 
 
 class While(ast.AST):
@@ -135,3 +156,58 @@ class Return(ast.AST):
 
 class Pass(ast.AST):
     _fields = []
+
+
+def clone(node):
+    # Deep copy of a tree of the nodes below, their constructors take arguments so copy.deepcopy() can't be used
+    if isinstance(node, list):
+        return [clone(item) for item in node]
+    if not isinstance(node, ast.AST) or type(node).__module__ == 'ast':
+        # Values, and the operators shared with the Python AST
+        return node
+    copied = type(node).__new__(type(node))
+    copied.__dict__.update({name: clone(value) for name, value in node.__dict__.items()})
+    return copied
+
+
+def assigned_names(stmts: list, names: set[str]):
+    for stmt in stmts:
+        if isinstance(stmt, Assign) and isinstance(stmt.target, Var):
+            names.add(stmt.target.id)
+        elif isinstance(stmt, For):
+            names.add(stmt.loopvar.id)
+            assigned_names(stmt.stmts, names)
+        elif isinstance(stmt, While):
+            assigned_names(stmt.stmts, names)
+        elif isinstance(stmt, If):
+            assigned_names(stmt.stmts, names)
+            assigned_names(stmt.orelse, names)
+
+
+def expr_type(node: ast.AST) -> Optional[str]:
+    # Type of an expression of the type checked AST, annotated by the type checker
+    return getattr(node, 'type', None)
+
+
+def is_pure(node: ast.AST) -> bool:
+    # Expressions without side effects which can not trap, they may be evaluated more or less often
+    if isinstance(node, (IntLiteral, FloatLiteral, BoolLiteral, Var)):
+        return True
+    elif isinstance(node, BinOp):
+        if node.op in (ast.Div, ast.Mod) and expr_type(node.left) == 'int':
+            # div_s / rem_s trap on zero, and div_s on INT_MIN / -1
+            if not isinstance(node.right, IntLiteral) or node.right.value in (0, -1):
+                return False
+        return is_pure(node.left) and is_pure(node.right)
+    elif isinstance(node, UnaryOp):
+        return is_pure(node.right)
+    elif isinstance(node, Compare):
+        return is_pure(node.left) and is_pure(node.comparator)
+    elif isinstance(node, FuncCall):
+        if node.func_name in ('float', 'bool', 'len') or \
+                (node.func_name == 'int' and expr_type(node.args[0]) != 'float'):
+            return all(is_pure(arg) for arg in node.args)
+        # int() of a float traps on NaN and out of range values, other calls may have side effects
+        return False
+    # Buffer reads trap when out of bounds
+    return False
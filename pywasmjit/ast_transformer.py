@@ -3,17 +3,43 @@ import types
 import inspect
 from textwrap import dedent
 
-from .ast import (FuncDef, FuncCall, Var, IntLiteral, FloatLiteral, BoolLiteral, Assign, Expr,
+from .ast import (FuncDef, FuncCall, Var, Subscript, IntLiteral, FloatLiteral, BoolLiteral, Assign, Expr,
                   Compare, If, BinOp, UnaryOp, While, For, Continue, Break, Return, Pass)
 
 
+BUFFER_ANNOTATIONS = ('list', 'ndarray')
+
+
 def get_typehint(var):
-    if hasattr(var, 'annotation') and hasattr(var.annotation, 'id'):
-        return var.annotation.id
+    if not hasattr(var, 'annotation'):
+        return None
+    annotation = var.annotation
+    if hasattr(annotation, 'id'):
+        return annotation.id
+    if isinstance(annotation, ast.Subscript):
+        # Buffer types: list[float], ndarray[float], np.ndarray[float]
+        container = annotation.value
+        container_name = container.id if isinstance(container, ast.Name) else getattr(container, 'attr', None)
+        element = annotation.slice
+        if type(element).__name__ == 'Index':  # Python < 3.9
+            element = element.value
+        if container_name in BUFFER_ANNOTATIONS and hasattr(element, 'id'):
+            return f'list[{element.id}]'
     return None
 
 
-FUNC_NAME_BLACKLIST = ('print', 'print_int', 'print_float', 'print_bool')
+def get_source(source) -> str:
+    if isinstance(source, types.ModuleType)\
+            or isinstance(source, types.FunctionType)\
+            or isinstance(source, types.LambdaType):
+        return dedent(inspect.getsource(source))
+    elif isinstance(source, str):
+        return dedent(source)
+    else:
+        raise NotImplementedError(ast.dump(source))
+
+
+FUNC_NAME_BLACKLIST = ('print', 'print_int', 'print_int64', 'print_float', 'print_bool')
 
 
 class ASTTransformer(ast.NodeTransformer):
@@ -21,16 +47,7 @@ class ASTTransformer(ast.NodeTransformer):
         pass
 
     def transform(self, source):
-        if isinstance(source, types.ModuleType)\
-                or isinstance(source, types.FunctionType)\
-                or isinstance(source, types.LambdaType):
-            source = dedent(inspect.getsource(source))
-        elif isinstance(source, str):
-            source = dedent(source)
-        else:
-            raise NotImplementedError(ast.dump(source))
-
-        tree = ast.parse(source)
+        tree = ast.parse(get_source(source))
         return self.visit(tree)
 
     def visit_Module(self, node: ast.Module):
@@ -71,6 +88,16 @@ class ASTTransformer(ast.NodeTransformer):
     def visit_Name(self, node: ast.Name):
         return Var(node.id)
 
+    def visit_Subscript(self, node: ast.Subscript):
+        if not isinstance(node.value, ast.Name):
+            raise NotImplementedError('Subscript is only supported on variables')
+        index = node.slice
+        if type(index).__name__ == 'Index':  # Python < 3.9
+            index = index.value
+        if isinstance(index, ast.Slice):
+            raise NotImplementedError('Slicing is not supported')
+        return Subscript(self.visit(node.value), self.visit(index))
+
     def visit_Num(self, node: ast.Num):
         if isinstance(node.n, float):
             return FloatLiteral(node.n)
@@ -0,0 +1,126 @@
+import sys
+from array import array
+from typing import Optional, Callable
+
+from .exec_instance import ExecInstance
+from .utils import element_pytype, element_type
+
+
+# Buffer formats which can be copied into linear memory as they are (if the item size matches), per pytype
+ACCEPTED_FORMATS = {
+    'int': ('i', 'l', 'q'),
+    'bool': ('?', 'B'),
+    'float': ('d',)
+}
+
+ALIGNMENT = 8
+
+
+def is_numpy_array(obj) -> bool:
+    return type(obj).__module__ == 'numpy'
+
+
+def as_direct_buffer(obj, pytype: str, int_type: str = 'i32') -> Optional[memoryview]:
+    # A byte view of obj if it can be copied into linear memory as it is
+    try:
+        view = memoryview(obj)
+    except TypeError:
+        return None
+
+    if not view.c_contiguous or view.itemsize != element_type(pytype, int_type)[1]\
+            or view.format.lstrip('@=<') not in ACCEPTED_FORMATS[pytype]:
+        return None
+    return view.cast('B')
+
+
+def to_memory_buffer(obj, pytype: str, int_type: str = 'i32') -> memoryview:
+    # Buffers in the right format are copied with a single memcpy, anything else
+    # (lists, other dtypes) is converted element by element first
+    view = as_direct_buffer(obj, pytype, int_type)
+    if view is None:
+        view = converted_buffer(obj, pytype, int_type)
+    return view
+
+
+def converted_buffer(obj, pytype: str, int_type: str = 'i32') -> memoryview:
+    return memoryview(array(element_type(pytype, int_type)[0], obj)).cast('B')
+
+
+def check_convertible(obj, pytype: str):
+    # Stores to a converted buffer can only be written back into lists, NumPy arrays and array.array,
+    # any other writable buffer has to be passed in the element format already
+    if isinstance(obj, (list, array)) or is_numpy_array(obj):
+        return
+    try:
+        view = memoryview(obj)
+    except TypeError:
+        return  # other iterables (tuples, ranges, ...) are inputs only
+    if not view.readonly:
+        raise TypeError(f'Writable buffer of format {view.format!r} does not match list[{pytype}]')
+
+
+def copy_back(obj, values: array, pytype: str):
+    # Writes the stores done to a converted buffer back into the object it was converted from
+    if isinstance(obj, list):
+        obj[:] = map(bool, values) if pytype == 'bool' else values
+    elif isinstance(obj, array):
+        obj[:] = array(obj.typecode, values)
+    elif is_numpy_array(obj) and obj.flags.writeable:
+        obj[...] = sys.modules['numpy'].frombuffer(values, dtype=values.typecode)
+
+
+def make_output(pytype: str, length: int, int_type: str = 'i32') -> array:
+    typecode, element_size, _, _, _ = element_type(pytype, int_type)
+    return array(typecode, bytes(length * element_size))
+
+
+def to_result(out: array, pytype: str, as_numpy: bool):
+    if as_numpy:
+        numpy = sys.modules['numpy']
+        return numpy.frombuffer(out, dtype='?' if pytype == 'bool' else out.typecode)
+    return out
+
+
+def align(offset: int) -> int:
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def call_with_buffers(instance: ExecInstance, func: Callable, params: list[str], args, int_type: str = 'i32'):
+    # Buffer arguments are copied into linear memory and passed as (pointer, length),
+    # then copied back so that stores done by the function are visible to the caller
+    wasm_args = []
+    buffers = []
+    offset = align(instance.memory_top)
+    for arg, param in zip(args, params):
+        element_ty = element_pytype(param)
+        if element_ty is None:
+            wasm_args.append(float(arg) if param == 'float' else arg)
+            continue
+
+        buf = as_direct_buffer(arg, element_ty, int_type)
+        converted = buf is None
+        if converted:
+            check_convertible(arg, element_ty)
+            buf = converted_buffer(arg, element_ty, int_type)
+        wasm_args.append(offset)
+        wasm_args.append(len(buf) // element_type(element_ty, int_type)[1])
+        buffers.append((arg, element_ty, buf, offset, converted))
+        offset = align(offset + len(buf))
+
+    instance.ensure_memory(offset)
+    for _, _, buf, buf_offset, _ in buffers:
+        instance.write_memory(buf_offset, buf)
+
+    top = instance.memory_top
+    instance.memory_top = offset
+    try:
+        result = func(*wasm_args)
+    finally:
+        instance.memory_top = top
+
+    for arg, element_ty, buf, buf_offset, converted in buffers:
+        if not buf.readonly:
+            instance.read_memory(buf_offset, buf)
+            if converted:
+                copy_back(arg, buf.obj, element_ty)
+    return result
@@ -7,7 +7,7 @@ from .utils import pytype_to_wasmtype
 from .utils import FunctionSignature
 
 
-CALLBACK_NAME_BLACKLIST = ('print', 'print_int', 'print_float', 'print_bool')
+CALLBACK_NAME_BLACKLIST = ('print', 'print_int', 'print_int64', 'print_float', 'print_bool')
 
 
 class CallbackPool:
@@ -1,36 +1,252 @@
 from typing import Optional
+from collections import OrderedDict
 
 from .ast import *
 from .wasm.builder import Builder, FunctionContext
 from .wasm.components import WASMType
 from .callback_pool import CallbackPool
-from .utils import pytype_to_wasmtype
+from .peephole import optimize
+from .utils import pytype_to_wasmtype, pytype_to_wasmtypes
 from .utils import FunctionSignature
-from .utils import DEBUG
+from .utils import INT_RANGES, element_pytype, element_type
+from .utils import DEFAULT_INLINE_THRESHOLD, DEBUG
 
 
 class WASMCodeGen:
-    _fields = ['_callback_pool', '_builder', '_ctx']
+    _fields = ['_callback_pool', '_builders', '_builder', '_ctx', '_int_type', '_checked']
 
     def __init__(self, callback_pool: CallbackPool):
         self._callback_pool = callback_pool
-        self._builder = Builder()
+        # Every function is emitted as its own module, so that adding a function never
+        # requires rebuilding (and recompiling) the functions defined before it
+        self._builders: OrderedDict[str, Builder] = OrderedDict()  # func_name => Builder
+        self._builder: Optional[Builder] = None
+        self._prebuilt: dict[str, bytes] = {}  # func_name => module bytes restored from cache
         self._ctx: Optional[FunctionContext] = None
         self._func_signatures: dict[str, FunctionSignature] = {}  # func_name => FunctionSignature
+        self._instruction_counts: dict[str, int] = {}  # func_name => number of instructions generated
+        self._local_counts: dict[str, int] = {}  # func_name => number of locals declared, besides the parameters
+        self._func_asts: dict[str, FuncDef] = {}  # func_name => typed AST, bodies which may be inlined
+        self._inline_count = 0
+        self._int_type: WASMType = WASMType('i32')  # int type of the function being generated
+        self._checked = False
+        self._opt_level = 0
+        self.inline_threshold = DEFAULT_INLINE_THRESHOLD  # max instructions of functions inlined at opt_level >= 2
+
+    def _wasmtype(self, pytype: Optional[str]) -> Optional[WASMType]:
+        return pytype_to_wasmtype(pytype, self._int_type)
+
+    def _add_callback_imported_function(self, func_name: str, py_sig: FunctionSignature):
+        # In 64-bit mode callbacks are imported with i64 ints under a separate field name
+        fieldname = func_name if self._int_type == 'i32' else f'{func_name}$i64'
+        wasm_params = [self._wasmtype(param) for param in py_sig.params]
+        wasm_return_type = self._wasmtype(py_sig.return_type)
+        self._builder.add_imported_function(func_name, wasm_params, wasm_return_type, 'callback', fieldname)
+
+    def _add_jit_imported_function(self, func_name: str, signature: FunctionSignature):
+        # Functions compiled earlier live in other modules, link them through imports
+        wasm_params = [wasmtype for param in signature.params
+                       for wasmtype in pytype_to_wasmtypes(param, signature.int_type)]
+        wasm_return_type = pytype_to_wasmtype(signature.return_type, signature.int_type)
+        self._builder.add_imported_function(func_name, wasm_params, wasm_return_type, 'jit', func_name)
+
+    def _scratch_local(self, name: str, wasmtype: WASMType) -> int:
+        index = self._ctx.get_local_index(name)
+        if index == -1:
+            index = self._ctx.new_local(name, wasmtype)
+        return index
+
+    def _emit_trap_if(self):
+        self._ctx.add_instruction(('if', 'emptyblock'))
+        self._ctx.add_instruction(('unreachable',))
+        self._ctx.add_instruction(('end',))
 
-    def _add_callback_imported_function(self, func_name: str, wasm_sig: FunctionSignature):
-        self._builder.add_imported_function(func_name, wasm_sig.params, wasm_sig.return_type, 'callback', func_name)
+    def _emit_int_convert(self, from_type: WASMType, to_type: WASMType):
+        # Convert an int on the stack between functions compiled with different int types
+        if from_type == to_type:
+            return
+        if to_type == 'i64':
+            self._ctx.add_instruction(('i64.extend_i32_s',))
+        elif not self._checked:
+            self._ctx.add_instruction(('i32.wrap_i64',))
+        else:
+            wide = self._scratch_local('$wide', WASMType('i64'))
+            self._ctx.add_instruction(('local.tee', wide))
+            self._ctx.add_instruction(('local.get', wide))
+            self._ctx.add_instruction(('i32.wrap_i64',))
+            self._ctx.add_instruction(('i64.extend_i32_s',))
+            self._ctx.add_instruction(('i64.ne',))
+            self._emit_trap_if()
+            self._ctx.add_instruction(('local.get', wide))
+            self._ctx.add_instruction(('i32.wrap_i64',))
+
+    def _emit_checked_arith(self, op: str):
+        # Both operands are on the stack, trap (and fall back to Python) if the result overflows
+        ty = self._int_type
+        lhs = self._scratch_local(f'$lhs_{ty}', ty)
+        rhs = self._scratch_local(f'$rhs_{ty}', ty)
+        self._ctx.add_instruction(('local.set', rhs))
+        self._ctx.add_instruction(('local.set', lhs))
+
+        if op in ('add', 'sub'):
+            # Overflow iff the sign of the result differs from both operands (add), or from
+            # the left operand while the operands differ in sign (sub)
+            res = self._scratch_local(f'$res_{ty}', ty)
+            self._ctx.add_instruction(('local.get', lhs))
+            self._ctx.add_instruction(('local.get', rhs))
+            self._ctx.add_instruction((f'{ty}.{op}',))
+            self._ctx.add_instruction(('local.set', res))
+            self._ctx.add_instruction(('local.get', lhs))
+            self._ctx.add_instruction(('local.get', res if op == 'add' else rhs))
+            self._ctx.add_instruction((f'{ty}.xor',))
+            self._ctx.add_instruction(('local.get', rhs if op == 'add' else lhs))
+            self._ctx.add_instruction(('local.get', res))
+            self._ctx.add_instruction((f'{ty}.xor',))
+            self._ctx.add_instruction((f'{ty}.and',))
+            self._ctx.add_instruction((f'{ty}.const', 0))
+            self._ctx.add_instruction((f'{ty}.lt_s',))
+            self._emit_trap_if()
+            self._ctx.add_instruction(('local.get', res))
+        elif ty == 'i32':
+            # Multiply in 64 bits and check the product fits
+            wide = self._scratch_local('$wide', WASMType('i64'))
+            self._ctx.add_instruction(('local.get', lhs))
+            self._ctx.add_instruction(('i64.extend_i32_s',))
+            self._ctx.add_instruction(('local.get', rhs))
+            self._ctx.add_instruction(('i64.extend_i32_s',))
+            self._ctx.add_instruction(('i64.mul',))
+            self._ctx.add_instruction(('local.set', wide))
+            self._ctx.add_instruction(('local.get', wide))
+            self._emit_int_convert(WASMType('i64'), WASMType('i32'))
+        else:
+            # Products of operands within 32 bits can not overflow, only check the others by dividing back.
+            # i64.div_s traps by itself for the one remaining case, -1 * -2 ** 63
+            for operand in (lhs, rhs):
+                self._ctx.add_instruction(('local.get', operand))
+                self._ctx.add_instruction(('i64.const', 2 ** 31))
+                self._ctx.add_instruction(('i64.add',))
+            self._ctx.add_instruction(('i64.or',))
+            self._ctx.add_instruction(('i64.const', 2 ** 32 - 1))
+            self._ctx.add_instruction(('i64.gt_u',))
+            self._ctx.add_instruction(('if', 'emptyblock'))
+            self._ctx.add_instruction(('local.get', lhs))
+            self._ctx.add_instruction(('i64.eqz',))
+            self._ctx.add_instruction(('i32.eqz',))
+            self._ctx.add_instruction(('if', 'emptyblock'))
+            self._ctx.add_instruction(('local.get', lhs))
+            self._ctx.add_instruction(('local.get', rhs))
+            self._ctx.add_instruction(('i64.mul',))
+            self._ctx.add_instruction(('local.get', lhs))
+            self._ctx.add_instruction(('i64.div_s',))
+            self._ctx.add_instruction(('local.get', rhs))
+            self._ctx.add_instruction(('i64.ne',))
+            self._emit_trap_if()
+            self._ctx.add_instruction(('end',))
+            self._ctx.add_instruction(('end',))
+            self._ctx.add_instruction(('local.get', lhs))
+            self._ctx.add_instruction(('local.get', rhs))
+            self._ctx.add_instruction(('i64.mul',))
 
     def _dump_ctx(self):
         print(f'================Function {self._ctx.func_name}================')
         self._ctx.dump_locals()
         self._ctx.dump_instructions()
 
-    def build(self):
-        self._builder.build()
-
-    def get_bytes(self):
-        return self._builder.get_bytes()
+    def build(self, func_name: str):
+        if func_name in self._prebuilt:
+            return
+        self._builders[func_name].build()
+
+    def get_bytes(self, func_name: str):
+        if func_name in self._prebuilt:
+            return self._prebuilt[func_name]
+        return self._builders[func_name].get_bytes()
+
+    def add_prebuilt_function(self, func_name: str, signature: FunctionSignature, buf: bytes):
+        if func_name in self._func_signatures:
+            raise RuntimeError(f'Function redefinition: {func_name}')
+        self._func_signatures[func_name] = signature
+        self._prebuilt[func_name] = buf
+
+    def query_signature(self, func_name: str) -> Optional[FunctionSignature]:
+        return self._func_signatures.get(func_name)
+
+    def query_signatures(self) -> dict[str, FunctionSignature]:
+        return self._func_signatures
+
+    def query_inline_candidates(self) -> dict[str, str]:
+        # func_name => dump of the body, for everything small enough to be inlined into new functions
+        return {func_name: ast.dump(node) for func_name, node in self._func_asts.items()
+                if 0 < self._instruction_counts[func_name] <= self.inline_threshold}
+
+    def query_instruction_count(self, func_name: str) -> Optional[int]:
+        return self._instruction_counts.get(func_name)
+
+    def query_local_count(self, func_name: str) -> Optional[int]:
+        return self._local_counts.get(func_name)
+
+    def build_map_driver(self, func_name: str) -> bytes:
+        # A loop calling func_name once per element of the arrays placed in linear memory,
+        # so that a whole batch of calls costs a single host => wasm transition
+        signature = self._func_signatures[func_name]
+        if any(element_pytype(param) is not None for param in signature.params):
+            raise RuntimeError(f'{func_name}.map() does not support buffer parameters')
+        i32 = WASMType('i32')
+
+        params = [(f'in_{i}', i32) for i in range(len(signature.params))]
+        params.append(('out', i32))
+        params.append(('n', i32))
+
+        builder = Builder()
+        builder.import_memory('env', 'memory')
+        int_type = signature.int_type
+        builder.add_imported_function(func_name, [pytype_to_wasmtype(param, int_type) for param in signature.params],
+                                      pytype_to_wasmtype(signature.return_type, int_type), 'jit', func_name)
+
+        ctx = FunctionContext(func_name=f'{func_name}$map', is_export=True, return_type=None, params=params)
+        counter = ctx.new_local('i', i32)
+
+        def emit_address(ptr: int, element_size: int):
+            ctx.add_instruction(('local.get', ptr))
+            ctx.add_instruction(('local.get', counter))
+            if element_size > 1:
+                ctx.add_instruction(('i32.const', element_size))
+                ctx.add_instruction(('i32.mul',))
+            ctx.add_instruction(('i32.add',))
+
+        ctx.add_instruction(('block', 'emptyblock'))
+        ctx.add_instruction(('loop', 'emptyblock'))
+        ctx.add_instruction(('local.get', counter))
+        ctx.add_instruction(('local.get', ctx.get_local_index('n')))
+        ctx.add_instruction(('i32.ge_s',))
+        ctx.add_instruction(('br_if', 1))
+
+        has_result = signature.return_type is not None and signature.return_type != 'None'
+        if has_result:
+            emit_address(ctx.get_local_index('out'), element_type(signature.return_type, int_type)[1])
+
+        for i, param in enumerate(signature.params):
+            _, element_size, align, load_instr, _ = element_type(param, int_type)
+            emit_address(ctx.get_local_index(f'in_{i}'), element_size)
+            ctx.add_instruction((load_instr, align, 0))
+
+        ctx.add_instruction(('call', func_name))
+
+        if has_result:
+            _, _, align, _, store_instr = element_type(signature.return_type, int_type)
+            ctx.add_instruction((store_instr, align, 0))
+
+        ctx.add_instruction(('local.get', counter))
+        ctx.add_instruction(('i32.const', 1))
+        ctx.add_instruction(('i32.add',))
+        ctx.add_instruction(('local.set', counter))
+        ctx.add_instruction(('br', 0))
+        ctx.add_instruction(('end',))
+        ctx.add_instruction(('end',))
+
+        builder.add_function(ctx)
+        builder.build()
+        return builder.get_bytes()
 
     def visit(self, node: ast.AST):
         fn = f'visit_{type(node).__name__}'
@@ -39,96 +255,127 @@ class WASMCodeGen:
         else:
             raise NotImplementedError(ast.dump(node))
 
-    def infer(self, node: ast.AST):
-        fn = f'infer_{type(node).__name__}'
-        if hasattr(self, fn):
-            return getattr(self, fn)(node)
-        else:
-            raise NotImplementedError(ast.dump(node))
-
     def visit_FuncDef(self, node: FuncDef):
         if self._ctx is not None:
             raise RuntimeError('Function definition inside function is not allowed')
         if node.func_name in self._func_signatures:
             raise RuntimeError(f'Function redefinition: {node.func_name}')
 
+        self._int_type = WASMType(node.int_type)
+        self._checked = node.checked
+        self._opt_level = node.opt_level
+
         params: list[str] = []
         wasm_params: list[tuple[str, WASMType]] = []
         for var in node.params:
             params.append(var.type)
-            wasm_params.append((var.id, pytype_to_wasmtype(var.type)))
+            wasm_params.append((var.id, self._wasmtype(var.type)))
+            if element_pytype(var.type) is not None:
+                # Buffers are passed as (pointer, length)
+                wasm_params.append((f'{var.id}$len', WASMType('i32')))
 
-        self._func_signatures[node.func_name] = FunctionSignature(params, node.return_type)
+        self._func_signatures[node.func_name] = FunctionSignature(params, node.return_type, node.int_type)
 
+        self._builder = Builder()
         self._ctx = FunctionContext(func_name=node.func_name,
                                     is_export=True,
-                                    return_type=pytype_to_wasmtype(node.return_type),
+                                    return_type=self._wasmtype(node.return_type),
                                     params=wasm_params)
 
-        for stmt in node.stmts:
-            self.visit(stmt)
+        if len(wasm_params) > len(node.params):
+            self._builder.import_memory('env', 'memory')
+
+        # Self tail calls reassign the parameters and branch back to a loop around the body
+        tail_calls = node.opt_level >= 2 and any(
+            isinstance(n, Return) and isinstance(n.value, FuncCall) and n.value.func_name == node.func_name
+            for n in ast.walk(node))
+
+        try:
+            if tail_calls:
+                self._ctx.enter_block('body')
+                self._ctx.add_instruction(('loop', 'emptyblock'))
+            for stmt in node.stmts:
+                self.visit(stmt)
+            if tail_calls:
+                self._ctx.add_instruction(('end',))
+                self._ctx.exit_block('body')
+            if self._ctx.return_type is not None and \
+                    (not self._ctx.instructions or self._ctx.instructions[-1][0] != 'return'):
+                # Every path returned inside the last if/else or the tail call loop, the end is never reached
+                self._ctx.add_instruction(('unreachable',))
+        except Exception:
+            # Leave the code generator usable for the next function
+            del self._func_signatures[node.func_name]
+            self._builder = None
+            self._ctx = None
+            raise
+
+        if node.opt_level >= 2:
+            self._ctx.instructions = optimize(self._ctx.instructions)
 
         if DEBUG:
             self._dump_ctx()
 
-        self._builder.add_function(self._ctx)
+        self._instruction_counts[node.func_name] = len(self._ctx.instructions)
+        self._local_counts[node.func_name] = self._builder.add_function(self._ctx, reuse_locals=node.opt_level >= 2)
+        self._builders[node.func_name] = self._builder
+        self._func_asts[node.func_name] = node
+        self._builder = None
         self._ctx = None
 
-    def infer_FuncCall(self, node: FuncCall):
-        if node.func_name in ('int', 'float', 'bool'):
-            return node.func_name
-        elif node.func_name == 'print':
-            return None
-        else:
-            if node.func_name in self._func_signatures:
-                signature = self._func_signatures[node.func_name]
-            elif node.func_name in self._callback_pool.callbacks:
-                signature = self._callback_pool.query_py_signature(node.func_name)
-            else:
-                raise RuntimeError(f'Undefined function: {node.func_name}')
-
-            if signature.return_type == 'None':
-                return None
-            else:
-                return signature.return_type
-
     def visit_FuncCall(self, node: FuncCall):
         if node.func_name == 'int':
             # int()
-            input_ty = self.infer(node.args[0])
+            input_ty = node.args[0].type
             self.visit(node.args[0])
-            if input_ty == 'int' or input_ty == 'bool':
-                # Convert int/bool to int
+            if input_ty == 'int':
                 pass
+            elif input_ty == 'bool':
+                # Convert bool to int
+                if self._int_type == 'i64':
+                    self._ctx.add_instruction(('i64.extend_i32_u',))
             elif input_ty == 'float':
                 # Convert float to int
-                self._ctx.add_instruction(('i32.trunc_f64_s',))
+                self._ctx.add_instruction((f'{self._int_type}.trunc_f64_s',))
         elif node.func_name == 'float':
             # float()
-            input_ty = self.infer(node.args[0])
+            input_ty = node.args[0].type
             self.visit(node.args[0])
             if input_ty == 'float':
                 # Convert float to float, no-op
                 pass
-            elif input_ty == 'int' or input_ty == 'bool':
+            elif input_ty == 'int':
                 # Convert int to float
+                self._ctx.add_instruction((f'f64.convert_{self._int_type}_s',))
+            elif input_ty == 'bool':
                 self._ctx.add_instruction(('f64.convert_i32_s',))
         elif node.func_name == 'bool':
             # bool()
-            input_ty = self.infer(node.args[0])
+            input_ty = node.args[0].type
             self.visit(node.args[0])
-            if input_ty == 'int' or input_ty == 'bool':
+            if input_ty == 'int' and self._int_type == 'i64':
+                self._ctx.add_instruction(('i64.const', 0))
+                self._ctx.add_instruction(('i64.ne',))
+            elif input_ty == 'int' or input_ty == 'bool':
                 pass
             elif input_ty == 'float':
                 # Convert float to bool
                 # if value != 0.0, it should be True
                 self._ctx.add_instruction(('f64.const', 0.0))
                 self._ctx.add_instruction(('f64.ne',))
+        elif node.func_name == 'len':
+            # len() of a buffer parameter
+            self._ctx.add_instruction(('local.get', self._ctx.get_local_index(f'{node.args[0].id}$len')))
+            self._emit_int_convert(WASMType('i32'), self._int_type)
         elif node.func_name == 'print':
             # Call imported JavaScript function (print_int, print_float, print_bool)
-            input_ty = self.infer(node.args[0])
+            input_ty = node.args[0].type
             self.visit(node.args[0])
-            if input_ty == 'int':
+            if input_ty == 'int' and self._int_type == 'i64':
+                if not self._builder.is_function_imported('print_int64'):
+                    self._builder.add_imported_function('print_int64', [WASMType('i64')], None, 'js', 'print_int64')
+                self._ctx.add_instruction(('call', 'print_int64'))
+            elif input_ty == 'int':
                 if not self._builder.is_function_imported('print_int'):
                     self._builder.add_imported_function('print_int', [WASMType('i32')], None, 'js', 'print_int')
                 self._ctx.add_instruction(('call', 'print_int'))
@@ -141,29 +388,85 @@ class WASMCodeGen:
                     self._builder.add_imported_function('print_bool', [WASMType('i32')], None, 'js', 'print_bool')
                 self._ctx.add_instruction(('call', 'print_bool'))
         else:
+            callee = self._inline_candidate(node.func_name)
+            if callee is not None:
+                self._emit_inlined_call(node, callee)
+                return
+
             if node.func_name in self._func_signatures:
                 # Custom functions
                 signature = self._func_signatures[node.func_name]
+                if node.func_name != self._ctx.func_name and not self._builder.is_function_imported(node.func_name):
+                    self._add_jit_imported_function(node.func_name, signature)
+                callee_int_type = WASMType(signature.int_type)
             elif node.func_name in self._callback_pool.callbacks:
                 # Callback functions
-                if not self._builder.is_function_imported(node.func_name):
-                    wasm_sig = self._callback_pool.query_wasm_signature(node.func_name)
-                    self._add_callback_imported_function(node.func_name, wasm_sig)
                 signature = self._callback_pool.query_py_signature(node.func_name)
+                if not self._builder.is_function_imported(node.func_name):
+                    self._add_callback_imported_function(node.func_name, signature)
+                callee_int_type = self._int_type
             else:
                 raise RuntimeError(f'Undefined function: {node.func_name}')
 
             for i, arg in enumerate(node.args):
-                arg_ty = self.infer(arg)
+                arg_ty = arg.type
                 param_ty = signature.params[i]
                 if arg_ty != param_ty:
                     raise RuntimeError(f'Function parameter type mismatch: \n'
                                        f'parameter type {param_ty} with argument type {arg_ty}')
                 self.visit(node.args[i])
+                if arg_ty == 'int':
+                    self._emit_int_convert(self._int_type, callee_int_type)
             self._ctx.add_instruction(('call', node.func_name))
+            if signature.return_type == 'int':
+                self._emit_int_convert(callee_int_type, self._int_type)
 
-    def infer_Var(self, node: Var):
-        return node.type
+    def _inline_candidate(self, func_name: str) -> Optional[FuncDef]:
+        callee = self._func_asts.get(func_name)
+        if self._opt_level < 2 or callee is None or \
+                not 0 < self._instruction_counts[func_name] <= self.inline_threshold:
+            return None
+        if callee.int_type != self._int_type or callee.checked != self._checked:
+            return None
+        if any(element_pytype(param.type) is not None for param in callee.params):
+            return None
+        if self._wasmtype(callee.return_type) is not None and \
+                (not callee.stmts or not isinstance(callee.stmts[-1], Return)):
+            # The value has to be on the stack at the end of the inlined block
+            return None
+        if any(isinstance(n, FuncCall) and n.func_name == func_name for n in ast.walk(callee)):
+            return None
+        return callee
+
+    def _emit_inlined_call(self, node: FuncCall, callee: FuncDef):
+        # The body is generated into a block of the caller, its locals are renamed to fresh locals of
+        # the caller and its returns branch to the end of the block
+        self._inline_count += 1
+        prefix = f'{callee.func_name}$inline{self._inline_count}$'
+        params = clone(callee.params)
+        stmts = clone(callee.stmts)
+        for stmt in params + stmts:
+            for n in ast.walk(stmt):
+                if isinstance(n, Var):
+                    n.id = prefix + n.id
+
+        for arg in node.args:
+            self.visit(arg)
+        param_indices = [self._ctx.new_local(param.id, self._wasmtype(param.type)) for param in params]
+        for index in reversed(param_indices):
+            self._ctx.add_instruction(('local.set', index))
+
+        self._ctx.enter_block('inline')
+        self._ctx.add_instruction(('block', self._wasmtype(callee.return_type) or 'emptyblock'))
+        for i, stmt in enumerate(stmts):
+            if i == len(stmts) - 1 and isinstance(stmt, Return):
+                # Falls through to the end of the block
+                if stmt.value is not None:
+                    self.visit(stmt.value)
+            else:
+                self.visit(stmt)
+        self._ctx.add_instruction(('end',))
+        self._ctx.exit_block('inline')
 
     def visit_Var(self, node: Var):
         local_index = self._ctx.get_local_index(node.id)
@@ -171,46 +474,80 @@ class WASMCodeGen:
             raise RuntimeError(f'Unresolved local variable: {node.id}')
 
         self._ctx.add_instruction(('local.get', local_index))
-
-    def infer_IntLiteral(self, node: IntLiteral):
-        return 'int'
+        if element_pytype(node.type) is not None:
+            # Buffer passed on to another function, along with its length
+            self._ctx.add_instruction(('local.get', self._ctx.get_local_index(f'{node.id}$len')))
+
+    def _emit_element_address(self, node: Subscript):
+        element_size = element_type(node.type, self._int_type)[1]
+        ptr = self._ctx.get_local_index(node.value.id)
+        length = self._ctx.get_local_index(f'{node.value.id}$len')
+
+        # Scratch local for the index, nested subscripts are evaluated before it is written
+        index = self._scratch_local(f'$index_{self._int_type}', self._int_type)
+
+        # Trap on out of bounds access (negative indices included, by comparing unsigned)
+        self.visit(node.index)
+        self._ctx.add_instruction(('local.tee', index))
+        self._ctx.add_instruction(('local.get', length))
+        if self._int_type == 'i64':
+            self._ctx.add_instruction(('i64.extend_i32_u',))
+        self._ctx.add_instruction((f'{self._int_type}.ge_u',))
+        self._emit_trap_if()
+
+        self._ctx.add_instruction(('local.get', ptr))
+        self._ctx.add_instruction(('local.get', index))
+        if self._int_type == 'i64':
+            self._ctx.add_instruction(('i32.wrap_i64',))
+        if element_size > 1:
+            self._ctx.add_instruction(('i32.const', element_size))
+            self._ctx.add_instruction(('i32.mul',))
+        self._ctx.add_instruction(('i32.add',))
+
+    def visit_Subscript(self, node: Subscript):
+        _, _, align, load_instr, _ = element_type(node.type, self._int_type)
+        self._emit_element_address(node)
+        self._ctx.add_instruction((load_instr, align, 0))
 
     def visit_IntLiteral(self, node: IntLiteral):
-        self._ctx.add_instruction(('i32.const', node.value))
-
-    def infer_FloatLiteral(self, node: FloatLiteral):
-        return 'float'
+        min_value, max_value = INT_RANGES[self._int_type]
+        if not min_value <= node.value <= max_value:
+            raise RuntimeError(f'Integer literal {node.value} out of range for {self._int_type}')
+        self._ctx.add_instruction((f'{self._int_type}.const', node.value))
 
     def visit_FloatLiteral(self, node: FloatLiteral):
         self._ctx.add_instruction(('f64.const', node.value))
 
-    def infer_BoolLiteral(self, node: BoolLiteral):
-        return 'bool'
-
     def visit_BoolLiteral(self, node: BoolLiteral):
         self._ctx.add_instruction(('i32.const', int(node.value)))
 
     def visit_Assign(self, node: Assign):
+        if isinstance(node.target, Subscript):
+            _, _, align, _, store_instr = element_type(node.target.type, self._int_type)
+            self._emit_element_address(node.target)
+            self.visit(node.value)
+            self._ctx.add_instruction((store_instr, align, 0))
+            return
+
         target_name = node.target.id
         local_index = self._ctx.get_local_index(target_name)
         if local_index == -1:
-            local_index = self._ctx.new_local(target_name, pytype_to_wasmtype(node.type))
+            local_index = self._ctx.new_local(target_name, self._wasmtype(node.type))
 
         self.visit(node.value)
         self._ctx.add_instruction(('local.set', local_index))
 
-    def infer_Expr(self, node: Expr):
-        return self.infer(node)
-
     def visit_Expr(self, node: Expr):
         self.visit(node.value)
-
-    def infer_Compare(self, node: Compare):
-        return 'bool'
+        # The value of an expression statement is discarded, buffers push their length as well
+        ty = node.value.type
+        if ty is not None and ty != 'None':
+            for _ in range(2 if element_pytype(ty) is not None else 1):
+                self._ctx.add_instruction(('drop',))
 
     def visit_Compare(self, node: Compare):
-        ty = self.infer(node.left)
-        wasmty = pytype_to_wasmtype(ty)
+        ty = node.left.type
+        wasmty = self._wasmtype(ty)
 
         self.visit(node.left)
         self.visit(node.comparator)
@@ -258,13 +595,9 @@ class WASMCodeGen:
         self._ctx.add_instruction(('end',))
         self._ctx.exit_block('if')
 
-    def infer_BinOp(self, node: BinOp):
-        ty = self.infer(node.left)
-        return ty
-
     def visit_BinOp(self, node: BinOp):
-        left_ty = self.infer(node)
-        left_wasm_ty = pytype_to_wasmtype(left_ty)
+        left_ty = node.type
+        left_wasm_ty = self._wasmtype(left_ty)
 
         op = ''
 
@@ -275,31 +608,97 @@ class WASMCodeGen:
         elif node.op == ast.Mult:
             op = 'mul'
         elif node.op == ast.Div:
-            if left_wasm_ty == 'i32':
+            if left_ty == 'int':
                 op = 'div_s'
             elif left_wasm_ty == 'f64':
                 op = 'div'
         elif node.op == ast.Mod:
             op = 'rem_s'
 
+        if self._opt_level >= 2 and left_ty == 'int' and isinstance(node.right, IntLiteral) and \
+                self._emit_strength_reduced(node.left, op, node.right.value):
+            return
+
         self.visit(node.left)
         self.visit(node.right)
 
+        if self._checked and left_ty == 'int' and op in ('add', 'sub', 'mul'):
+            self._emit_checked_arith(op)
+            return
+
         instr = f'{left_wasm_ty}.{op}'
         self._ctx.add_instruction((instr,))
 
-    def infer_UnaryOp(self, node: UnaryOp):
-        ty = self.infer(node.right)
-        return ty
+    def _emit_strength_reduced(self, left: ast.AST, op: str, value: int) -> bool:
+        # Multiplication, division and remainder by constants as shifts and masks, with the exact results of
+        # i32/i64.mul, div_s and rem_s (truncating division, the remainder has the sign of the dividend).
+        # Returns False without emitting anything if there is no cheaper sequence
+        ty = self._int_type
+        bits = 64 if ty == 'i64' else 32
+        magnitude = abs(value)
+        shift = magnitude.bit_length() - 1
+        if op == 'mul' and not self._checked and value > 1:
+            if value == 1 << shift:
+                self.visit(left)
+                self._ctx.add_instruction((f'{ty}.const', shift))
+                self._ctx.add_instruction((f'{ty}.shl',))
+                return True
+            for k, combine in ((shift, 'add'), (shift + 1, 'sub')):
+                # x * (2 ** k + 1) = (x << k) + x, x * (2 ** k - 1) = (x << k) - x
+                if value == (1 << k) + (1 if combine == 'add' else -1):
+                    x = self._scratch_local(f'$sr_x_{ty}', ty)
+                    self.visit(left)
+                    self._ctx.add_instruction(('local.tee', x))
+                    self._ctx.add_instruction((f'{ty}.const', k))
+                    self._ctx.add_instruction((f'{ty}.shl',))
+                    self._ctx.add_instruction(('local.get', x))
+                    self._ctx.add_instruction((f'{ty}.{combine}',))
+                    return True
+        elif op == 'div_s' and value > 1 and value == 1 << shift:
+            # Shifting rounds towards -inf, bias negative dividends by 2 ** k - 1 to round towards zero
+            x = self._scratch_local(f'$sr_x_{ty}', ty)
+            self.visit(left)
+            self._ctx.add_instruction(('local.tee', x))
+            self._ctx.add_instruction(('local.get', x))
+            self._ctx.add_instruction((f'{ty}.const', bits - 1))
+            self._ctx.add_instruction((f'{ty}.shr_s',))
+            self._ctx.add_instruction((f'{ty}.const', bits - shift))
+            self._ctx.add_instruction((f'{ty}.shr_u',))
+            self._ctx.add_instruction((f'{ty}.add',))
+            self._ctx.add_instruction((f'{ty}.const', shift))
+            self._ctx.add_instruction((f'{ty}.shr_s',))
+            return True
+        elif op == 'rem_s' and magnitude > 1 and magnitude == 1 << shift:
+            # rem_s(x, -c) == rem_s(x, c): ((x + bias) & (c - 1)) - bias, with the bias of the division
+            x = self._scratch_local(f'$sr_x_{ty}', ty)
+            bias = self._scratch_local(f'$sr_bias_{ty}', ty)
+            self.visit(left)
+            self._ctx.add_instruction(('local.tee', x))
+            self._ctx.add_instruction((f'{ty}.const', bits - 1))
+            self._ctx.add_instruction((f'{ty}.shr_s',))
+            self._ctx.add_instruction((f'{ty}.const', bits - shift))
+            self._ctx.add_instruction((f'{ty}.shr_u',))
+            self._ctx.add_instruction(('local.tee', bias))
+            self._ctx.add_instruction(('local.get', x))
+            self._ctx.add_instruction((f'{ty}.add',))
+            self._ctx.add_instruction((f'{ty}.const', magnitude - 1))
+            self._ctx.add_instruction((f'{ty}.and',))
+            self._ctx.add_instruction(('local.get', bias))
+            self._ctx.add_instruction((f'{ty}.sub',))
+            return True
+        return False
 
     def visit_UnaryOp(self, node: UnaryOp):
-        ty = self.infer(node)
+        ty = node.type
 
         if node.op == ast.USub:
             if ty == 'int':
-                self._ctx.add_instruction(('i32.const', 0))
+                self._ctx.add_instruction((f'{self._int_type}.const', 0))
                 self.visit(node.right)
-                self._ctx.add_instruction(('i32.sub',))
+                if self._checked:
+                    self._emit_checked_arith('sub')
+                else:
+                    self._ctx.add_instruction((f'{self._int_type}.sub',))
             elif ty == 'float':
                 self.visit(node.right)
                 self._ctx.add_instruction(('f64.neg',))
@@ -309,89 +708,148 @@ class WASMCodeGen:
                 self._ctx.add_instruction(('i32.eqz',))
 
     def visit_While(self, node: While):
+        # Rotated into a test at the bottom of the loop, guarded by a test in front of it
+        infinite = isinstance(node.expr, BoolLiteral) and node.expr.value
+
         self._ctx.enter_block('while')
         self._ctx.add_instruction(('block', 'emptyblock'))
+        if not infinite:
+            self.visit(node.expr)
+            self._ctx.add_instruction(('i32.eqz',))
+            self._ctx.add_instruction(('br_if', 0))  # skip the loop
         self._ctx.add_instruction(('loop', 'emptyblock'))
-
-        # Test the boolean expression
-        self.visit(node.expr)
-
-        # If the boolean expression is false, jump out of the block block
-        self._ctx.add_instruction(('i32.eqz',))
-        self._ctx.add_instruction(('br_if', 1))
+        self._ctx.add_instruction(('block', 'emptyblock'))  # continue branches to its end
 
         for stmt in node.stmts:
             self.visit(stmt)
 
-        # jump to the beginning of loop block
-        self._ctx.add_instruction(('br', 0))
-
+        self._ctx.add_instruction(('end',))  # End of continue block
+        if infinite:
+            self._ctx.add_instruction(('br', 0))
+        else:
+            self.visit(node.expr)
+            self._ctx.add_instruction(('br_if', 0))  # branch to the beginning of loop block
         self._ctx.add_instruction(('end',))  # End of loop block
         self._ctx.add_instruction(('end',))  # End of block block
         self._ctx.exit_block('while')
 
-    def visit_For(self, node: For):
-        loopvar_ty = self.infer(node.loopvar)
-        begin_ty = self.infer(node.begin)
-        end_ty = self.infer(node.end)
-        step_ty = self.infer(node.step)
+    def _emit_range_test(self, counter: int, end: tuple, step: tuple, step_sign: int, wasmty: WASMType,
+                         inverse: bool):
+        # Pushes whether counter is still inside the range (or outside of it, if inverse)
+        ops = ('lt_s', 'gt_s') if not inverse else ('ge_s', 'le_s')
+        if step_sign != 0:
+            self._ctx.add_instruction(('local.get', counter))
+            self._ctx.add_instruction(end)
+            self._ctx.add_instruction((f'{wasmty}.{ops[0] if step_sign > 0 else ops[1]}',))
+            return
+
+        # The direction of the step is only known at runtime
+        for op in ops:
+            self._ctx.add_instruction(('local.get', counter))
+            self._ctx.add_instruction(end)
+            self._ctx.add_instruction((f'{wasmty}.{op}',))
+        self._ctx.add_instruction(step)
+        self._ctx.add_instruction((f'{wasmty}.const', 0))
+        self._ctx.add_instruction((f'{wasmty}.gt_s',))
+        self._ctx.add_instruction(('select',))
 
-        loopvar_wasmty = pytype_to_wasmtype(loopvar_ty)
+    def visit_For(self, node: For):
+        loopvar_wasmty = self._wasmtype(node.loopvar.type)
 
-        begin_stub = self._ctx.new_stub(pytype_to_wasmtype(begin_ty))
-        end_stub = self._ctx.new_stub(pytype_to_wasmtype(end_ty))
-        step_stub = self._ctx.new_stub(pytype_to_wasmtype(step_ty))
+        body_assigned: set[str] = set()
+        assigned_names(node.stmts, body_assigned)
+        assigned = body_assigned | {node.loopvar.id}
 
+        # Literals and variables the loop does not assign are used in place, anything else is evaluated
+        # once into a stub like range() does
+        operands = []
+        stubs = []
         self.visit(node.begin)
-        self.visit(node.end)
-        self.visit(node.step)
-        self._ctx.add_instruction(('local.set', step_stub))
-        self._ctx.add_instruction(('local.set', end_stub))
-        self._ctx.add_instruction(('local.set', begin_stub))
+        for expr in (node.end, node.step):
+            if isinstance(expr, IntLiteral):
+                operands.append((f'{loopvar_wasmty}.const', expr.value))
+            elif isinstance(expr, Var) and expr.id not in assigned:
+                operands.append(('local.get', self._ctx.get_local_index(expr.id)))
+            else:
+                stub = self._ctx.new_stub(loopvar_wasmty)
+                self.visit(expr)
+                stubs.append(stub)
+                operands.append(('local.get', stub))
+        end, step = operands
+        for stub in reversed(stubs):
+            self._ctx.add_instruction(('local.set', stub))
 
         loopvar = self._ctx.get_local_index(node.loopvar.id)
         if loopvar == -1:
             loopvar = self._ctx.new_local(node.loopvar.id, loopvar_wasmty)
+        # Assignments to the loop variable in the body must not change the iteration, count in a stub then
+        counter = self._ctx.new_stub(loopvar_wasmty) if node.loopvar.id in body_assigned else loopvar
+        self._ctx.add_instruction(('local.set', counter))
+
+        if isinstance(node.step, IntLiteral):
+            if node.step.value == 0:
+                raise RuntimeError('range() arg 3 must not be zero')
+            step_sign = 1 if node.step.value > 0 else -1
+        else:
+            step_sign = 0
+            self._ctx.add_instruction(step)
+            self._ctx.add_instruction((f'{loopvar_wasmty}.eqz',))
+            self._emit_trap_if()
 
         self._ctx.enter_block('for')
-
-        self._ctx.add_instruction(('local.get', begin_stub))
-        self._ctx.add_instruction(('local.set', loopvar))
         self._ctx.add_instruction(('block', 'emptyblock'))
+        self._emit_range_test(counter, end, step, step_sign, loopvar_wasmty, inverse=True)
+        self._ctx.add_instruction(('br_if', 0))  # empty range, skip the loop
         self._ctx.add_instruction(('loop', 'emptyblock'))
-        self._ctx.add_instruction(('local.get', loopvar))
-        self._ctx.add_instruction(('local.get', end_stub))
-
-        ge_op = 'ge' if loopvar_wasmty == 'f64' else 'ge_s'
-        self._ctx.add_instruction((f'{loopvar_wasmty}.{ge_op}',))
-        self._ctx.add_instruction(('br_if', 1))  # branch to end of block block (break)
+        self._ctx.add_instruction(('block', 'emptyblock'))  # continue branches to its end
+        if counter != loopvar:
+            self._ctx.add_instruction(('local.get', counter))
+            self._ctx.add_instruction(('local.set', loopvar))
 
         for stmt in node.stmts:
             self.visit(stmt)
 
-        self._ctx.add_instruction(('local.get', loopvar))
-        self._ctx.add_instruction(('local.get', step_stub))
+        self._ctx.add_instruction(('end',))  # End of continue block
+        self._ctx.add_instruction(('local.get', counter))
+        self._ctx.add_instruction(step)
         self._ctx.add_instruction((f'{loopvar_wasmty}.add',))
-        self._ctx.add_instruction(('local.set', loopvar))
-        self._ctx.add_instruction(('br', 0))  # branch to the beginning of loop block
-
+        self._ctx.add_instruction(('local.set', counter))
+        self._emit_range_test(counter, end, step, step_sign, loopvar_wasmty, inverse=False)
+        self._ctx.add_instruction(('br_if', 0))  # branch to the beginning of loop block
         self._ctx.add_instruction(('end',))  # End of loop block
         self._ctx.add_instruction(('end',))  # End of block block
 
         self._ctx.exit_block('for')
 
     def visit_Continue(self, node: Continue):
-        loop_level = self._ctx.get_adjacent_loop_block_level()
-        self._ctx.add_instruction(('br', loop_level))
+        continue_level = self._ctx.get_adjacent_loop_block_level()
+        self._ctx.add_instruction(('br', continue_level))
 
     def visit_Break(self, node: Break):
-        block_level = self._ctx.get_adjacent_loop_block_level() + 1
+        block_level = self._ctx.get_adjacent_loop_block_level() + 2
         self._ctx.add_instruction(('br', block_level))
 
+    def _emit_self_tail_call(self, node: FuncCall, body_level: int):
+        for arg in node.args:
+            self.visit(arg)
+        for index in reversed(range(len(self._ctx.params))):
+            self._ctx.add_instruction(('local.set', index))
+        self._ctx.add_instruction(('br', body_level))
+
     def visit_Return(self, node: Return):
+        if isinstance(node.value, FuncCall) and node.value.func_name == self._ctx.func_name:
+            body_level = self._ctx.get_block_level('body')
+            if body_level >= 0 and self._ctx.get_block_level('inline') < 0:
+                self._emit_self_tail_call(node.value, body_level)
+                return
+
         if node.value is not None:
             self.visit(node.value)
-        self._ctx.add_instruction(('return',))
+        inline_level = self._ctx.get_block_level('inline')
+        if inline_level >= 0:
+            self._ctx.add_instruction(('br', inline_level))
+        else:
+            self._ctx.add_instruction(('return',))
 
     def visit_Pass(self, node: Pass):
         pass
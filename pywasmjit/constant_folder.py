@@ -0,0 +1,236 @@
+import math
+from typing import Optional
+
+from .ast import *
+from .utils import INT_RANGES
+
+
+def wrap_int(value: int, int_type: str) -> int:
+    # Two's complement wrap around, as done by the i32/i64 instructions
+    min_value, max_value = INT_RANGES[int_type]
+    return (value - min_value) % (max_value - min_value + 1) + min_value
+
+
+def div_trunc(x: int, y: int) -> int:
+    # i32.div_s / i64.div_s round towards zero
+    q = abs(x) // abs(y)
+    return q if (x < 0) == (y < 0) else -q
+
+
+def make_literal(value) -> ast.AST:
+    if isinstance(value, bool):
+        return BoolLiteral(value)
+    elif isinstance(value, int):
+        return IntLiteral(value)
+    else:
+        return FloatLiteral(value)
+
+
+def literal_value(node: ast.AST):
+    if isinstance(node, (IntLiteral, FloatLiteral, BoolLiteral)):
+        return node.value
+    return None
+
+
+COMPARE_OPS = {
+    ast.Eq: lambda x, y: x == y,
+    ast.NotEq: lambda x, y: x != y,
+    ast.Gt: lambda x, y: x > y,
+    ast.Lt: lambda x, y: x < y,
+    ast.GtE: lambda x, y: x >= y,
+    ast.LtE: lambda x, y: x <= y
+}
+
+
+class ConstantFolder:
+    # Folds operations on literals and propagates locals which are assigned a literal exactly once.
+    # Runs on the type checked AST, results follow the wasm semantics of the function's int type
+    # (wrap around, truncating division). Operations which would trap are left to trap at runtime.
+    __slots__ = ['_int_type', '_checked', '_assign_counts', '_constants']
+
+    def __init__(self):
+        self._int_type = 'i32'
+        self._checked = False
+        self._assign_counts: dict[str, int] = {}  # name => number of assignments in the function
+        self._constants: dict[str, ast.AST] = {}  # name => literal assigned to it
+
+    def visit(self, node: ast.AST):
+        fn = f'visit_{type(node).__name__}'
+        if hasattr(self, fn):
+            return getattr(self, fn)(node)
+        return node
+
+    def _count_assignments(self, stmts: list):
+        for stmt in stmts:
+            if isinstance(stmt, Assign) and isinstance(stmt.target, Var):
+                self._assign_counts[stmt.target.id] = self._assign_counts.get(stmt.target.id, 0) + 1
+            elif isinstance(stmt, For):
+                # Loop variables take more than one value
+                self._assign_counts[stmt.loopvar.id] = 2
+                self._count_assignments(stmt.stmts)
+            elif isinstance(stmt, While):
+                self._count_assignments(stmt.stmts)
+            elif isinstance(stmt, If):
+                self._count_assignments(stmt.stmts)
+                self._count_assignments(stmt.orelse)
+
+    def _fold_stmts(self, stmts: list) -> list:
+        folded = []
+        for stmt in stmts:
+            result = self.visit(stmt)
+            if isinstance(result, list):
+                folded.extend(result)
+            elif result is not None:
+                folded.append(result)
+        return folded
+
+    def _fold_int(self, value: int) -> Optional[ast.AST]:
+        wrapped = wrap_int(value, self._int_type)
+        if wrapped != value and self._checked:
+            # Would overflow, keep the operation so that it traps and falls back to Python
+            return None
+        return IntLiteral(wrapped)
+
+    def visit_FuncDef(self, node: FuncDef):
+        self._int_type = node.int_type
+        self._checked = node.checked
+        self._assign_counts = {param.id: 2 for param in node.params}
+        self._constants = {}
+        self._count_assignments(node.stmts)
+
+        node.stmts = self._fold_stmts(node.stmts)
+        return node
+
+    def visit_Var(self, node: Var):
+        if node.id in self._constants:
+            return make_literal(self._constants[node.id].value)
+        return node
+
+    def visit_Subscript(self, node: Subscript):
+        node.index = self.visit(node.index)
+        return node
+
+    def visit_FuncCall(self, node: FuncCall):
+        node.args = [self.visit(arg) for arg in node.args]
+        if node.func_name not in ('int', 'float', 'bool') or len(node.args) != 1:
+            return node
+
+        value = literal_value(node.args[0])
+        if value is None:
+            return node
+
+        if node.func_name == 'int':
+            if isinstance(value, float):
+                if math.isnan(value) or math.isinf(value):
+                    return node
+                value = math.trunc(value)
+                min_value, max_value = INT_RANGES[self._int_type]
+                if not min_value <= value <= max_value:
+                    # trunc_f64_s traps
+                    return node
+            return IntLiteral(int(value))
+        elif node.func_name == 'float':
+            return FloatLiteral(float(value))
+        else:
+            return BoolLiteral(bool(value))
+
+    def visit_BinOp(self, node: BinOp):
+        node.left = self.visit(node.left)
+        node.right = self.visit(node.right)
+        left = literal_value(node.left)
+        right = literal_value(node.right)
+        if left is None or right is None:
+            return node
+
+        if isinstance(left, float):
+            if node.op == ast.Add:
+                return FloatLiteral(left + right)
+            elif node.op == ast.Sub:
+                return FloatLiteral(left - right)
+            elif node.op == ast.Mult:
+                return FloatLiteral(left * right)
+            elif node.op == ast.Div and right != 0.0:
+                return FloatLiteral(left / right)
+            return node
+
+        if node.op == ast.Add:
+            return self._fold_int(left + right) or node
+        elif node.op == ast.Sub:
+            return self._fold_int(left - right) or node
+        elif node.op == ast.Mult:
+            return self._fold_int(left * right) or node
+        elif node.op == ast.Div:
+            if right == 0 or (right == -1 and left == INT_RANGES[self._int_type][0]):
+                # div_s traps
+                return node
+            return IntLiteral(div_trunc(left, right))
+        elif node.op == ast.Mod:
+            if right == 0:
+                return node
+            return IntLiteral(left - right * div_trunc(left, right))
+        return node
+
+    def visit_UnaryOp(self, node: UnaryOp):
+        node.right = self.visit(node.right)
+        value = literal_value(node.right)
+        if value is None:
+            return node
+
+        if node.op == ast.USub:
+            if isinstance(value, float):
+                return FloatLiteral(-value)
+            return self._fold_int(-value) or node
+        elif node.op == ast.Not:
+            return BoolLiteral(not value)
+        return node
+
+    def visit_Compare(self, node: Compare):
+        node.left = self.visit(node.left)
+        node.comparator = self.visit(node.comparator)
+        left = literal_value(node.left)
+        right = literal_value(node.comparator)
+        if left is None or right is None:
+            return node
+        return BoolLiteral(COMPARE_OPS[node.op.__class__](left, right))
+
+    def visit_Assign(self, node: Assign):
+        node.value = self.visit(node.value)
+        if isinstance(node.target, Subscript):
+            node.target = self.visit(node.target)
+        elif self._assign_counts.get(node.target.id) == 1 and literal_value(node.value) is not None:
+            # Every read of a local assigned only once happens after the assignment (or raises in Python)
+            self._constants[node.target.id] = node.value
+        return node
+
+    def visit_Expr(self, node: Expr):
+        node.value = self.visit(node.value)
+        return node
+
+    def visit_If(self, node: If):
+        node.expr = self.visit(node.expr)
+        node.stmts = self._fold_stmts(node.stmts)
+        node.orelse = self._fold_stmts(node.orelse)
+
+        condition = literal_value(node.expr)
+        if condition is None:
+            return node
+        return node.stmts if condition else node.orelse
+
+    def visit_While(self, node: While):
+        node.expr = self.visit(node.expr)
+        node.stmts = self._fold_stmts(node.stmts)
+        if literal_value(node.expr) is False:
+            return None
+        return node
+
+    def visit_For(self, node: For):
+        node.begin = self.visit(node.begin)
+        node.end = self.visit(node.end)
+        node.step = self.visit(node.step)
+        node.stmts = self._fold_stmts(node.stmts)
+        return node
+
+    def visit_Return(self, node: Return):
+        if node.value is not None:
+            node.value = self.visit(node.value)
+        return node
@@ -0,0 +1,101 @@
+from .ast import *
+
+
+def terminates(stmts: list) -> bool:
+    # Whether the statements never fall through to the statement following them
+    if not stmts:
+        return False
+    last = stmts[-1]
+    if isinstance(last, (Return, Break, Continue)):
+        return True
+    if isinstance(last, If):
+        return terminates(last.stmts) and terminates(last.orelse)
+    return False
+
+
+class DeadCodeEliminator:
+    # Removes statements which never run (after return, break, continue or an if/else leaving in both branches)
+    # and statements without effect: pure expression statements, and assignments of pure values to locals
+    # which are never read. Assignments are removed until none is left, one removal may make another local unread.
+    __slots__ = ['_reads']
+
+    def __init__(self):
+        self._reads: set[str] = set()  # names of the locals read in the function
+
+    def visit(self, node: ast.AST):
+        if isinstance(node, FuncDef):
+            node.stmts = self._prune(node.stmts)
+            while True:
+                self._reads = set()
+                self._collect_reads(node.stmts)
+                stmts = self._remove_unused(node.stmts)
+                if stmts is None:
+                    break
+                node.stmts = stmts
+        return node
+
+    def _prune(self, stmts: list) -> list:
+        pruned = []
+        for stmt in stmts:
+            if isinstance(stmt, If):
+                stmt.stmts = self._prune(stmt.stmts)
+                stmt.orelse = self._prune(stmt.orelse)
+            elif isinstance(stmt, (For, While)):
+                stmt.stmts = self._prune(stmt.stmts)
+            pruned.append(stmt)
+            if terminates([stmt]):
+                break
+        return pruned
+
+    def _collect_reads(self, stmts: list):
+        for stmt in stmts:
+            if isinstance(stmt, Assign):
+                nodes = [stmt.value] if isinstance(stmt.target, Var) else [stmt.value, stmt.target]
+            elif isinstance(stmt, For):
+                nodes = [stmt.begin, stmt.end, stmt.step]
+                self._collect_reads(stmt.stmts)
+            elif isinstance(stmt, (If, While)):
+                nodes = [stmt.expr]
+                self._collect_reads(stmt.stmts)
+                if isinstance(stmt, If):
+                    self._collect_reads(stmt.orelse)
+            elif isinstance(stmt, (Expr, Return)):
+                nodes = [stmt.value] if stmt.value is not None else []
+            else:
+                nodes = []
+            for root in nodes:
+                self._reads.update(n.id for n in ast.walk(root) if isinstance(n, Var))
+
+    def _is_unused(self, stmt: ast.AST) -> bool:
+        if isinstance(stmt, Pass):
+            return True
+        if isinstance(stmt, Expr):
+            return is_pure(stmt.value)
+        if isinstance(stmt, Assign) and isinstance(stmt.target, Var):
+            return stmt.target.id not in self._reads and is_pure(stmt.value)
+        if isinstance(stmt, If):
+            return not stmt.stmts and not stmt.orelse and is_pure(stmt.expr)
+        return False
+
+    def _remove_unused(self, stmts: list):
+        # Returns the statements left, or None if there was nothing to remove
+        changed = False
+        kept = []
+        for stmt in stmts:
+            if isinstance(stmt, If):
+                for field in ('stmts', 'orelse'):
+                    branch = self._remove_unused(getattr(stmt, field))
+                    if branch is not None:
+                        setattr(stmt, field, branch)
+                        changed = True
+            elif isinstance(stmt, (For, While)):
+                body = self._remove_unused(stmt.stmts)
+                if body is not None:
+                    stmt.stmts = body
+                    changed = True
+
+            if self._is_unused(stmt):
+                changed = True
+            else:
+                kept.append(stmt)
+        return kept if changed else None
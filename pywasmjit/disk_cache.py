@@ -0,0 +1,100 @@
+import os
+import hashlib
+import tempfile
+from typing import Optional
+
+
+def make_cache_key(*parts) -> str:
+    h = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, str):
+            part = part.encode('utf-8')
+        elif not isinstance(part, bytes):
+            part = repr(part).encode('utf-8')
+        h.update(len(part).to_bytes(8, 'little'))
+        h.update(part)
+    return h.hexdigest()
+
+
+# Size-bounded key-value store on disk, one file per entry.
+# Entries are evicted in least recently used order, the mtime of an entry is refreshed on every hit.
+class DiskCache:
+    __slots__ = ['directory', 'max_size', 'hits', 'misses', 'stores', 'evictions', 'rejects']
+
+    def __init__(self, directory: str, max_size: int = 64 * 1024 * 1024):
+        self.directory = directory
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self.rejects = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f'{key}.bin')
+
+    def load(self, key: str) -> Optional[bytes]:
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            os.utime(path)
+        except OSError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return data
+
+    def store(self, key: str, data: bytes):
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, self._path(key))
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+        self.stores += 1
+        self.evict()
+
+    def reject(self, key: str):
+        # The entry was loaded but turned out to be unusable, count it as a miss
+        self.hits -= 1
+        self.misses += 1
+        self.rejects += 1
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def evict(self):
+        entries = []
+        total_size = 0
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.bin'):
+                st = entry.stat()
+                entries.append((st.st_mtime, st.st_size, entry.path))
+                total_size += st.st_size
+
+        entries.sort()
+        for _, size, path in entries:
+            if total_size <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total_size -= size
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        return {
+            'directory': self.directory,
+            'hits': self.hits,
+            'misses': self.misses,
+            'stores': self.stores,
+            'evictions': self.evictions,
+            'rejects': self.rejects
+        }
@@ -1,8 +1,28 @@
 from .callback_pool import CallbackPool
 
+WASM_PAGE_SIZE = 65536
+
 
 class ExecInstance:
-    def __init__(self, callback_pool: CallbackPool, buf: bytes):
+    def __init__(self, callback_pool: CallbackPool):
+        # Linear memory below memory_top is in use by calls in progress (e.g. a callback calling another function)
+        self.memory_top = 0
+        # Seconds spent by the last link_module() per phase: 'module' (compiling) and 'instance' (instantiating)
+        self.link_times: dict[str, float] = {}
+
+    def link_module(self, buf: bytes):
+        pass
+
+    def get_function(self, func_name: str):
+        pass
+
+    def ensure_memory(self, size: int):
+        pass
+
+    def write_memory(self, offset: int, data):
+        pass
+
+    def read_memory(self, offset: int, out: memoryview):
         pass
 
     def exec_function(self, func_name: str, *args):
@@ -1,10 +1,11 @@
+import time
 import pyodide.ffi
 import js
 from js import Uint8Array
 from js import WebAssembly
 
 from .callback_pool import CallbackPool
-from .exec_instance import ExecInstance
+from .exec_instance import ExecInstance, WASM_PAGE_SIZE
 
 
 def print_int(x: int) -> None:
@@ -21,35 +22,76 @@ def print_bool(x: int) -> None:
 
 
 class HTML5Instance(ExecInstance):
-    def __init__(self, callback_pool: CallbackPool, buf: bytes):
-        super().__init__(callback_pool, buf)
+    def __init__(self, callback_pool: CallbackPool):
+        super().__init__(callback_pool)
+        self._callback_pool = callback_pool
 
-        import_funcs = {
+        self._host_functions = {
             'js': {
                 'print_int': pyodide.ffi.create_proxy(print_int),
                 'print_float': pyodide.ffi.create_proxy(print_float),
                 'print_bool': pyodide.ffi.create_proxy(print_bool)
-            }
+            },
+            'callback': {}
         }
 
-        if len(callback_pool.callbacks) > 0:
-            import_funcs['callback'] = {}
+        self._memory = WebAssembly.Memory.new(pyodide.ffi.to_js({'initial': 1}, dict_converter=js.Object.fromEntries))
+        self._host_functions['env'] = {'memory': self._memory}
+
+        self._instances = []
+        self._exports = {}  # func_name => exported function of linked modules
+
+    def _resolve_import(self, modname: str, fieldname: str):
+        if modname == 'jit':
+            if fieldname not in self._exports:
+                raise RuntimeError(f'Function \'{fieldname}\' not linked in runtime')
+            return self._exports[fieldname]
+        elif modname == 'callback':
+            if fieldname not in self._host_functions['callback']:
+                func = self._callback_pool.query_function(fieldname)
+                self._host_functions['callback'][fieldname] = pyodide.ffi.create_proxy(func)
+            return self._host_functions['callback'][fieldname]
+        else:
+            return self._host_functions[modname][fieldname]
+
+    def link_module(self, buf: bytes):
+        start_time = time.perf_counter()
+        jsbuf = Uint8Array.new(len(buf))
+        jsbuf.assign(buf)
 
-        for func_name, value in callback_pool.callbacks.items():
-            func = value[0]
-            import_funcs['callback'][func_name] = pyodide.ffi.create_proxy(func)
+        module = WebAssembly.Module.new(jsbuf)
+        compiled_time = time.perf_counter()
 
-        self._import_object = pyodide.ffi.to_js(import_funcs, dict_converter=js.Object.fromEntries)
+        import_funcs = {}
+        for imp in WebAssembly.Module.imports(module):
+            import_funcs.setdefault(imp.module, {})[imp.name] = self._resolve_import(imp.module, imp.name)
+        import_object = pyodide.ffi.to_js(import_funcs, dict_converter=js.Object.fromEntries)
 
-        jsbuf = Uint8Array.new(len(buf))
-        jsbuf.assign(buf)
+        instance = WebAssembly.Instance.new(module, import_object)
+        self._instances.append(instance)
+        self.link_times = {'module': compiled_time - start_time, 'instance': time.perf_counter() - compiled_time}
 
-        self._module = WebAssembly.Module.new(jsbuf)
-        self._instance = WebAssembly.Instance.new(self._module, self._import_object)
+        for export in WebAssembly.Module.exports(module):
+            self._exports[export.name] = getattr(instance.exports, export.name)
 
-    def exec_function(self, func_name: str, *args):
-        wasm_func = getattr(self._instance.exports, func_name)
+    def get_function(self, func_name: str):
+        wasm_func = self._exports.get(func_name)
         if wasm_func is None:
             raise RuntimeError(f'Function \'{func_name}\' not found in runtime')
-        result = wasm_func(*args)
+        return wasm_func
+
+    def ensure_memory(self, size: int):
+        pages = (size + WASM_PAGE_SIZE - 1) // WASM_PAGE_SIZE
+        current_pages = self._memory.buffer.byteLength // WASM_PAGE_SIZE
+        if pages > current_pages:
+            self._memory.grow(pages - current_pages)
+
+    def write_memory(self, offset: int, data):
+        Uint8Array.new(self._memory.buffer, offset, len(data)).assign(data)
+
+    def read_memory(self, offset: int, out: memoryview):
+        Uint8Array.new(self._memory.buffer, offset, len(out)).assign_to(out)
+
+    def exec_function(self, func_name: str, *args):
+        result = self.get_function(func_name)(*args)
         return result
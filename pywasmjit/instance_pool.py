@@ -0,0 +1,126 @@
+import time
+import threading
+from typing import Optional
+
+from .callback_pool import CallbackPool
+from .disk_cache import DiskCache
+from .exec_instance import ExecInstance
+from .wasmer_instance import WasmerInstance, precompile_module
+
+
+class PooledState(threading.local):
+    def __init__(self):
+        self.instance: Optional[WasmerInstance] = None
+        self.linked = 0  # number of modules linked into instance
+        self.depth = 0  # nesting of calls in progress, callbacks may call back into wasm
+        self.memory_top = 0
+
+
+class InstancePool(ExecInstance):
+    # Wasmer objects (stores, modules, instances) can not be used from any other thread than the one
+    # created them, so every calling thread gets an instance of its own. Modules are compiled once, the
+    # instances only deserialize the machine code. The pool size bounds the calls running at the same time.
+    __slots__ = ['_callback_pool', '_native_cache', '_compiler', '_compiled_keys', '_size', '_semaphore', '_modules',
+                 '_state', '_stats_lock', '_instances', '_calls', '_waits', '_wait_time', '_max_wait_time']
+
+    def __init__(self, callback_pool: CallbackPool, native_cache: Optional[DiskCache] = None, size: int = 4,
+                 compiler: str = 'cranelift', compiled_keys: Optional[set[str]] = None):
+        self._state = PooledState()
+        super().__init__(callback_pool)
+        self._callback_pool = callback_pool
+        self._native_cache = native_cache
+        self._compiler = compiler
+        self._compiled_keys = compiled_keys  # see precompile_module()
+        self._size = size
+        self._semaphore = threading.BoundedSemaphore(size)
+        self._modules: list[bytes] = []
+
+        self._stats_lock = threading.Lock()
+        self._instances = 0
+        self._calls = 0
+        self._waits = 0
+        self._wait_time = 0.0
+        self._max_wait_time = 0.0
+
+    @property
+    def memory_top(self) -> int:
+        return self._state.memory_top
+
+    @memory_top.setter
+    def memory_top(self, value: int):
+        self._state.memory_top = value
+
+    def _instance(self) -> WasmerInstance:
+        state = self._state
+        if state.instance is None:
+            state.instance = WasmerInstance(self._callback_pool, self._native_cache, self._compiler)
+            with self._stats_lock:
+                self._instances += 1
+        while state.linked < len(self._modules):
+            state.instance.link_module(self._modules[state.linked])
+            state.linked += 1
+        return state.instance
+
+    def link_module(self, buf: bytes):
+        # Only compiled here, every calling thread instantiates it on its first call
+        start_time = time.perf_counter()
+        precompile_module(buf, self._native_cache, self._compiler, self._compiled_keys)
+        self._modules.append(buf)
+        self.link_times = {'module': time.perf_counter() - start_time}
+
+    def _acquire(self):
+        if self._semaphore.acquire(blocking=False):
+            with self._stats_lock:
+                self._calls += 1
+            return
+
+        start_time = time.perf_counter()
+        self._semaphore.acquire()
+        wait_time = time.perf_counter() - start_time
+        with self._stats_lock:
+            self._calls += 1
+            self._waits += 1
+            self._wait_time += wait_time
+            self._max_wait_time = max(self._max_wait_time, wait_time)
+
+    def get_function(self, func_name: str):
+        # Fails early if func_name is not linked
+        self._instance().get_function(func_name)
+        state = self._state
+
+        def pooled_func(*args):
+            if state.depth == 0:
+                self._acquire()
+            state.depth += 1
+            try:
+                return self._instance().get_function(func_name)(*args)
+            finally:
+                state.depth -= 1
+                if state.depth == 0:
+                    self._semaphore.release()
+
+        return pooled_func
+
+    def ensure_memory(self, size: int):
+        self._instance().ensure_memory(size)
+
+    def write_memory(self, offset: int, data):
+        self._instance().write_memory(offset, data)
+
+    def read_memory(self, offset: int, out: memoryview):
+        self._instance().read_memory(offset, out)
+
+    def exec_function(self, func_name: str, *args):
+        result = self.get_function(func_name)(*args)
+        return result
+
+    def pool_stats(self) -> dict:
+        with self._stats_lock:
+            return {
+                'size': self._size,
+                'instances': self._instances,
+                'calls': self._calls,
+                'waits': self._waits,
+                'wait_time': self._wait_time,
+                'max_wait_time': self._max_wait_time
+            }
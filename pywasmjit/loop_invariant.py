@@ -0,0 +1,95 @@
+from .ast import *
+
+
+class LoopInvariantMover:
+    # Hoists subexpressions whose operands are not assigned inside a loop into locals assigned before the loop.
+    # Loops are processed outermost first, so an expression moves out of as many loops as it is invariant in.
+    # Hoisted expressions are evaluated even if the loop runs zero times or the expression sits in a branch
+    # not taken, only expressions which can not trap are moved. In checked mode an overflow of a hoisted
+    # expression traps early, the rerun in Python still returns the right result.
+    __slots__ = ['_assigned', '_hoisted', '_temp_count']
+
+    def __init__(self):
+        self._assigned: set[str] = set()  # names assigned inside the loop being processed
+        self._hoisted: dict[str, Assign] = {}  # dump of the expression => assignment of its temporary
+        self._temp_count = 0
+
+    def visit(self, node: ast.AST):
+        if isinstance(node, FuncDef):
+            self._temp_count = 0
+            node.stmts = self._process_stmts(node.stmts)
+        return node
+
+    def _process_stmts(self, stmts: list) -> list:
+        processed = []
+        for stmt in stmts:
+            if isinstance(stmt, (For, While)):
+                processed.extend(self._hoist(stmt))
+                stmt.stmts = self._process_stmts(stmt.stmts)
+            elif isinstance(stmt, If):
+                stmt.stmts = self._process_stmts(stmt.stmts)
+                stmt.orelse = self._process_stmts(stmt.orelse)
+            processed.append(stmt)
+        return processed
+
+    def _hoist(self, loop: ast.AST) -> list[Assign]:
+        self._assigned = set()
+        self._hoisted = {}
+        assigned_names([loop], self._assigned)
+        if isinstance(loop, While):
+            loop.expr = self._rewrite(loop.expr)
+        self._rewrite_stmts(loop.stmts)
+        return list(self._hoisted.values())
+
+    def _rewrite_stmts(self, stmts: list):
+        for stmt in stmts:
+            if isinstance(stmt, Assign):
+                stmt.value = self._rewrite(stmt.value)
+                if isinstance(stmt.target, Subscript):
+                    stmt.target.index = self._rewrite(stmt.target.index)
+            elif isinstance(stmt, Expr):
+                stmt.value = self._rewrite(stmt.value)
+            elif isinstance(stmt, Return) and stmt.value is not None:
+                stmt.value = self._rewrite(stmt.value)
+            elif isinstance(stmt, If):
+                stmt.expr = self._rewrite(stmt.expr)
+                self._rewrite_stmts(stmt.stmts)
+                self._rewrite_stmts(stmt.orelse)
+            elif isinstance(stmt, While):
+                stmt.expr = self._rewrite(stmt.expr)
+                self._rewrite_stmts(stmt.stmts)
+            elif isinstance(stmt, For):
+                stmt.begin = self._rewrite(stmt.begin)
+                stmt.end = self._rewrite(stmt.end)
+                stmt.step = self._rewrite(stmt.step)
+                self._rewrite_stmts(stmt.stmts)
+
+    def _rewrite(self, node: ast.AST) -> ast.AST:
+        # Replaces the largest invariant subexpressions by temporaries
+        if isinstance(node, (BinOp, UnaryOp, Compare, FuncCall)) and self._is_invariant(node):
+            key = ast.dump(node)
+            if key not in self._hoisted:
+                ty = expr_type(node)
+                temp = Var(f'$inv{self._temp_count}', ty)
+                self._temp_count += 1
+                self._hoisted[key] = Assign(temp, node, ty)
+            temp = self._hoisted[key].target
+            return Var(temp.id, temp.type)
+
+        if isinstance(node, BinOp):
+            node.left = self._rewrite(node.left)
+            node.right = self._rewrite(node.right)
+        elif isinstance(node, UnaryOp):
+            node.right = self._rewrite(node.right)
+        elif isinstance(node, Compare):
+            node.left = self._rewrite(node.left)
+            node.comparator = self._rewrite(node.comparator)
+        elif isinstance(node, FuncCall):
+            node.args = [self._rewrite(arg) for arg in node.args]
+        elif isinstance(node, Subscript):
+            node.index = self._rewrite(node.index)
+        return node
+
+    def _is_invariant(self, node: ast.AST) -> bool:
+        # Buffer elements may be written inside the loop, is_pure() rejects them as well
+        return is_pure(node) and not any(isinstance(n, Var) and n.id in self._assigned for n in ast.walk(node))
@@ -1,97 +1,619 @@
+import os
 import sys
 import ast
-from typing import Optional
+import json
+import asyncio
+import time
+import threading
+from typing import Callable, Optional
 
-from .ast_transformer import ASTTransformer
+from .ast_transformer import ASTTransformer, get_source
+from .batch import to_memory_buffer, make_output, to_result, is_numpy_array, align, call_with_buffers
 from .callback_pool import CallbackPool
 from .codegen import WASMCodeGen
+from .constant_folder import ConstantFolder
+from .dead_code import DeadCodeEliminator
+from .loop_invariant import LoopInvariantMover
+from .disk_cache import DiskCache, make_cache_key
 from .exec_instance import ExecInstance
+from .phase_timer import PhaseTimer
 from .type_checker import TypeChecker
-from .utils import DEBUG, debug_print
+from .utils import DEBUG, VERSION, DEFAULT_OPT_LEVEL, DEFAULT_INLINE_THRESHOLD, debug_print
+from .utils import INT_RANGES, element_pytype, element_type
+from .utils import FunctionSignature
 
-if 'pyodide' in sys.modules or sys.platform == 'emscripten':
+IS_HTML5 = 'pyodide' in sys.modules or sys.platform == 'emscripten'
+
+if IS_HTML5:
     from .html5_instance import HTML5Instance
 else:
-    from .wasmer_instance import WasmerInstance
+    from .wasmer_instance import WasmerInstance, precompile_module, compiled_artifacts
+    from .tiered_instance import TieredInstance
+    from .instance_pool import InstancePool
+    from .parallel import WorkerPool
+
+
+_UNBOUND = object()
+
+
+class JITContext:
+    # Functions, callbacks and the runtime instance they are linked into. Contexts are independent
+    # of each other, functions of one context can neither call nor invalidate those of another
+    __slots__ = ['callback_pool', 'type_checker', 'codegen', 'phase_timer',
+                 'pending_funcs', 'wasm_modules', 'wasm_module_names', 'wasm_linked', 'wasm_exec_instance', 'wasm_generation',
+                 'map_drivers', 'worker_pool', 'wasm_cache', 'native_cache', 'wasm_cache_keys', 'source_keys',
+                 'compiled_keys', 'eager_compile', 'int64_mode', 'checked_mode', 'opt_level', 'inline_threshold',
+                 'tiering', 'instance_pool',
+                 'compile_lock', 'background_thread', 'background_error']
+
+    def __init__(self):
+        self.callback_pool = CallbackPool()
+        self.type_checker = TypeChecker(self.callback_pool)
+        self.codegen = WASMCodeGen(self.callback_pool)
+        self.phase_timer = PhaseTimer()
+
+        self.pending_funcs: list[str] = []  # functions compiled but not yet encoded into a module
+        self.wasm_modules: list[bytes] = []  # encoded modules, one per function, in link order
+        self.wasm_module_names: list[str] = []  # name of the function exported by each of wasm_modules
+        self.wasm_linked = 0  # number of modules in wasm_modules linked into wasm_exec_instance
+        self.wasm_exec_instance: Optional[ExecInstance] = None
+        self.wasm_generation = object()  # replaced whenever bound functions have to be resolved again
+        self.map_drivers: set[str] = set()  # functions whose map driver module is in wasm_modules
+        self.worker_pool = None  # WorkerPool of processes running parallel_map()
+
+        self.wasm_cache: Optional[DiskCache] = None
+        self.native_cache: Optional[DiskCache] = None  # compiled machine code of modules, wasmer only
+        self.wasm_cache_keys: dict[str, str] = {}  # func_name => key, for functions to be stored after encoding
+        self.source_keys: dict[str, str] = {}  # func_name => key it was compiled or loaded under
+        self.compiled_keys: set[str] = set()  # keys of the compiled_artifacts added by this context
+
+        self.eager_compile = False
+        self.int64_mode = False  # compile int as i64 instead of i32
+        self.checked_mode = False  # trap on integer overflow and run the Python function instead
+        self.opt_level = DEFAULT_OPT_LEVEL
+        self.inline_threshold = DEFAULT_INLINE_THRESHOLD
+        self.tiering: Optional[dict] = None  # TieredInstance options, None for a single Cranelift tier
+        self.instance_pool: Optional[dict] = None  # InstancePool options, None for a single instance
+
+        # Guards everything above, compiling and linking in one context never waits for another one
+        self.compile_lock = threading.RLock()
+        self.background_thread: Optional[threading.Thread] = None
+        self.background_error: Optional[Exception] = None  # raised by the next wait_ready()
+
+    def set_eager(self, enabled: bool):
+        self.eager_compile = enabled
+
+    def set_int_mode(self, int64: bool = False, checked: bool = False):
+        self.int64_mode = int64
+        self.checked_mode = checked
+
+    def set_opt_level(self, level: int):
+        self.opt_level = level
+
+    def set_inline_threshold(self, instructions: int):
+        # Functions compiled afterwards inline calls to functions of at most this many instructions, 0 disables it
+        self.inline_threshold = instructions
+        self.codegen.inline_threshold = instructions
+
+    def enable_tiering(self, baseline_compiler: str = 'singlepass', optimized_compiler: str = 'cranelift',
+                       call_threshold: int = 1000, time_threshold: float = 0.1):
+        if IS_HTML5:
+            raise RuntimeError('Tiered compilation is only supported by the wasmer runtime')
+        if self.instance_pool is not None:
+            raise RuntimeError('Tiered compilation can not be combined with an instance pool')
+        with self.compile_lock:
+            self.tiering = {
+                'baseline_compiler': baseline_compiler,
+                'optimized_compiler': optimized_compiler,
+                'call_threshold': call_threshold,
+                'time_threshold': time_threshold
+            }
+            self.wasm_exec_instance = None
+            self.invalidate_functions()
+
+    def disable_tiering(self):
+        with self.compile_lock:
+            self.tiering = None
+            self.wasm_exec_instance = None
+            self.invalidate_functions()
+
+    def tier_stats(self) -> Optional[dict]:
+        if IS_HTML5 or not isinstance(self.wasm_exec_instance, TieredInstance):
+            return None
+        return self.wasm_exec_instance.tier_stats()
+
+    def enable_instance_pool(self, size: Optional[int] = None):
+        if IS_HTML5:
+            raise RuntimeError('Instance pools are only supported by the wasmer runtime')
+        if self.tiering is not None:
+            raise RuntimeError('Instance pools can not be combined with tiered compilation')
+        with self.compile_lock:
+            self.instance_pool = {'size': size or os.cpu_count() or 1}
+            self.wasm_exec_instance = None
+            self.invalidate_functions()
+
+    def disable_instance_pool(self):
+        with self.compile_lock:
+            self.instance_pool = None
+            self.wasm_exec_instance = None
+            self.invalidate_functions()
+
+    def pool_stats(self) -> Optional[dict]:
+        if IS_HTML5 or not isinstance(self.wasm_exec_instance, InstancePool):
+            return None
+        return self.wasm_exec_instance.pool_stats()
+
+    def compile_stats(self) -> dict:
+        # func_name => {'phases': {phase: seconds}, 'total': seconds, 'instructions': ..., 'module_bytes': ...}
+        return self.phase_timer.stats()
+
+    def set_compile_hook(self, hook: Optional[Callable[[str, str, float], None]]):
+        # hook(func_name, phase, seconds) is called after every compile phase, None removes it
+        self.phase_timer.hook = hook
+
+    def invalidate_functions(self, *_):
+        self.wasm_generation = object()
+
+    def enable_cache(self, directory: Optional[str] = None, max_size: int = 64 * 1024 * 1024, native: bool = False):
+        if directory is None:
+            cache_home = os.environ.get('XDG_CACHE_HOME', os.path.join(os.path.expanduser('~'), '.cache'))
+            directory = os.path.join(cache_home, 'pywasmjit')
+        self.wasm_cache = DiskCache(os.path.join(directory, 'wasm'), max_size)
+        self.native_cache = DiskCache(os.path.join(directory, 'native'), max_size) if native else None
+
+    def disable_cache(self):
+        self.wasm_cache = None
+        self.native_cache = None
+        self.wasm_cache_keys.clear()
+        self.source_keys.clear()
+
+    def cache_stats(self) -> dict:
+        return {
+            'wasm': None if self.wasm_cache is None else self.wasm_cache.stats(),
+            'native': None if self.native_cache is None else self.native_cache.stats()
+        }
+
+    def _cache_key(self, source: str, int_type: str, checked: bool, opt_level: int) -> str:
+        # The generated module depends on the signatures of everything it may call
+        callbacks = [(name, value[1].params, value[1].return_type)
+                     for name, value in self.callback_pool.callbacks.items()]
+        funcs = [(name, sig.params, sig.return_type, sig.int_type)
+                 for name, sig in self.codegen.query_signatures().items()]
+        # and on the bodies of the functions it may inline. Functions loaded from the cache have no body
+        # to inline, the key they were cached under stands for their source whether inlinable or not
+        inlined = None
+        if opt_level >= 2:
+            candidates = self.codegen.query_inline_candidates()
+            inlined = (self.codegen.inline_threshold,
+                       sorted((name, self.source_keys.get(name) or candidates.get(name))
+                              for name in self.codegen.query_signatures()))
+        return make_cache_key(VERSION, source, int_type, checked, opt_level, callbacks, funcs, inlined)
+
+    def _store_cache_entry(self, key: str, func_name: str, buf: bytes):
+        sig = self.codegen.query_signature(func_name)
+        header = json.dumps({'func_name': func_name, 'params': sig.params, 'return_type': sig.return_type,
+                             'int_type': sig.int_type, 'size': len(buf)})
+        self.wasm_cache.store(key, header.encode('utf-8') + b'\n' + buf)
+
+    def _load_cache_entry(self, key: str) -> Optional[str]:
+        data = self.wasm_cache.load(key)
+        if data is None:
+            return None
+
+        try:
+            header, buf = data.split(b'\n', 1)
+            header = json.loads(header)
+            func_name = header['func_name']
+            sig = FunctionSignature(header['params'], header['return_type'], header['int_type'])
+            if len(buf) != header['size']:
+                raise ValueError(f'{len(buf)} bytes instead of {header["size"]}')
+        except (ValueError, KeyError, TypeError) as e:
+            # Truncated or corrupt, compiled again and stored over it
+            debug_print(f'Invalid cache entry {key}: {e}')
+            self.wasm_cache.reject(key)
+            return None
+
+        self.type_checker.add_function_signature(func_name, sig)
+        self.codegen.add_prebuilt_function(func_name, sig, buf)
+        return func_name
+
+    def wasmjit(self, func=None, *, eager: Optional[bool] = None, int64: Optional[bool] = None,
+                checked: Optional[bool] = None, opt_level: Optional[int] = None):
+        if func is None:
+            # Used as @wasmjit(...)
+            return lambda f: self.wasmjit(f, eager=eager, int64=int64, checked=checked, opt_level=opt_level)
+
+        int_type = 'i64' if (self.int64_mode if int64 is None else int64) else 'i32'
+        checked = self.checked_mode if checked is None else checked
+        opt_level = self.opt_level if opt_level is None else opt_level
+        if int_type == 'i64' and IS_HTML5:
+            raise RuntimeError('64-bit integer mode is only supported by the wasmer runtime')
+
+        start_time = time.perf_counter()
+        source = get_source(func)
+        source_time = time.perf_counter() - start_time
+
+        with self.compile_lock:
+            func_name = None
+            # Recorded once the function compiled, the name is only known after parsing
+            phase_times = [('source', source_time)]
+
+            if self.wasm_cache is not None:
+                start_time = time.perf_counter()
+                key = self._cache_key(source, int_type, checked, opt_level)
+                func_name = self._load_cache_entry(key)
+                phase_times.append(('cache', time.perf_counter() - start_time))
+                if func_name is not None:
+                    debug_print(f'Cache hit: {func_name}')
+                    self.source_keys[func_name] = key
+
+            if func_name is None:
+                start_time = time.perf_counter()
+                transformer = ASTTransformer()
+                transformed_ast = transformer.transform(source)
+                transformed_ast.int_type = int_type
+                transformed_ast.checked = checked
+                transformed_ast.opt_level = opt_level
+                phase_times.append(('transform', time.perf_counter() - start_time))
+
+                start_time = time.perf_counter()
+                self.type_checker.visit(transformed_ast)
+                phase_times.append(('type_check', time.perf_counter() - start_time))
+
+                if opt_level >= 1:
+                    start_time = time.perf_counter()
+                    transformed_ast = ConstantFolder().visit(transformed_ast)
+                    transformed_ast = DeadCodeEliminator().visit(transformed_ast)
+                    if opt_level >= 2:
+                        transformed_ast = LoopInvariantMover().visit(transformed_ast)
+                    phase_times.append(('optimize', time.perf_counter() - start_time))
+
+                if DEBUG:
+                    dump = ast.dump(transformed_ast, indent=4)
+                    debug_print(dump)
+
+                start_time = time.perf_counter()
+                self.codegen.visit(transformed_ast)
+                phase_times.append(('codegen', time.perf_counter() - start_time))
+                func_name = transformed_ast.func_name
+
+                if self.wasm_cache is not None:
+                    self.wasm_cache_keys[func_name] = key
+                    self.source_keys[func_name] = key
+
+            for phase, seconds in phase_times:
+                self.phase_timer.add_time(func_name, phase, seconds)
+            self.phase_timer.set_count(func_name, 'instructions', self.codegen.query_instruction_count(func_name))
+
+            # The new function is linked into the existing instance on the next warmup(),
+            # without touching the modules which are already instantiated
+            self.pending_funcs.append(func_name)
+
+            if self.eager_compile if eager is None else eager:
+                self.start_background_compile()
+
+        return self.create_func_wrapper(func_name, func if checked else None)
+
+    def create_func_wrapper(self, func_name: str, fallback=None):
+        # The exported function is resolved once, the wrapper only compares the generation it was
+        # bound in against the current one and rebinds after the instance was replaced or re-tiered
+        ctx = self
+        bound_generation = _UNBOUND
+        bound_func = None
+        bound_instance = None
+
+        def bind():
+            nonlocal bound_generation, bound_func, bound_instance
+            ctx.warmup()
+            bound_func = ctx.wasm_exec_instance.get_function(func_name)
+            bound_instance = ctx.wasm_exec_instance
+            bound_generation = ctx.wasm_generation
+
+        signature = self.codegen.query_signature(func_name)
+        params = signature.params
+        int_type = signature.int_type
+        # Runtimes reject int arguments for f64 parameters, convert them up front
+        float_params = tuple(param == 'float' for param in params)
+
+        if any(element_pytype(param) is not None for param in params):
+            def wrapper(*func_args):
+                if bound_generation is not ctx.wasm_generation:
+                    bind()
+                return call_with_buffers(bound_instance, bound_func, params, func_args, int_type)
+        elif not any(float_params):
+            def wrapper(*func_args):
+                if bound_generation is not ctx.wasm_generation:
+                    bind()
+                return bound_func(*func_args)
+        elif all(float_params):
+            def wrapper(*func_args):
+                if bound_generation is not ctx.wasm_generation:
+                    bind()
+                return bound_func(*map(float, func_args))
+        else:
+            def wrapper(*func_args):
+                if bound_generation is not ctx.wasm_generation:
+                    bind()
+                return bound_func(*[float(arg) if is_float else arg
+                                    for arg, is_float in zip(func_args, float_params)])
+
+        if fallback is not None:
+            wasm_call = wrapper
+            min_int, max_int = INT_RANGES[int_type]
+            int_params = [i for i, param in enumerate(params) if param == 'int']
+
+            def wrapper(*func_args):
+                # Out of range arguments would silently wrap on their way into wasm
+                for i in int_params:
+                    if not min_int <= func_args[i] <= max_int:
+                        return fallback(*func_args)
+                try:
+                    return wasm_call(*func_args)
+                except RuntimeError as e:
+                    # Trapped on integer overflow, or on anything else Python handles (e.g. division by zero)
+                    debug_print(f'{func_name} trapped, falling back to Python: {e}')
+                    return fallback(*func_args)
+
+        def map_wrapper(*arrays):
+            return ctx.map_function(func_name, *arrays)
+
+        def parallel_map_wrapper(iterable, workers: Optional[int] = None, chunksize: Optional[int] = None):
+            return ctx.parallel_map(func_name, iterable, workers, chunksize, fallback)
+
+        wrapper.map = map_wrapper
+        wrapper.parallel_map = parallel_map_wrapper
+        return wrapper
+
+    def map_function(self, func_name: str, *arrays):
+        signature = self.codegen.query_signature(func_name)
+        if len(arrays) != len(signature.params):
+            raise RuntimeError(f'{func_name}.map() takes {len(signature.params)} arrays but {len(arrays)} were given')
+
+        with self.compile_lock:
+            if func_name not in self.map_drivers:
+                # The driver imports func_name, so its module has to be linked after it
+                if self.pending_funcs:
+                    self.compose_wasm()
+                self.wasm_modules.append(self.codegen.build_map_driver(func_name))
+                self.wasm_module_names.append(f'{func_name}$map')
+                self.map_drivers.add(func_name)
+        self.warmup()
+
+        instance = self.wasm_exec_instance
+
+        # Lay out every input array followed by the output array in linear memory
+        int_type = signature.int_type
+        buffers = [to_memory_buffer(arr, param, int_type) for arr, param in zip(arrays, signature.params)]
+        length = None
+        offsets = []
+        offset = align(instance.memory_top)
+        for buf, param in zip(buffers, signature.params):
+            buf_length = len(buf) // element_type(param, int_type)[1]
+            if length is not None and buf_length != length:
+                raise RuntimeError(f'{func_name}.map() arrays must have the same length')
+            length = buf_length
+            offsets.append(offset)
+            offset = align(offset + len(buf))
+
+        has_result = signature.return_type is not None and signature.return_type != 'None'
+        out = make_output(signature.return_type, length or 0, int_type) if has_result else None
+        out_size = 0 if out is None else len(out) * out.itemsize
 
+        instance.ensure_memory(offset + out_size)
+        for buf, buf_offset in zip(buffers, offsets):
+            instance.write_memory(buf_offset, buf)
 
-callback_pool = CallbackPool()
-type_checker = TypeChecker(callback_pool)
-codegen = WASMCodeGen(callback_pool)
+        # Callbacks may place buffers of their own calls (or maps) above the arrays in use
+        top = instance.memory_top
+        instance.memory_top = offset + out_size
+        try:
+            instance.get_function(f'{func_name}$map')(*offsets, offset, length or 0)
+        finally:
+            instance.memory_top = top
 
-wasm_composed = False
-wasm_exec_instance: Optional[ExecInstance] = None
+        if out is None:
+            return None
+        instance.read_memory(offset, memoryview(out).cast('B'))
+        return to_result(out, signature.return_type, any(is_numpy_array(arr) for arr in arrays))
 
+    def parallel_map(self, func_name: str, iterable, workers: Optional[int] = None, chunksize: Optional[int] = None,
+                     fallback=None) -> list:
+        if IS_HTML5:
+            raise RuntimeError('parallel_map() is only supported by the wasmer runtime')
 
-def wasmjit(func):
-    transformer = ASTTransformer()
-    transformed_ast = transformer.transform(func)
+        signature = self.codegen.query_signature(func_name)
+        if len(signature.params) == 1:
+            items = [(item,) for item in iterable]
+        else:
+            items = [tuple(item) for item in iterable]
 
-    type_checker.visit(transformed_ast)
+        self.wait_ready()
+        with self.compile_lock:
+            if self.pending_funcs:
+                self.compose_wasm()
+            if self.worker_pool is None or self.worker_pool.linked < len(self.wasm_modules)\
+                    or self.worker_pool.workers != (workers or os.cpu_count() or 1):
+                if self.worker_pool is not None:
+                    self.worker_pool.shutdown()
+                # Compile once here, the workers only deserialize the machine code
+                for buf in self.wasm_modules:
+                    precompile_module(buf, self.native_cache, compiled_keys=self.compiled_keys)
+                callbacks = [value[0] for value in self.callback_pool.callbacks.values()]
+                self.worker_pool = WorkerPool(workers, list(self.wasm_modules), dict(compiled_artifacts), callbacks,
+                                              dict(self.codegen.query_signatures()))
+            pool = self.worker_pool
 
-    if DEBUG:
-        dump = ast.dump(transformed_ast, indent=4)
-        debug_print(dump)
+        results = [None] * len(items)
+        for offset, chunk_results, trapped in pool.map(func_name, items, fallback is not None, chunksize):
+            results[offset:offset + len(chunk_results)] = chunk_results
+            for i in trapped:
+                results[offset + i] = fallback(*items[offset + i])
+        return results
 
-    codegen.visit(transformed_ast)
+    def wasmreg(self, func):
+        self.callback_pool.add_callback(func)
+        return func
 
-    global wasm_composed, wasm_exec_instance
-    wasm_composed = False
-    wasm_exec_instance = None
+    def compose_wasm(self):
+        for func_name in self.pending_funcs:
+            start_time = time.perf_counter()
+            self.codegen.build(func_name)
+            buf = self.codegen.get_bytes(func_name)
+            self.phase_timer.add_time(func_name, 'encode', time.perf_counter() - start_time)
+            self.phase_timer.set_count(func_name, 'module_bytes', len(buf))
 
-    return create_func_wrapper(transformed_ast)
+            if DEBUG:
+                print(buf)
+                with open(f'debug_{func_name}.wasm', 'wb') as binary_file:
+                    binary_file.write(buf)
 
+            if func_name in self.wasm_cache_keys:
+                self._store_cache_entry(self.wasm_cache_keys.pop(func_name), func_name, buf)
 
-def create_func_wrapper(ast):
-    func_name = ast.func_name
+            self.wasm_modules.append(buf)
+            self.wasm_module_names.append(func_name)
+        self.pending_funcs.clear()
 
-    def wrapper(*func_args):
-        warmup()
-        ret = wasm_exec_instance.exec_function(func_name, *func_args)
-        return ret
+    def init_instance(self):
+        if self.wasm_exec_instance is None:
+            if IS_HTML5:
+                self.wasm_exec_instance = HTML5Instance(self.callback_pool)
+            elif self.instance_pool is not None:
+                self.wasm_exec_instance = InstancePool(self.callback_pool, self.native_cache,
+                                                       compiled_keys=self.compiled_keys, **self.instance_pool)
+            elif self.tiering is not None:
+                self.wasm_exec_instance = TieredInstance(self.callback_pool, self.native_cache,
+                                                         on_promote=self.invalidate_functions, **self.tiering)
+            else:
+                self.wasm_exec_instance = WasmerInstance(self.callback_pool, self.native_cache)
+            self.wasm_linked = 0
+            self.invalidate_functions()
 
-    return wrapper
+        for func_name, buf in zip(self.wasm_module_names[self.wasm_linked:], self.wasm_modules[self.wasm_linked:]):
+            self.wasm_exec_instance.link_module(buf)
+            for phase, seconds in self.wasm_exec_instance.link_times.items():
+                self.phase_timer.add_time(func_name, phase, seconds)
+        self.wasm_linked = len(self.wasm_modules)
 
+    def background_compile(self):
+        try:
+            while True:
+                with self.compile_lock:
+                    if not self.pending_funcs:
+                        self.background_thread = None
+                        return
+                    composed = len(self.wasm_modules)
+                    self.compose_wasm()
+                    modules = self.wasm_modules[composed:]
+                    names = self.wasm_module_names[composed:]
 
-def wasmreg(func):
-    callback_pool.add_callback(func)
-    return func
+                # Instances can only be used by the thread created them, so the machine code is
+                # compiled here and instantiated by the first caller
+                if not IS_HTML5:
+                    compiler = 'cranelift' if self.tiering is None else self.tiering['baseline_compiler']
+                    for func_name, buf in zip(names, modules):
+                        start_time = time.perf_counter()
+                        precompile_module(buf, self.native_cache, compiler, self.compiled_keys)
+                        self.phase_timer.add_time(func_name, 'module', time.perf_counter() - start_time)
+        except Exception as e:
+            # Raised to the caller waiting for the functions, as compiling them lazily would have
+            with self.compile_lock:
+                self.background_error = e
+        finally:
+            with self.compile_lock:
+                if self.background_thread is threading.current_thread():
+                    self.background_thread = None
 
+    def start_background_compile(self):
+        with self.compile_lock:
+            if self.background_thread is not None:
+                return
+            self.background_thread = threading.Thread(target=self.background_compile, name='pywasmjit-compile',
+                                                      daemon=True)
+            try:
+                self.background_thread.start()
+            except RuntimeError:
+                # No threads support (e.g. Pyodide), compose right away instead
+                self.background_thread = None
+                self.compose_wasm()
 
-def compose_wasm():
-    codegen.build()
-    buf = codegen.get_bytes()
+    def join_background_compile(self):
+        thread = self.background_thread
+        while thread is not None and thread is not threading.current_thread():
+            thread.join()
+            thread = self.background_thread
 
-    if DEBUG:
-        print(buf)
-        with open("debug.wasm", "wb") as binary_file:
-            binary_file.write(buf)
+    def wait_ready(self):
+        self.join_background_compile()
+        with self.compile_lock:
+            error, self.background_error = self.background_error, None
+        if error is not None:
+            raise error
 
-    global wasm_composed
-    wasm_composed = True
+    async def ready(self):
+        await asyncio.get_running_loop().run_in_executor(None, self.wait_ready)
+        self.warmup()
 
+    def warmup(self):
+        self.wait_ready()
+        with self.compile_lock:
+            if self.pending_funcs:
+                self.compose_wasm()
+            if self.wasm_exec_instance is None or self.wasm_linked < len(self.wasm_modules):
+                self.init_instance()
 
-def init_instance():
-    buf = codegen.get_bytes()
+    def cleanup(self):
+        self.join_background_compile()
+        with self.compile_lock:
+            self.background_error = None
+            if self.worker_pool is not None:
+                self.worker_pool.shutdown()
+                self.worker_pool = None
+            self.pending_funcs.clear()
+            self.wasm_modules.clear()
+            self.wasm_module_names.clear()
+            self.map_drivers.clear()
+            self.wasm_cache_keys.clear()
+            self.source_keys.clear()
+            if not IS_HTML5:
+                # Only the machine code compiled by this context, other contexts may still link theirs
+                for key in self.compiled_keys:
+                    compiled_artifacts.pop(key, None)
+            self.compiled_keys.clear()
+            self.wasm_linked = 0
+            self.wasm_exec_instance = None
+            self.invalidate_functions()
+            self.callback_pool = CallbackPool()
+            self.type_checker = TypeChecker(self.callback_pool)
+            self.codegen = WASMCodeGen(self.callback_pool)
+            self.codegen.inline_threshold = self.inline_threshold
+            self.phase_timer.clear()
 
-    global wasm_exec_instance
-    if 'pyodide' in sys.modules or sys.platform == 'emscripten':
-        wasm_exec_instance = HTML5Instance(callback_pool, buf)
-    else:
-        wasm_exec_instance = WasmerInstance(callback_pool, buf)
 
+# Context used by the module level functions below
+default_context = JITContext()
 
-def warmup():
-    if not wasm_composed:
-        compose_wasm()
-    if wasm_exec_instance is None:
-        init_instance()
+wasmjit = default_context.wasmjit
+wasmreg = default_context.wasmreg
+warmup = default_context.warmup
+ready = default_context.ready
+cleanup = default_context.cleanup
+set_eager = default_context.set_eager
+set_int_mode = default_context.set_int_mode
+set_opt_level = default_context.set_opt_level
+set_inline_threshold = default_context.set_inline_threshold
+enable_tiering = default_context.enable_tiering
+disable_tiering = default_context.disable_tiering
+tier_stats = default_context.tier_stats
+enable_instance_pool = default_context.enable_instance_pool
+disable_instance_pool = default_context.disable_instance_pool
+pool_stats = default_context.pool_stats
+enable_cache = default_context.enable_cache
+disable_cache = default_context.disable_cache
+cache_stats = default_context.cache_stats
+compile_stats = default_context.compile_stats
+set_compile_hook = default_context.set_compile_hook
 
 
-def cleanup():
-    global callback_pool, type_checker, codegen, wasm_composed, wasm_exec_instance
-    wasm_composed = False
-    wasm_exec_instance = None
-    callback_pool = CallbackPool()
-    type_checker = TypeChecker(callback_pool)
-    codegen = WASMCodeGen(callback_pool)
+if 'PYWASMJIT_CACHE_DIR' in os.environ:
+    enable_cache(os.environ['PYWASMJIT_CACHE_DIR'], native=os.environ.get('PYWASMJIT_NATIVE_CACHE') == '1')
@@ -0,0 +1,83 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional, Callable
+
+from .batch import call_with_buffers
+from .callback_pool import CallbackPool
+from .utils import INT_RANGES, FunctionSignature, element_pytype
+from .wasmer_instance import WasmerInstance, compiled_artifacts
+
+# State of a worker process, set up once by init_worker()
+worker_instance: Optional[WasmerInstance] = None
+worker_signatures: dict[str, FunctionSignature] = {}
+
+
+def init_worker(modules: list[bytes], artifacts: dict[str, bytes], callbacks: list[Callable],
+                signatures: dict[str, FunctionSignature]):
+    global worker_instance
+    # The machine code compiled by the parent is deserialized instead of compiled again
+    compiled_artifacts.update(artifacts)
+
+    callback_pool = CallbackPool()
+    for callback in callbacks:
+        callback_pool.add_callback(callback)
+
+    worker_instance = WasmerInstance(callback_pool)
+    for buf in modules:
+        worker_instance.link_module(buf)
+    worker_signatures.update(signatures)
+
+
+def run_chunk(func_name: str, chunk: list[tuple], checked: bool) -> tuple[list, list[int]]:
+    # Returns the results and the indices of calls which trapped in checked mode, these are rerun by the caller
+    func = worker_instance.get_function(func_name)
+    signature = worker_signatures[func_name]
+    params = signature.params
+    min_int, max_int = INT_RANGES[signature.int_type]
+    has_buffers = any(element_pytype(param) is not None for param in params)
+
+    results = []
+    trapped = []
+    for i, args in enumerate(chunk):
+        if checked and not all(min_int <= arg <= max_int for arg, param in zip(args, params) if param == 'int'):
+            results.append(None)
+            trapped.append(i)
+            continue
+
+        try:
+            if has_buffers:
+                results.append(call_with_buffers(worker_instance, func, params, args, signature.int_type))
+            else:
+                results.append(func(*[float(arg) if param == 'float' else arg for arg, param in zip(args, params)]))
+        except RuntimeError:
+            if not checked:
+                raise
+            results.append(None)
+            trapped.append(i)
+    return results, trapped
+
+
+class WorkerPool:
+    __slots__ = ['workers', 'linked', '_executor']
+
+    def __init__(self, workers: Optional[int], modules: list[bytes], artifacts: dict[str, bytes],
+                 callbacks: list[Callable], signatures: dict[str, FunctionSignature]):
+        self.workers = workers or os.cpu_count() or 1
+        self.linked = len(modules)  # number of modules instantiated by every worker
+        self._executor = ProcessPoolExecutor(max_workers=self.workers, initializer=init_worker,
+                                             initargs=(modules, artifacts, callbacks, signatures))
+
+    def map(self, func_name: str, items: list[tuple], checked: bool, chunksize: Optional[int] = None):
+        if chunksize is None:
+            # A few chunks per worker, to even out chunks of different cost
+            chunksize = max(1, -(-len(items) // (self.workers * 4)))
+        chunks = [items[i:i + chunksize] for i in range(0, len(items), chunksize)]
+
+        offset = 0
+        for results, trapped in self._executor.map(run_chunk, [func_name] * len(chunks), chunks,
+                                                   [checked] * len(chunks)):
+            yield offset, results, trapped
+            offset += len(results)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
@@ -0,0 +1,154 @@
+from typing import Callable, Optional
+
+from .utils import INT_RANGES
+
+Instruction = tuple  # ('opcode', *args), as collected in FunctionContext.instructions
+
+INT_INVERSE_COMPARES = {'eq': 'ne', 'ne': 'eq', 'lt_s': 'ge_s', 'ge_s': 'lt_s', 'gt_s': 'le_s', 'le_s': 'gt_s'}
+
+# Instructions which only push a single value, without side effects
+PURE_PUSHES = ('local.get', 'i32.const', 'i64.const', 'f64.const')
+
+# Instructions after which the rest of the block is never executed
+UNCONDITIONAL_BRANCHES = ('br', 'return', 'unreachable')
+
+
+def _tee(set_instr: Instruction, get_instr: Instruction) -> Optional[list]:
+    # local.set n; local.get n => local.tee n
+    if set_instr[1] != get_instr[1]:
+        return None
+    return [('local.tee', set_instr[1])]
+
+
+def _self_assign(get_instr: Instruction, set_instr: Instruction) -> Optional[list]:
+    # local.get n; local.set n => (nothing)
+    if get_instr[1] != set_instr[1]:
+        return None
+    return []
+
+
+def _invert_compare(compare_instr: Instruction, eqz_instr: Instruction) -> Optional[list]:
+    # Integer compare; i32.eqz => inverse compare. Not valid for floats, where NaN compares false both ways
+    ty, op = compare_instr[0].split('.')
+    if ty not in INT_RANGES or op not in INT_INVERSE_COMPARES:
+        return None
+    return [(f'{ty}.{INT_INVERSE_COMPARES[op]}',)]
+
+
+def _double_eqz_branch(eqz1: Instruction, eqz2: Instruction, branch: Instruction) -> Optional[list]:
+    # Branches only test for non-zero, normalizing the condition to 0/1 twice is not needed
+    return [branch]
+
+
+def _compare_zero(const_instr: Instruction, eq_instr: Instruction) -> Optional[list]:
+    # x; const 0; eq => x; eqz
+    ty = const_instr[0].split('.')[0]
+    if const_instr[1] != 0 or eq_instr[0] != f'{ty}.eq':
+        return None
+    return [(f'{ty}.eqz',)]
+
+
+def _int_identity(const_instr: Instruction, op_instr: Instruction) -> Optional[list]:
+    # x + 0, x - 0, x * 1, x / 1 => x. Not for floats, -0.0 + 0.0 is 0.0
+    ty = const_instr[0].split('.')[0]
+    op = op_instr[0]
+    if op in (f'{ty}.add', f'{ty}.sub') and const_instr[1] == 0:
+        return []
+    if op in (f'{ty}.mul', f'{ty}.div_s') and const_instr[1] == 1:
+        return []
+    return None
+
+
+def _negated_operand(const_instr: Instruction, value_instr: Instruction, sub_instr: Instruction,
+                     op_instr: Instruction) -> Optional[list]:
+    # Integer negation is emitted as 0 - x: a + (0 - x) => a - x, a - (0 - x) => a + x
+    ty = const_instr[0].split('.')[0]
+    if const_instr[1] != 0 or value_instr[0] not in PURE_PUSHES or sub_instr[0] != f'{ty}.sub':
+        return None
+    if op_instr[0] == f'{ty}.add':
+        return [value_instr, (f'{ty}.sub',)]
+    if op_instr[0] == f'{ty}.sub':
+        return [value_instr, (f'{ty}.add',)]
+    return None
+
+
+def _float_negated_operand(neg_instr: Instruction, op_instr: Instruction) -> Optional[list]:
+    # a + -x => a - x, a - -x => a + x (exact in IEEE 754)
+    return [('f64.sub',)] if op_instr[0] == 'f64.add' else [('f64.add',)]
+
+
+def _float_negate_const(const_instr: Instruction, neg_instr: Instruction) -> Optional[list]:
+    return [('f64.const', -const_instr[1])]
+
+
+def _double_negate(neg1: Instruction, neg2: Instruction) -> Optional[list]:
+    return []
+
+
+# Each rule is (patterns, rewrite). A pattern matches an instruction when it equals its opcode or is a tuple
+# containing it. When the last instructions emitted match the patterns in sequence, rewrite is called with them
+# and returns their replacement, or None if they have to be kept.
+RULES: list[tuple[tuple, Callable[..., Optional[list]]]] = [
+    (('local.set', 'local.get'), _tee),
+    (('local.get', 'local.set'), _self_assign),
+    ((('i32.eq', 'i32.ne', 'i32.lt_s', 'i32.ge_s', 'i32.gt_s', 'i32.le_s',
+       'i64.eq', 'i64.ne', 'i64.lt_s', 'i64.ge_s', 'i64.gt_s', 'i64.le_s'), 'i32.eqz'), _invert_compare),
+    (('i32.eqz', 'i32.eqz', ('br_if', 'if')), _double_eqz_branch),
+    ((('i32.const', 'i64.const'), ('i32.eq', 'i64.eq')), _compare_zero),
+    ((('i32.const', 'i64.const'), ('i32.add', 'i32.sub', 'i32.mul', 'i32.div_s',
+                                   'i64.add', 'i64.sub', 'i64.mul', 'i64.div_s')), _int_identity),
+    ((('i32.const', 'i64.const'), PURE_PUSHES, ('i32.sub', 'i64.sub'),
+      ('i32.add', 'i32.sub', 'i64.add', 'i64.sub')), _negated_operand),
+    (('f64.neg', ('f64.add', 'f64.sub')), _float_negated_operand),
+    (('f64.const', 'f64.neg'), _float_negate_const),
+    (('f64.neg', 'f64.neg'), _double_negate),
+]
+
+
+def _matches(pattern, instr: Instruction) -> bool:
+    return instr[0] == pattern if isinstance(pattern, str) else instr[0] in pattern
+
+
+def _rewrite_tail(output: list[Instruction]) -> bool:
+    for patterns, rewrite in RULES:
+        n = len(patterns)
+        if len(output) < n:
+            continue
+        tail = output[-n:]
+        if not all(_matches(pattern, instr) for pattern, instr in zip(patterns, tail)):
+            continue
+        replacement = rewrite(*tail)
+        if replacement is not None:
+            del output[-n:]
+            output.extend(replacement)
+            return True
+    return False
+
+
+def optimize(instructions: list[Instruction]) -> list[Instruction]:
+    # Instructions are moved to the output one at a time, the rules are applied to the end of the output
+    # until none matches. Rewrites cascade, the result of one rule can be matched by the next.
+    # Adjacent instructions always execute in sequence, structured control flow has no labels to jump in between.
+    output: list[Instruction] = []
+    dead_depth = -1  # >= 0 while skipping the unreachable rest of a block, the nesting of blocks skipped
+    for instr in instructions:
+        opcode = instr[0]
+        if dead_depth >= 0:
+            if opcode in ('block', 'loop', 'if'):
+                dead_depth += 1
+                continue
+            if dead_depth > 0:
+                if opcode == 'end':
+                    dead_depth -= 1
+                continue
+            if opcode not in ('end', 'else'):
+                continue
+            dead_depth = -1
+
+        output.append(instr)
+        while _rewrite_tail(output):
+            pass
+
+        if opcode in UNCONDITIONAL_BRANCHES:
+            dead_depth = 0
+    return output
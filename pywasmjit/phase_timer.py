@@ -0,0 +1,55 @@
+import threading
+from typing import Callable, Optional
+
+# Compile phases in the order they run:
+# source: retrieving the source of the function, transform: parsing it into the AST of pywasmjit,
+# cache: looking it up in the wasm cache, type_check, optimize: the AST passes of the opt level,
+# codegen: generating the instructions, encode: building the wasm module,
+# module: compiling (or deserializing) the machine code, instance: instantiating and linking the module
+PHASES = ('source', 'transform', 'cache', 'type_check', 'optimize', 'codegen', 'encode', 'module', 'instance')
+
+
+class PhaseTimer:
+    # Wall time per function and compile phase, and the size of what was generated.
+    # Modules may be compiled on the background thread, everything is guarded by a lock of its own
+    __slots__ = ['_lock', '_functions', 'hook']
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._functions: dict[str, dict] = {}  # func_name => {'phases': {phase: seconds}, 'instructions', ...}
+        self.hook: Optional[Callable[[str, str, float], None]] = None  # called with (func_name, phase, seconds)
+
+    def _entry(self, func_name: str) -> dict:
+        entry = self._functions.get(func_name)
+        if entry is None:
+            entry = {'phases': {}, 'instructions': None, 'module_bytes': None}
+            self._functions[func_name] = entry
+        return entry
+
+    def add_time(self, func_name: str, phase: str, seconds: float):
+        # Phases running more than once (e.g. linking into every new instance) add up
+        assert phase in PHASES
+        with self._lock:
+            phases = self._entry(func_name)['phases']
+            phases[phase] = phases.get(phase, 0.0) + seconds
+        hook = self.hook
+        if hook is not None:
+            hook(func_name, phase, seconds)
+
+    def set_count(self, func_name: str, key: str, value: Optional[int]):
+        assert key in ('instructions', 'module_bytes')
+        with self._lock:
+            self._entry(func_name)[key] = value
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {func_name: {'phases': {phase: entry['phases'][phase] for phase in PHASES
+                                           if phase in entry['phases']},
+                                'total': sum(entry['phases'].values()),
+                                'instructions': entry['instructions'],
+                                'module_bytes': entry['module_bytes']}
+                    for func_name, entry in self._functions.items()}
+
+    def clear(self):
+        with self._lock:
+            self._functions.clear()
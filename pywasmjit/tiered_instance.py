@@ -0,0 +1,114 @@
+import time
+from typing import Optional, Callable
+
+from .callback_pool import CallbackPool
+from .disk_cache import DiskCache
+from .exec_instance import ExecInstance
+from .wasmer_instance import WasmerInstance
+
+
+class TieredInstance(ExecInstance):
+    __slots__ = ['_callback_pool', '_native_cache', '_optimized_compiler', '_call_threshold', '_time_threshold',
+                 '_on_promote', '_baseline', '_optimized', '_modules', '_optimized_linked', '_stats']
+
+    def __init__(self, callback_pool: CallbackPool, native_cache: Optional[DiskCache] = None,
+                 baseline_compiler: str = 'singlepass', optimized_compiler: str = 'cranelift',
+                 call_threshold: int = 1000, time_threshold: float = 0.1,
+                 on_promote: Optional[Callable[[str], None]] = None):
+        super().__init__(callback_pool)
+        self._callback_pool = callback_pool
+        self._native_cache = native_cache
+        self._optimized_compiler = optimized_compiler
+        self._call_threshold = call_threshold
+        self._time_threshold = time_threshold  # cumulative seconds spent in the baseline tier
+        self._on_promote = on_promote
+
+        # Everything starts in the fast-compiling baseline tier, the optimizing tier is created on first promotion
+        self._baseline = WasmerInstance(callback_pool, native_cache, baseline_compiler)
+        self._optimized: Optional[WasmerInstance] = None
+
+        self._modules: dict[str, tuple[bytes, list[str]]] = {}  # func_name => (buf, names of linked functions)
+        self._optimized_linked: set[str] = set()
+        self._stats: dict[str, list] = {}  # func_name => [calls, cumulative time, promoted]
+
+    def link_module(self, buf: bytes):
+        module = self._baseline.link_module(buf)
+        self.link_times = self._baseline.link_times
+        deps = [imp.name for imp in module.imports if imp.module == 'jit']
+        uses_memory = any(imp.module == 'env' and imp.name == 'memory' for imp in module.imports)
+        for export in module.exports:
+            if uses_memory or '$' in export.name:
+                # Functions on linear memory (buffer params, map drivers) stay in the baseline tier with the memory
+                continue
+            self._modules[export.name] = (buf, deps)
+            self._stats[export.name] = [0, 0.0, False]
+        return module
+
+    def _link_optimized(self, func_name: str):
+        if func_name in self._optimized_linked:
+            return
+        buf, deps = self._modules[func_name]
+        for dep in deps:
+            self._link_optimized(dep)
+        self._optimized.link_module(buf)
+        self._optimized_linked.add(func_name)
+
+    def promote(self, func_name: str):
+        stats = self._stats[func_name]
+        if stats[2]:
+            return
+        if self._optimized is None:
+            self._optimized = WasmerInstance(self._callback_pool, self._native_cache, self._optimized_compiler)
+        self._link_optimized(func_name)
+        stats[2] = True
+        if self._on_promote is not None:
+            self._on_promote(func_name)
+
+    def get_function(self, func_name: str):
+        stats = self._stats.get(func_name)
+        if stats is None:
+            return self._baseline.get_function(func_name)
+        if stats[2]:
+            return self._optimized.get_function(func_name)
+
+        baseline_func = self._baseline.get_function(func_name)
+        call_threshold = self._call_threshold
+        time_threshold = self._time_threshold
+        perf_counter = time.perf_counter
+
+        def counting_func(*args):
+            start_time = perf_counter()
+            result = baseline_func(*args)
+            stats[1] += perf_counter() - start_time
+            stats[0] += 1
+            if not stats[2] and (stats[0] >= call_threshold or stats[1] >= time_threshold):
+                self.promote(func_name)
+            return result
+
+        return counting_func
+
+    def ensure_memory(self, size: int):
+        self._baseline.ensure_memory(size)
+
+    def write_memory(self, offset: int, data):
+        self._baseline.write_memory(offset, data)
+
+    def read_memory(self, offset: int, out: memoryview):
+        self._baseline.read_memory(offset, out)
+
+    def exec_function(self, func_name: str, *args):
+        result = self.get_function(func_name)(*args)
+        return result
+
+    def tier_stats(self) -> dict:
+        functions = {}
+        for func_name, stats in self._stats.items():
+            functions[func_name] = {
+                'calls': stats[0],
+                'baseline_time': stats[1],
+                'tier': 'optimized' if stats[2] else 'baseline'
+            }
+        return {
+            'promoted': sum(1 for stats in self._stats.values() if stats[2]),
+            'functions': functions
+        }
@@ -3,6 +3,7 @@ from typing import Optional
 from .ast import *
 from .callback_pool import CallbackPool
 from .utils import FunctionSignature
+from .utils import ELEMENT_TYPES, element_pytype
 
 
 class TypeChecker:
@@ -24,6 +25,9 @@ class TypeChecker:
     def generic_visit(self, node: ast.AST):
         raise NotImplementedError(ast.dump(node))
 
+    def add_function_signature(self, func_name: str, signature: FunctionSignature):
+        self._func_signatures[func_name] = signature
+
     def enter_function(self, func: FuncDef):
         if len(self._locals) > 0:
             raise RuntimeError('Function definition inside function is not allowed')
@@ -36,6 +40,8 @@ class TypeChecker:
         for param in func.params:
             if param.type is None:
                 raise RuntimeError('Function parameters must have type annotation')
+            if element_pytype(param.type) is not None and element_pytype(param.type) not in ELEMENT_TYPES:
+                raise RuntimeError(f'Unsupported buffer element type: {param.type}')
             self._locals[param.id] = param.type
             sig_params.append(param.type)
 
@@ -65,12 +71,22 @@ class TypeChecker:
     def visit_FuncDef(self, node: FuncDef):
         self.enter_function(node)
 
-        for stmt in node.stmts:
-            self.visit(stmt)
+        try:
+            for stmt in node.stmts:
+                self.visit(stmt)
+        except Exception:
+            # Leave the checker usable for the next function
+            self._locals.clear()
+            self._current_func_name = None
+            raise
 
         self.exit_function(node)
 
     def visit_FuncCall(self, node: FuncCall):
+        node.type = self._call_type(node)
+        return node.type
+
+    def _call_type(self, node: FuncCall):
         if node.func_name == 'int':
             if len(node.args) > 1:
                 raise RuntimeError('int() must has only 1 argument')
@@ -98,6 +114,15 @@ class TypeChecker:
                 raise RuntimeError(f'Invalid input type: {arg_ty} for bool() function')
 
             return 'bool'
+        elif node.func_name == 'len':
+            if len(node.args) != 1:
+                raise RuntimeError('len() must has only 1 argument')
+
+            arg_ty = self.visit(node.args[0])
+            if element_pytype(arg_ty) is None:
+                raise RuntimeError(f'Invalid input type: {arg_ty} for len() function')
+
+            return 'int'
         elif node.func_name == 'print':
             if len(node.args) > 1:
                 raise RuntimeError('print() only support 1 argument')
@@ -138,6 +163,19 @@ class TypeChecker:
         node.type = ty
         return ty
 
+    def visit_Subscript(self, node: Subscript):
+        value_ty = self.visit(node.value)
+        element_ty = element_pytype(value_ty)
+        if element_ty is None:
+            raise RuntimeError(f'Subscript is only supported on buffer types, not \'{value_ty}\'')
+
+        index_ty = self.visit(node.index)
+        if index_ty != 'int':
+            raise RuntimeError(f'Buffer index must be \'int\', not \'{index_ty}\'')
+
+        node.type = element_ty
+        return element_ty
+
     def visit_IntLiteral(self, node: IntLiteral):
         return 'int'
 
@@ -148,6 +186,15 @@ class TypeChecker:
         return 'bool'
 
     def visit_Assign(self, node: Assign):
+        if isinstance(node.target, Subscript):
+            # Store into a buffer element
+            target_ty = self.visit(node.target)
+            value_ty = self.visit(node.value)
+            if value_ty != target_ty:
+                raise RuntimeError(f'RValue type \'{value_ty}\' inconsistent with buffer element type \'{target_ty}\'')
+            node.type = value_ty
+            return
+
         target_name = node.target.id
         if target_name in self._locals:
             # Assign to existing variable
@@ -167,6 +214,9 @@ class TypeChecker:
             # Assign to new variable
             value_ty = self.visit(node.value)
 
+            if element_pytype(value_ty) is not None:
+                raise RuntimeError(f'Buffer \'{value_ty}\' can not be assigned to another variable')
+
             if node.type is not None and node.type != value_ty:
                 raise RuntimeError(f'RValue type \'{value_ty}\' inconsistent with type annotation \'{node.type}\'')
 
@@ -186,7 +236,10 @@ class TypeChecker:
         comparator_ty = self.visit(node.comparator)
         if left_ty != comparator_ty:
             raise RuntimeError(f'Compare type mismatch: left is \'{left_ty}\', comparator is \'{comparator_ty}\'')
+        if left_ty not in ('int', 'float', 'bool'):
+            raise RuntimeError(f'Unsupported type for Compare: \'{left_ty}\'')
 
+        node.type = 'bool'
         return 'bool'
 
     def visit_If(self, node: If):
@@ -209,6 +262,7 @@ class TypeChecker:
             raise RuntimeError(f'Unsupported type for BinOp: \'{left_ty}\'')
         if node.op == ast.Mod and left_ty != 'int':
             raise RuntimeError(f'Mod operation only support for int type')
+        node.type = left_ty
         return left_ty
 
     def visit_UnaryOp(self, node: UnaryOp):
@@ -219,6 +273,9 @@ class TypeChecker:
         elif ty == 'bool':
             if node.op != ast.Not:
                 raise RuntimeError(f'Invalid UnaryOp \'{node.op.__name__}\' for type \'{ty}\'')
+        else:
+            raise RuntimeError(f'Unsupported type for UnaryOp: \'{ty}\'')
+        node.type = ty
         return ty
 
     def visit_While(self, node: While):
@@ -276,6 +333,9 @@ class TypeChecker:
             # Return value exists, retrieve the type of return value
             ty = self.visit(node.value)
 
+            if element_pytype(ty) is not None:
+                raise RuntimeError('Buffers can not be returned')
+
             if return_type_declared is not None and ty != return_type_declared:
                 raise RuntimeError(
                     f'Return type inconsistent with that annotated in function declaration: {return_type_declared}')
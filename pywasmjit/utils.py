@@ -2,8 +2,15 @@ from typing import Optional
 
 from .wasm.components import WASMType
 
+VERSION = '0.1.0'
+
 DEBUG = False
 
+# 0: no optimization, 1: constant folding and propagation, dead code elimination,
+# 2: loop-invariant code motion and peephole optimization of the instructions
+DEFAULT_OPT_LEVEL = 2
+DEFAULT_INLINE_THRESHOLD = 32  # instructions
+
 
 def debug_print(fmt: str, *args):
     if not DEBUG:
@@ -12,20 +19,63 @@ def debug_print(fmt: str, *args):
     print(fmt, *args)
 
 
-def pytype_to_wasmtype(pytype: Optional[str]) -> Optional[WASMType]:
-    if pytype == 'int' or pytype == 'bool':
+# pytype => (array typecode, element size, alignment exponent, load instruction, store instruction)
+ELEMENT_TYPES = {
+    'int': ('i', 4, 2, 'i32.load', 'i32.store'),
+    'bool': ('B', 1, 0, 'i32.load8_u', 'i32.store8'),
+    'float': ('d', 8, 3, 'f64.load', 'f64.store')
+}
+
+# int elements of functions compiled in 64-bit integer mode
+INT64_ELEMENT_TYPE = ('q', 8, 3, 'i64.load', 'i64.store')
+
+# int_type => (min, max) of the Python ints representable by it
+INT_RANGES = {
+    'i32': (-2 ** 31, 2 ** 31 - 1),
+    'i64': (-2 ** 63, 2 ** 63 - 1)
+}
+
+
+def element_type(pytype: str, int_type: str = 'i32') -> tuple:
+    if pytype == 'int' and int_type == 'i64':
+        return INT64_ELEMENT_TYPE
+    return ELEMENT_TYPES[pytype]
+
+
+def element_pytype(pytype: Optional[str]) -> Optional[str]:
+    # 'list[float]' => 'float', None for everything which is not a buffer type
+    if pytype is not None and pytype.startswith('list[') and pytype.endswith(']'):
+        return pytype[5:-1]
+    return None
+
+
+def pytype_to_wasmtype(pytype: Optional[str], int_type: str = 'i32') -> Optional[WASMType]:
+    if pytype == 'int':
+        return WASMType(int_type)
+    elif pytype == 'bool':
         return WASMType('i32')
     elif pytype == 'float':
         return WASMType('f64')
     elif pytype is None or pytype == 'None':
         return None
+    elif element_pytype(pytype) in ELEMENT_TYPES:
+        # Buffers are passed as a pointer into linear memory (followed by the length, see pytype_to_wasmtypes)
+        return WASMType('i32')
     else:
         raise RuntimeError(f'Unsupported type: {pytype}')
 
 
+def pytype_to_wasmtypes(pytype: Optional[str], int_type: str = 'i32') -> list[WASMType]:
+    # Parameters may need more than one wasm value
+    if element_pytype(pytype) is not None:
+        return [WASMType('i32'), WASMType('i32')]
+    return [pytype_to_wasmtype(pytype, int_type)]
+
+
 class FunctionSignature:
-    __slots__ = ['params', 'return_type']
+    __slots__ = ['params', 'return_type', 'int_type']
 
-    def __init__(self, params: list[str | WASMType], return_type: str | WASMType):
+    def __init__(self, params: list[str | WASMType], return_type: str | WASMType, int_type: str = 'i32'):
         self.params: list[str | WASMType] = params
         self.return_type: str | WASMType = return_type
+        self.int_type: str = int_type  # wasm type of int values, 'i32' or 'i64'
@@ -1,8 +1,48 @@
 from typing import Optional
 from collections import OrderedDict
 from .components import *
+from .encoder import encode_module
 from .instructions import OPCODES
 
+LOCAL_INSTRUCTIONS = ('local.get', 'local.set', 'local.tee')
+
+
+def live_ranges(instructions: list[tuple], first_local: int) -> tuple[dict[int, list[int]], set[int]]:
+    # Conservative live range of every local from first_local on, as [first, last] instruction index.
+    # Control flow only moves forward except for the back edges of loops, so a range overlapping a loop
+    # (also one inside of it, a value may survive into the next iteration) is extended over the whole loop.
+    # Also returns the locals read before written in instruction order, they may rely on the zero initialization
+    ranges: dict[int, list[int]] = {}
+    read_first: set[int] = set()
+    loops: list[tuple[int, int]] = []
+    blocks: list[tuple[str, int]] = []
+    for i, instr in enumerate(instructions):
+        opcode = instr[0]
+        if opcode in LOCAL_INSTRUCTIONS and instr[1] >= first_local:
+            if instr[1] in ranges:
+                ranges[instr[1]][1] = i
+            else:
+                ranges[instr[1]] = [i, i]
+                if opcode == 'local.get':
+                    read_first.add(instr[1])
+        elif opcode in ('block', 'loop', 'if'):
+            blocks.append((opcode, i))
+        elif opcode == 'end':
+            kind, start = blocks.pop()
+            if kind == 'loop':
+                loops.append((start, i))
+
+    changed = True
+    while changed:
+        changed = False
+        for live in ranges.values():
+            for start, end in loops:
+                if live[0] <= end and start <= live[1] and (live[0] > start or live[1] < end):
+                    live[0] = min(live[0], start)
+                    live[1] = max(live[1], end)
+                    changed = True
+    return ranges, read_first
+
 
 class FunctionContext:
     __slots__ = ['func_name', 'is_export', 'return_type', 'params',
@@ -47,18 +87,36 @@ class FunctionContext:
         self.instructions.append(instruction)
 
     def enter_block(self, kind: str):
-        assert kind in ('if', 'for', 'while')
+        assert kind in ('if', 'for', 'while', 'inline', 'body')
         self._block_stack.append(kind)
 
     def exit_block(self, kind: str):
         assert self._block_stack.pop() == kind
 
+    @staticmethod
+    def _labels(kind: str) -> int:
+        # Loops are emitted as block (break), loop, block (continue) around the body
+        return 3 if kind in ('for', 'while') else 1
+
     def get_adjacent_loop_block_level(self) -> int:
-        for i, kind in enumerate(reversed(self._block_stack)):
+        # Label of the continue block of the innermost loop, its loop and break blocks follow
+        level = 0
+        for kind in reversed(self._block_stack):
             if kind in ('for', 'while'):
-                return i
+                return level
+            level += self._labels(kind)
         return 0
 
+    def get_block_level(self, block_kind: str) -> int:
+        # Label of the innermost block of the given kind, -1 if there is none:
+        # 'inline' is the block around an inlined function body, 'body' the loop around the whole function
+        level = 0
+        for kind in reversed(self._block_stack):
+            if kind == block_kind:
+                return level
+            level += self._labels(kind)
+        return -1
+
     def dump_locals(self):
         print('-------locals-------')
         for name, value in self.locals.items():
@@ -71,36 +129,57 @@ class FunctionContext:
 
 
 class Builder:
-    __slots__ = ['_functions', '_imported_functions', '_module', '_buffer']
+    __slots__ = ['_functions', '_imported_functions', '_imported_memory', '_called', '_buffer']
 
     def __init__(self):
         self._functions: list[Function] = []
         self._imported_functions: OrderedDict[str, ImportedFunction] = OrderedDict()  # name => ImportedFunction
-        self._module: Optional[Module] = None
+        self._imported_memory: Optional[Import] = None
+        self._called: set[str] = set()  # names of the functions called by the functions added
         self._buffer: Optional[bytes] = None
         pass
 
-    def add_function(self, ctx: FunctionContext):
+    def add_function(self, ctx: FunctionContext, reuse_locals: bool = False) -> int:
+        # Returns the number of locals declared, besides the parameters
         wasm_params = [param[1] for param in ctx.params]
         wasm_return = []
         if ctx.return_type is not None and ctx.return_type != 'None':
             wasm_return = [ctx.return_type]
 
+        # Locals which no instruction refers to any more (e.g. after optimization) are not declared,
+        # the others are renumbered. With reuse_locals, locals of the same type with disjoint live ranges
+        # share a slot
+        ranges, read_first = live_ranges(ctx.instructions, len(wasm_params))
+        local_types = {index: wasmtype for index, wasmtype in ctx.locals.values()}
         wasm_locals = []
-
-        for i, (name, local) in enumerate(ctx.locals.items()):
-            if i < len(wasm_params):
-                # Skip parameters (they are treated as local variables)
-                continue
-            wasm_locals.append(local[1])
+        slot_ends: list[float] = []  # slot => last instruction index of the ranges assigned to it
+        renumbered: dict[int, int] = {index: index for index in range(len(wasm_params))}
+
+        for index in sorted(ranges, key=lambda index: ranges[index][0]):
+            start, end = ranges[index]
+            slot = -1
+            if reuse_locals and index not in read_first:
+                slot = next((slot for slot, slot_end in enumerate(slot_ends)
+                             if slot_end < start and wasm_locals[slot] == local_types[index]), -1)
+            if slot == -1:
+                slot = len(wasm_locals)
+                wasm_locals.append(local_types[index])
+                slot_ends.append(0)
+            slot_ends[slot] = float('inf') if index in read_first else end
+            renumbered[index] = len(wasm_params) + slot
+
+        instructions = [(instr[0], renumbered[instr[1]]) if instr[0] in LOCAL_INSTRUCTIONS
+                        else instr for instr in ctx.instructions]
+        self._called.update(instr[1] for instr in instructions if instr[0] == 'call')
 
         func = Function(idname=ctx.func_name,
                         params=wasm_params,
                         returns=wasm_return,
                         locals=wasm_locals,
-                        instructions=ctx.instructions,
+                        instructions=instructions,
                         export=True)
         self._functions.append(func)
+        return len(wasm_locals)
 
     def add_imported_function(self, func_name: str, params: list[WASMType],
                               return_type: Optional[WASMType], modname: str, fieldname: str):
@@ -120,13 +199,27 @@ class Builder:
             return True
         return False
 
+    def import_memory(self, modname: str, fieldname: str, initial_pages: int = 1):
+        # Linear memory is owned by the runtime and shared by every module importing it
+        self._imported_memory = Import(modname, fieldname, 'memory', (initial_pages,))
+
+    def is_memory_imported(self) -> bool:
+        return self._imported_memory is not None
+
+    def _used_imported_functions(self) -> list[ImportedFunction]:
+        # Imports whose calls were optimized away do not have to be resolved when instantiating
+        return [func for name, func in self._imported_functions.items() if name in self._called]
+
     def build(self):
-        sections: list = [func for _, func in self._imported_functions.items()]
-        sections.extend(self._functions)
-        self._module = Module(*sections)
-        self._buffer = None
+        self._buffer = encode_module(self._used_imported_functions(), self._functions, self._imported_memory)
 
     def get_bytes(self):
-        if self._buffer is None:
-            self._buffer = self._module.to_bytes()
         return self._buffer
+
+    def to_module(self) -> Module:
+        # The component tree of the same module, for to_text() / show()
+        sections: list = self._used_imported_functions()
+        sections.extend(self._functions)
+        if self._imported_memory is not None:
+            sections.append(ImportSection(self._imported_memory))
+        return Module(*sections)
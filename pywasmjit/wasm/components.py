@@ -20,6 +20,22 @@ class WASMType(str):
         assert t in LANG_TYPES
 
 
+def intern_signature(sig_indices: dict, params, returns) -> int:
+    # Index of the signature in the type section, sig_indices maps (params, returns) => index in insertion order
+    return sig_indices.setdefault((tuple(params), tuple(returns)), len(sig_indices))
+
+
+def local_entries(locals) -> list[tuple[int, str]]:
+    # Collect runs of locals of the same type
+    entries = []  # list of (count, type) tuples
+    for loc_type in locals:
+        if entries and entries[-1][1] == loc_type:
+            entries[-1] = entries[-1][0] + 1, loc_type
+        else:
+            entries.append((1, loc_type))
+    return entries
+
+
 class WASMComponent:
     """Base class for representing components of a WASM module, from the module
     to sections and instructions. These components can be shown as text or
@@ -143,11 +159,11 @@ class Module(WASMComponent):
     def _process_functions(self, functions, start_section, import_section, export_section):
 
         # Prepare processing functions. In the order of imported and then defined,
-        # because that's the order of the function index space. We use the function
-        # index also for the signature index, though that's not strictly necessary
-        # (e.g. functions can share a signature).
+        # because that's the order of the function index space. Functions with the
+        # same signature share its entry in the type section.
         # Function index space is used in, calls, exports, elementes, start function.
-        auto_sigs = []
+        sig_indices = {}  # (params, returns) => index in the type section
+        func_sig_indices = []
         auto_defs = []
         auto_imports = []
         auto_exports = []
@@ -157,8 +173,8 @@ class Module(WASMComponent):
         # Process imported functions
         for func in functions:
             if isinstance(func, ImportedFunction):
-                auto_sigs.append(FunctionSig(func.params, func.returns))
-                auto_imports.append(Import(func.modname, func.fieldname, 'function', function_index))
+                sig_index = intern_signature(sig_indices, func.params, func.returns)
+                auto_imports.append(Import(func.modname, func.fieldname, 'function', sig_index))
                 if func.export:
                     auto_exports.append(Export(func.idname, 'function', function_index))
                 self.func_id_to_index[func.idname] = function_index
@@ -166,7 +182,7 @@ class Module(WASMComponent):
         # Process defined functions
         for func in functions:
             if isinstance(func, Function):
-                auto_sigs.append(FunctionSig(func.params, func.returns))
+                func_sig_indices.append(intern_signature(sig_indices, func.params, func.returns))
                 auto_defs.append(FunctionDef(func.locals, *func.instructions))
                 if func.export:
                     auto_exports.append(Export(func.idname, 'function', function_index))
@@ -176,6 +192,7 @@ class Module(WASMComponent):
                 function_index += 1
 
         # Insert auto-generated function sigs and defs
+        auto_sigs = [FunctionSig(params, returns) for params, returns in sig_indices]
         self.sections.append(TypeSection(*auto_sigs))
         self.sections.append(CodeSection(*auto_defs))
         # Insert auto-generated imports
@@ -189,7 +206,7 @@ class Module(WASMComponent):
             self.sections.append(export_section)
         export_section.exports.extend(auto_exports)
         # Insert function section
-        self.sections.append(FunctionSection(*range(len(auto_imports), function_index)))
+        self.sections.append(FunctionSection(*func_sig_indices))
         # Insert start section
         if auto_start is not None:
             self.sections.append(auto_start)
@@ -506,8 +523,18 @@ class Import(WASMComponent):
         if self.kind == 'function':
             f.write(b'\x00')
             f.write(pack_vu32(self.type))
+        elif self.kind == 'memory':
+            # resizable_limits, the type is (initial,) or (initial, maximum) in WASM pages
+            f.write(b'\x02')
+            if len(self.type) == 1:
+                f.write(pack_vu1(0))
+                f.write(pack_vu32(self.type[0]))
+            else:
+                f.write(pack_vu1(1))
+                f.write(pack_vu32(self.type[0]))
+                f.write(pack_vu32(self.type[1]))
         else:
-            raise RuntimeError('Can only import functions for now')
+            raise RuntimeError('Can only import functions and memory for now')
 
 
 class Export(WASMComponent):
@@ -589,17 +616,11 @@ class FunctionDef(WASMComponent):
 
     def to_file(self, f):
 
-        # Collect locals by type
-        local_entries = []  # list of (count, type) tuples
-        for loc_type in self.locals:
-            if local_entries and local_entries[-1] == loc_type:
-                local_entries[-1] = local_entries[-1][0] + 1, loc_type
-            else:
-                local_entries.append((1, loc_type))
+        entries = local_entries(self.locals)
 
         f3 = BytesIO()
-        f3.write(pack_vu32(len(local_entries)))  # number of local-entries in this func
-        for localentry in local_entries:
+        f3.write(pack_vu32(len(entries)))  # number of local-entries in this func
+        for localentry in entries:
             f3.write(pack_vu32(localentry[0]))  # number of locals of this type
             f3.write(LANG_TYPES[localentry[1]])
         for instruction in self.instructions:
@@ -654,7 +675,9 @@ class Instruction(WASMComponent):
         # Data comes after
         for arg in args:
             if isinstance(arg, (float, int)):
-                if self.type.startswith('f64.'):
+                if '.load' in self.type or '.store' in self.type:
+                    f.write(pack_vu32(arg))  # memarg: alignment and offset
+                elif self.type.startswith('f64.'):
                     f.write(pack_f64(arg))
                 elif self.type.startswith('i64.'):
                     f.write(pack_vs64(arg))
@@ -0,0 +1,167 @@
+from struct import pack as spack
+from typing import Optional
+
+from .components import LANG_TYPES, Function, ImportedFunction, Import, intern_signature, local_entries
+from .encoding import encode_unsigned_leb128
+from .instructions import OPCODES
+
+
+def _immediate_kind(name: str) -> str:
+    if name in ('block', 'loop', 'if'):
+        return 'block'
+    if name == 'call':
+        return 'call'
+    if name.endswith('.const'):
+        return name.split('.')[0]
+    if name in ('br', 'br_if', 'br_table', 'call_indirect') or name.startswith(('local.', 'global.', 'memory.')) \
+            or '.load' in name or '.store' in name:
+        # Label, local, global or function type indices, memory arguments (alignment and offset)
+        return 'u32'
+    return ''
+
+
+# name => (opcode, kind of the immediates following it)
+ENCODINGS: dict[str, tuple[int, str]] = {name: (opcode, _immediate_kind(name)) for name, opcode in OPCODES.items()}
+
+
+def _write_u32(buf: bytearray, value: int):
+    if value < 0x80:
+        buf.append(value)
+        return
+    while value >= 0x80:
+        buf.append(value & 0x7f | 0x80)
+        value >>= 7
+    buf.append(value)
+
+
+def _write_signed(buf: bytearray, value: int):
+    if -0x40 <= value < 0x40:
+        buf.append(value & 0x7f)
+        return
+    while True:
+        byte = value & 0x7f
+        value >>= 7
+        if (value == 0 and not byte & 0x40) or (value == -1 and byte & 0x40):
+            buf.append(byte)
+            return
+        buf.append(byte | 0x80)
+
+
+def _write_str(buf: bytearray, s: str):
+    encoded = s.encode('utf-8')
+    _write_u32(buf, len(encoded))
+    buf += encoded
+
+
+def _insert_size(buf: bytearray, start: int):
+    # Sizes precede their contents, they are only known once the contents are written
+    buf[start:start] = encode_unsigned_leb128(len(buf) - start)
+
+
+def _write_instructions(buf: bytearray, instructions: list[tuple], func_indices: dict[str, int]):
+    encodings = ENCODINGS
+    for instr in instructions:
+        try:
+            opcode, kind = encodings[instr[0]]
+        except KeyError:
+            raise TypeError('Unknown instruction %r' % instr[0]) from None
+        buf.append(opcode)
+        if not kind:
+            if len(instr) > 1:
+                raise RuntimeError('Unsupported instruction arg for %s' % instr[0])
+        elif kind == 'u32':
+            for arg in instr[1:]:
+                _write_u32(buf, arg)
+        elif kind == 'i32' or kind == 'i64':
+            _write_signed(buf, instr[1])
+        elif kind == 'f64':
+            buf += spack('<d', instr[1])
+        elif kind == 'block':
+            buf += LANG_TYPES[instr[1]]
+        elif kind == 'call':
+            _write_u32(buf, func_indices[instr[1]] if isinstance(instr[1], str) else instr[1])
+        else:
+            buf += spack('<f', instr[1])
+    buf.append(0x0b)  # end
+
+
+def encode_module(imported_functions: list[ImportedFunction], functions: list[Function],
+                  imported_memory: Optional[Import] = None) -> bytes:
+    """ Encode a module directly from the high-level function descriptions, into a single buffer.
+    Gives the same bytes as Module(*imported_functions, *functions, ImportSection(imported_memory)).to_bytes(),
+    without building the component objects. Instructions are tuples, as collected in a FunctionContext.
+    """
+    buf = bytearray(b'\x00asm\x01\x00\x00\x00')
+    all_functions = list(imported_functions) + list(functions)
+    func_indices = {func.idname: i for i, func in enumerate(all_functions)}
+
+    # Type section, functions with the same signature share its entry
+    sig_indices = {}  # (params, returns) => index in the type section
+    func_sig_indices = [intern_signature(sig_indices, func.params, func.returns) for func in all_functions]
+    buf.append(1)
+    start = len(buf)
+    _write_u32(buf, len(sig_indices))
+    for params, returns in sig_indices:
+        buf.append(0x60)
+        _write_u32(buf, len(params))
+        for param in params:
+            buf += LANG_TYPES[param]
+        _write_u32(buf, len(returns))
+        for ret in returns:
+            buf += LANG_TYPES[ret]
+    _insert_size(buf, start)
+
+    # Import section
+    buf.append(2)
+    start = len(buf)
+    _write_u32(buf, len(imported_functions) + (imported_memory is not None))
+    if imported_memory is not None:
+        _write_str(buf, imported_memory.modname)
+        _write_str(buf, imported_memory.fieldname)
+        buf.append(0x02)
+        limits = imported_memory.type
+        buf.append(len(limits) - 1)  # flags, 1 if a maximum follows
+        for limit in limits:
+            _write_u32(buf, limit)
+    for func in imported_functions:
+        _write_str(buf, func.modname)
+        _write_str(buf, func.fieldname)
+        buf.append(0x00)
+        _write_u32(buf, func_sig_indices[func_indices[func.idname]])
+    _insert_size(buf, start)
+
+    # Function section
+    buf.append(3)
+    start = len(buf)
+    _write_u32(buf, len(functions))
+    for sig_index in func_sig_indices[len(imported_functions):]:
+        _write_u32(buf, sig_index)
+    _insert_size(buf, start)
+
+    # Export section
+    buf.append(7)
+    start = len(buf)
+    exports = [func for func in all_functions if func.export]
+    _write_u32(buf, len(exports))
+    for func in exports:
+        _write_str(buf, func.idname)
+        buf.append(0x00)
+        _write_u32(buf, func_indices[func.idname])
+    _insert_size(buf, start)
+
+    # Code section
+    buf.append(10)
+    start = len(buf)
+    _write_u32(buf, len(functions))
+    for func in functions:
+        body_start = len(buf)
+        entries = local_entries(func.locals)
+        _write_u32(buf, len(entries))
+        for count, loc_type in entries:
+            _write_u32(buf, count)
+            buf += LANG_TYPES[loc_type]
+        _write_instructions(buf, func.instructions, func_indices)
+        _insert_size(buf, body_start)
+    _insert_size(buf, start)
+
+    return bytes(buf)
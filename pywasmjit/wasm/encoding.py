@@ -16,19 +16,19 @@ def pack_str(x) -> bytes:
 
 def pack_vs64(x) -> bytes:
     bb = encode_signed_leb128(x)
-    assert len(bb) <= 8
+    assert len(bb) <= 10
     return bb
 
 
 def pack_vs32(x) -> bytes:
     bb = encode_signed_leb128(x)
-    assert len(bb) <= 4
+    assert len(bb) <= 5
     return bb
 
 
 def pack_vu32(x) -> bytes:
     bb = encode_unsigned_leb128(x)
-    assert len(bb) <= 4
+    assert len(bb) <= 5
     return bb
 
 
@@ -46,19 +46,14 @@ def pack_vu1(x) -> bytes:
 
 def encode_signed_leb128(value) -> bytes:
     bb = []
-    if value < 0:
-        unsigned_ref_value = (1 - value) * 2
-    else:
-        unsigned_ref_value = value * 2
     while True:
         byte = value & 0x7F
         value >>= 7
-        unsigned_ref_value >>= 7
-        if unsigned_ref_value != 0:
-            byte = byte | 0x80
-        bb.append(byte)
-        if unsigned_ref_value == 0:
+        # Done once the rest is only the sign extension of the last byte
+        if (value == 0 and not byte & 0x40) or (value == -1 and byte & 0x40):
+            bb.append(byte)
             break
+        bb.append(byte | 0x80)
     return bytes(bb)
 
 
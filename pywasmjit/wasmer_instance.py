@@ -1,17 +1,31 @@
+import sys
+import time
+import platform
+import functools
+import importlib
+from typing import Optional
 from collections import defaultdict
+from importlib import metadata
 
-from wasmer import engine, Store, Module, Instance, Function, Type, FunctionType
-from wasmer_compiler_cranelift import Compiler
+import wasmer
+from wasmer import engine, Store, Module, Instance, Function, Type, FunctionType, Memory, MemoryType
 
 from .wasm.components import WASMType
 from .callback_pool import CallbackPool
-from .exec_instance import ExecInstance
+from .disk_cache import DiskCache, make_cache_key
+from .exec_instance import ExecInstance, WASM_PAGE_SIZE
+from .utils import pytype_to_wasmtype
+from .utils import debug_print
 
 
 def print_int(x: int) -> None:
     print(x)
 
 
+def print_int64(x: int) -> None:
+    print(x)
+
+
 def print_float(x: float) -> None:
     print(x)
 
@@ -34,38 +48,187 @@ def wasmtype_to_wasmer_type(ty: WASMType):
         raise RuntimeError(f'Invalid WASMType for convert into Wasmer type: {ty}')
 
 
-class WasmerInstance(ExecInstance):
-    __slots__ = ['_store', '_module', '_instance']
-
-    def __init__(self, callback_pool: CallbackPool, buf: bytes):
-        super().__init__(callback_pool, buf)
-        self._store = Store(engine.Universal(Compiler))
-        self._module = Module(self._store, buf)
+COMPILER_PACKAGES = {
+    'singlepass': 'wasmer_compiler_singlepass',
+    'cranelift': 'wasmer_compiler_cranelift',
+    'llvm': 'wasmer_compiler_llvm'
+}
+
+
+@functools.lru_cache(maxsize=None)
+def load_compiler(compiler: str):
+    if compiler not in COMPILER_PACKAGES:
+        raise RuntimeError(f'Unknown compiler: {compiler}')
+    package = COMPILER_PACKAGES[compiler]
+    try:
+        return importlib.import_module(package).Compiler
+    except ImportError:
+        raise RuntimeError(f'Compiler \'{compiler}\' requires package {package}')
+
+
+@functools.lru_cache(maxsize=None)
+def get_native_tag(compiler_package: str) -> bytes:
+    # Serialized modules are only valid for the exact engine, compiler and target that produced them
+    try:
+        compiler_version = metadata.version(compiler_package)
+    except metadata.PackageNotFoundError:
+        compiler_version = 'unknown'
+    return (f'pywasmjit-native;wasmer={wasmer.__version__};core={wasmer.__core_version__};engine=universal;'
+            f'compiler={compiler_package}-{compiler_version};target={sys.platform}-{platform.machine()}').encode()
+
+
+def load_native_artifact(native_cache: DiskCache, key: str, native_tag: bytes) -> Optional[bytes]:
+    data = native_cache.load(key)
+    if data is None:
+        return None
+
+    tag, _, artifact = data.partition(b'\n')
+    if tag != native_tag:
+        debug_print(f'Cached module built by another engine: {tag}')
+        native_cache.reject(key)
+        return None
+    return artifact
+
+
+# Serialized machine code of modules compiled ahead of linking, e.g. on a background thread.
+# Wasmer objects can not be used from any other thread than the one created them, their
+# serialized form can, and deserializing is much cheaper than compiling again.
+compiled_artifacts: dict[str, bytes] = {}  # key => serialized module
+
+
+def precompile_module(buf: bytes, native_cache: Optional[DiskCache] = None, compiler: str = 'cranelift',
+                      compiled_keys: Optional[set[str]] = None):
+    # The key of an artifact added to compiled_artifacts is added to compiled_keys as well
+    native_tag = get_native_tag(COMPILER_PACKAGES[compiler])
+    key = make_cache_key(buf, native_tag)
+    if key in compiled_artifacts:
+        return
+    if native_cache is not None and load_native_artifact(native_cache, key, native_tag) is not None:
+        return
+
+    module = Module(Store(engine.Universal(load_compiler(compiler))), buf)
+    artifact = module.serialize()
+    compiled_artifacts[key] = artifact
+    if compiled_keys is not None:
+        compiled_keys.add(key)
+    if native_cache is not None:
+        native_cache.store(key, native_tag + b'\n' + artifact)
 
-        import_object = defaultdict(dict)
-        import_object['js']['print_int'] = Function(self._store, print_int, FunctionType([Type.I32], []))
-        import_object['js']['print_float'] = Function(self._store, print_float, FunctionType([Type.F64], []))
-        import_object['js']['print_bool'] = Function(self._store, print_bool, FunctionType([Type.I32], []))
 
-        for func_name, value in callback_pool.callbacks.items():
-            func = value[0]
-            wasm_sig = value[2]
+class WasmerInstance(ExecInstance):
+    __slots__ = ['_callback_pool', '_store', '_native_cache', '_native_tag',
+                 '_host_functions', '_memory', '_instances', '_exports']
+
+    def __init__(self, callback_pool: CallbackPool, native_cache: Optional[DiskCache] = None,
+                 compiler: str = 'cranelift'):
+        super().__init__(callback_pool)
+        self._callback_pool = callback_pool
+        self._store = Store(engine.Universal(load_compiler(compiler)))
+        self._native_cache = native_cache
+        self._native_tag = get_native_tag(COMPILER_PACKAGES[compiler])
+
+        self._host_functions = defaultdict(dict)
+        self._host_functions['js']['print_int'] = Function(self._store, print_int, FunctionType([Type.I32], []))
+        self._host_functions['js']['print_int64'] = Function(self._store, print_int64, FunctionType([Type.I64], []))
+        self._host_functions['js']['print_float'] = Function(self._store, print_float, FunctionType([Type.F64], []))
+        self._host_functions['js']['print_bool'] = Function(self._store, print_bool, FunctionType([Type.I32], []))
+
+        self._memory = Memory(self._store, MemoryType(minimum=1))
+        self._host_functions['env']['memory'] = self._memory
+
+        self._instances: list[Instance] = []
+        self._exports: dict[str, Function] = {}  # func_name => exported function of linked modules
+
+    def _import_callback(self, fieldname: str):
+        if fieldname not in self._host_functions['callback']:
+            # Functions compiled in 64-bit integer mode import callbacks as 'name$i64'
+            func_name, _, int_type = fieldname.partition('$')
+            func = self._callback_pool.query_function(func_name)
+            if int_type:
+                py_sig = self._callback_pool.query_py_signature(func_name)
+                wasm_params = [pytype_to_wasmtype(param, int_type) for param in py_sig.params]
+                wasm_return_type = pytype_to_wasmtype(py_sig.return_type, int_type)
+            else:
+                wasm_sig = self._callback_pool.query_wasm_signature(func_name)
+                wasm_params, wasm_return_type = wasm_sig.params, wasm_sig.return_type
 
             fntype_params = []
-            for param in wasm_sig.params:
+            for param in wasm_params:
                 fntype_params.append(wasmtype_to_wasmer_type(param))
 
             fntype_ret = []
-            if wasm_sig.return_type is not None:
-                fntype_ret.append(wasmtype_to_wasmer_type(wasm_sig.return_type))
+            if wasm_return_type is not None:
+                fntype_ret.append(wasmtype_to_wasmer_type(wasm_return_type))
+
+            self._host_functions['callback'][fieldname] = Function(self._store, func,
+                                                                   FunctionType(fntype_params, fntype_ret))
+        return self._host_functions['callback'][fieldname]
+
+    def _resolve_import(self, modname: str, fieldname: str):
+        if modname == 'jit':
+            if fieldname not in self._exports:
+                raise RuntimeError(f'Function \'{fieldname}\' not linked in runtime')
+            return self._exports[fieldname]
+        elif modname == 'callback':
+            return self._import_callback(fieldname)
+        else:
+            return self._host_functions[modname][fieldname]
+
+    def _compile_module(self, buf: bytes) -> Module:
+        key = make_cache_key(buf, self._native_tag)
+
+        artifact = compiled_artifacts.get(key)
+        if artifact is None and self._native_cache is not None:
+            artifact = load_native_artifact(self._native_cache, key, self._native_tag)
+
+        if artifact is not None:
+            try:
+                return Module.deserialize(self._store, artifact)
+            except RuntimeError as e:
+                debug_print(f'Failed to deserialize compiled module: {e}')
+                compiled_artifacts.pop(key, None)
+                if self._native_cache is not None:
+                    self._native_cache.reject(key)
+
+        module = Module(self._store, buf)
+        if self._native_cache is not None:
+            self._native_cache.store(key, self._native_tag + b'\n' + module.serialize())
+        return module
+
+    def link_module(self, buf: bytes):
+        start_time = time.perf_counter()
+        module = self._compile_module(buf)
+        compiled_time = time.perf_counter()
 
-            import_object['callback'][func_name] = Function(self._store, func, FunctionType(fntype_params, fntype_ret))
+        import_object = defaultdict(dict)
+        for imp in module.imports:
+            import_object[imp.module][imp.name] = self._resolve_import(imp.module, imp.name)
 
-        self._instance = Instance(self._module, import_object)
+        instance = Instance(module, import_object)
+        self._instances.append(instance)
+        self.link_times = {'module': compiled_time - start_time, 'instance': time.perf_counter() - compiled_time}
 
-    def exec_function(self, func_name: str, *args):
-        wasm_func = getattr(self._instance.exports, func_name)
+        for export in module.exports:
+            self._exports[export.name] = getattr(instance.exports, export.name)
+        return module
+
+    def get_function(self, func_name: str):
+        wasm_func = self._exports.get(func_name)
         if wasm_func is None:
             raise RuntimeError(f'Function \'{func_name}\' not found in runtime')
-        result = wasm_func(*args)
+        return wasm_func
+
+    def ensure_memory(self, size: int):
+        pages = (size + WASM_PAGE_SIZE - 1) // WASM_PAGE_SIZE
+        if pages > self._memory.size:
+            self._memory.grow(pages - self._memory.size)
+
+    def write_memory(self, offset: int, data):
+        memoryview(self._memory.buffer)[offset:offset + len(data)] = data
+
+    def read_memory(self, offset: int, out: memoryview):
+        out[:] = memoryview(self._memory.buffer)[offset:offset + len(out)]
+
+    def exec_function(self, func_name: str, *args):
+        result = self.get_function(func_name)(*args)
         return result
@@ -0,0 +1,109 @@
+import time
+from array import array
+from pywasmjit import wasmjit
+
+
+@wasmjit
+def dot(x: list[float], y: list[float]) -> float:
+    total = 0.0
+    for i in range(len(x)):
+        total += x[i] * y[i]
+    return total
+
+
+@wasmjit
+def scale(x: list[float], factor: float):
+    for i in range(len(x)):
+        x[i] = x[i] * factor
+
+
+@wasmjit
+def count_positive(x: list[int]) -> int:
+    count = 0
+    for i in range(len(x)):
+        if x[i] > 0:
+            count += 1
+    return count
+
+
+@wasmjit
+def mark_even(x: list[int], flags: list[bool]):
+    for i in range(len(x)):
+        flags[i] = x[i] % 2 == 0
+
+
+@wasmjit
+def double_all(x: list[int]):
+    for i in range(len(x)):
+        x[i] = x[i] * 2
+
+
+def dot_nojit(x, y):
+    total = 0.0
+    for i in range(len(x)):
+        total += x[i] * y[i]
+    return total
+
+
+N = 1000000
+xs = array('d', (i * 0.5 for i in range(N)))
+ys = array('d', (1.0 for _ in range(N)))
+
+start_time = time.perf_counter()
+result = dot(xs, ys)
+elapsed = (time.perf_counter() - start_time) * 1000
+print(f'dot() = {result}, elapsed: {elapsed} ms')
+
+start_time = time.perf_counter()
+result = dot_nojit(xs, ys)
+elapsed_nojit = (time.perf_counter() - start_time) * 1000
+print(f'dot_nojit() = {result}, elapsed: {elapsed_nojit} ms')
+print('rate:', 'Infinite' if elapsed == 0 else elapsed_nojit / elapsed)
+
+values = [1.0, 2.0, 3.0]
+scale(values, 2)
+print(values)
+
+print(count_positive(array('i', [-1, 2, 0, 5])), count_positive([3, -3]))
+
+flags = [False] * 4
+mark_even([1, 2, 3, 4], flags)
+print(flags)
+
+# Buffers of another element type are converted for the call, and the stores written back into them
+longs = array('l', [1, -2, 3])
+double_all(longs)
+floats = array('f', [1.0, 2.0])
+scale(floats, 1.5)
+assert longs == array('l', [2, -4, 6]) and floats == array('f', [1.5, 3.0]), (longs, floats)
+print(longs, floats)
+
+try:
+    double_all(bytearray(b'\x01\x02'))
+except TypeError as e:
+    print('bytearray:', e)
+else:
+    raise AssertionError('writable buffers which can not be written back are rejected')
+
+try:
+    import numpy as np
+    arr = np.arange(5, dtype=np.float64)
+    scale(arr, 0.5)
+    print(arr, dot(arr, np.ones(5)))
+
+    ints = np.arange(4)  # int64, converted for the i32 elements
+    double_all(ints)
+    singles = np.arange(3, dtype=np.float32)
+    scale(singles, 2.0)
+    evens = np.zeros(4, dtype=np.int64)
+    mark_even([1, 2, 3, 4], evens)
+    assert ints.tolist() == [0, 2, 4, 6] and singles.tolist() == [0.0, 2.0, 4.0], (ints, singles)
+    assert evens.tolist() == [0, 1, 0, 1], evens
+    print(ints, singles, evens)
+except ImportError:
+    pass
+
+try:
+    dot(array('d', [1.0]), array('d', []))
+except RuntimeError as e:
+    print('out of bounds:', str(e).splitlines()[0])
@@ -0,0 +1,56 @@
+import os
+import glob
+import time
+import tempfile
+import pywasmjit
+from pywasmjit import wasmjit, wasmreg
+
+
+def is_prime(x: int):
+    for i in range(2, x):
+        if x % i == 0:
+            return False
+    return True
+
+
+def count_primes(n: int) -> int:
+    count = 0
+    for i in range(2, n):
+        if is_prime(i):
+            count += 1
+    return count
+
+
+def report(x: int):
+    pass
+
+
+with tempfile.TemporaryDirectory() as cache_dir:
+    for run in ('cold', 'warm', 'corrupt'):
+        pywasmjit.cleanup()
+        if run == 'corrupt':
+            # A truncated entry and one which is not an entry at all, both compiled again and replaced
+            paths = sorted(glob.glob(os.path.join(cache_dir, 'wasm', '*.bin')))
+            with open(paths[0], 'r+b') as f:
+                f.truncate(os.path.getsize(paths[0]) - 10)
+            with open(paths[1], 'wb') as f:
+                f.write(b'garbage')
+        pywasmjit.enable_cache(cache_dir)
+
+        start_time = time.perf_counter()
+        wasmreg(report)
+        jited_is_prime = wasmjit(is_prime)
+        jited_count_primes = wasmjit(count_primes)
+        pywasmjit.warmup()
+        elapsed = (time.perf_counter() - start_time) * 1000
+
+        print(f'{run}: count_primes(1000) = {jited_count_primes(1000)}, compile elapsed: {elapsed} ms')
+        stats = pywasmjit.cache_stats()['wasm']
+        print(f'{run}: hits = {stats["hits"]}, misses = {stats["misses"]}, stores = {stats["stores"]}, '
+              f'rejects = {stats["rejects"]}')
+        # Warm starts load both functions, count_primes included although is_prime was inlinable into it
+        expected = {'cold': (0, 2, 2, 0), 'warm': (2, 0, 0, 0), 'corrupt': (0, 2, 2, 2)}[run]
+        assert (stats['hits'], stats['misses'], stats['stores'], stats['rejects']) == expected, stats
+        assert jited_count_primes(1000) == 168
+
+    pywasmjit.disable_cache()
@@ -0,0 +1,43 @@
+import time
+from pywasmjit import main, wasmjit
+
+
+@wasmjit
+def add(x: int, y: int) -> int:
+    return x + y
+
+
+@wasmjit
+def scale(x: float, y: float) -> float:
+    return x * y
+
+
+N = 1000000
+
+add(1, 2)
+scale(1, 2)
+bare_add = main.default_context.wasm_exec_instance.get_function('add')
+
+start_time = time.perf_counter()
+for i in range(N):
+    bare_add(i, 1)
+elapsed_bare = (time.perf_counter() - start_time) * 1e9 / N
+print(f'bare export add(): {elapsed_bare} ns/call')
+
+start_time = time.perf_counter()
+for i in range(N):
+    add(i, 1)
+elapsed = (time.perf_counter() - start_time) * 1e9 / N
+print(f'wrapper add(): {elapsed} ns/call, overhead: {elapsed - elapsed_bare} ns/call')
+
+start_time = time.perf_counter()
+for i in range(N):
+    main.default_context.wasm_exec_instance.exec_function('add', i, 1)
+elapsed = (time.perf_counter() - start_time) * 1e9 / N
+print(f'exec_function add(): {elapsed} ns/call, overhead: {elapsed - elapsed_bare} ns/call')
+
+start_time = time.perf_counter()
+for i in range(N):
+    scale(i, 2)
+elapsed = (time.perf_counter() - start_time) * 1e9 / N
+print(f'wrapper scale() with int to float conversion: {elapsed} ns/call')
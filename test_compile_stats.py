@@ -0,0 +1,62 @@
+import ast
+import pywasmjit
+from pywasmjit import wasmjit, JITContext
+
+events = []
+pywasmjit.set_compile_hook(lambda func_name, phase, seconds: events.append((func_name, phase, seconds)))
+
+
+@wasmjit
+def collatz_length(n: int) -> int:
+    length = 1
+    while n != 1:
+        if n % 2 == 0:
+            n = n / 2
+        else:
+            n = 3 * n + 1
+        length += 1
+    return length
+
+
+@wasmjit
+def longest_collatz(n: int) -> int:
+    longest = 0
+    for i in range(1, n):
+        length = collatz_length(i)
+        if length > longest:
+            longest = length
+    return longest
+
+
+print(f'longest_collatz(10000) = {longest_collatz(10000)}')
+
+# The same functions without optimizations, compiled by name from the source of this file
+with open(__file__) as f:
+    nodes = {node.name: node for node in ast.parse(f.read()).body if isinstance(node, ast.FunctionDef)}
+baseline = JITContext()
+baseline.set_opt_level(0)
+baseline_funcs = {}
+for func_name in ('collatz_length', 'longest_collatz'):
+    nodes[func_name].decorator_list = []
+    baseline_funcs[func_name] = baseline.wasmjit(ast.unparse(nodes[func_name]))
+assert longest_collatz(10000) == baseline_funcs['longest_collatz'](10000)
+
+stats = pywasmjit.compile_stats()
+for func_name, entry in stats.items():
+    phases = ', '.join(f'{phase} {seconds * 1000:.3f}ms' for phase, seconds in entry['phases'].items())
+    print(f'{func_name}: {phases}, total {entry["total"] * 1000:.3f}ms, '
+          f'{entry["instructions"]} instructions, {entry["module_bytes"]} module bytes')
+
+hooked = {}
+for func_name, phase, seconds in events:
+    hooked[func_name, phase] = hooked.get((func_name, phase), 0.0) + seconds
+assert hooked == {(name, phase): t for name, e in stats.items() for phase, t in e['phases'].items()}
+print(f'hook received {len(events)} events for {len(hooked)} phases')
+
+# A function which fails to compile is not reported
+ctx = JITContext()
+try:
+    ctx.wasmjit('def broken(x: int) -> int:\n    return x + 1.0\n')
+except RuntimeError as e:
+    print(f'broken: {e}')
+assert 'broken' not in ctx.compile_stats()
@@ -0,0 +1,38 @@
+import sys
+import time
+from pywasmjit import JITContext
+
+# Every compiler pass recurses along the chain
+sys.setrecursionlimit(20000)
+
+
+def deep_expression(depth: int) -> str:
+    # x * 3 + 1 - x * 5 + 2 ..., nested to the left by the parser
+    terms = ['x']
+    for i in range(depth):
+        terms.append(f'{"+-"[i % 2]} x * {i % 7 + 2} {"+-"[i % 3 % 2]} {i % 5 + 1}')
+    return ' '.join(terms)
+
+
+def reference(x: int, depth: int) -> int:
+    total = x
+    for i in range(depth):
+        term = x * (i % 7 + 2)
+        total = total + term if i % 2 == 0 else total - term
+        total = total + (i % 5 + 1) if i % 3 % 2 == 0 else total - (i % 5 + 1)
+    return total
+
+
+for opt_level in (0, 2):
+    previous = None
+    for depth in (250, 500, 1000, 2000):
+        source = f'def deep_{depth}(x: int) -> int:\n    return {deep_expression(depth)}\n'
+        ctx = JITContext()
+        ctx.set_opt_level(opt_level)
+        start_time = time.perf_counter()
+        func = ctx.wasmjit(source)
+        elapsed = time.perf_counter() - start_time
+        ratio = f', x{elapsed / previous:.1f}' if previous is not None else ''
+        previous = elapsed
+        print(f'-O{opt_level}: depth {depth}: {elapsed:.4f}s{ratio}, '
+              f'same results: {func(7) == reference(7, depth)}')
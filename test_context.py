@@ -0,0 +1,58 @@
+import time
+import threading
+from pywasmjit import JITContext, wasmjit
+from pywasmjit.wasmer_instance import compiled_artifacts
+
+
+@wasmjit
+def scale(x: int) -> int:
+    return x * 2
+
+
+def build(factor: int, results: dict, name: str):
+    # Every thread owns a context, compiling and calling does not touch the other contexts
+    ctx = JITContext()
+
+    @ctx.wasmreg
+    def offset() -> int:
+        return factor
+
+    @ctx.wasmjit
+    def scale(x: int) -> int:
+        return x * 3 + offset()
+
+    @ctx.wasmjit
+    def total(n: int) -> int:
+        result = 0
+        for i in range(n):
+            result += scale(i)
+        return result
+
+    start_time = time.perf_counter()
+    results[name] = (total(1000), scale(5), (time.perf_counter() - start_time) * 1000)
+    ctx.cleanup()
+
+
+results = {}
+threads = [threading.Thread(target=build, args=(factor, results, f'ctx{factor}')) for factor in range(1, 5)]
+for thread in threads:
+    thread.start()
+for thread in threads:
+    thread.join()
+
+for name, (total, scaled, elapsed) in sorted(results.items()):
+    print(f'{name}: total(1000) = {total}, scale(5) = {scaled}, elapsed: {elapsed} ms')
+
+# The default context is unaffected by the others and their cleanup()
+print(scale(21))
+
+# Machine code compiled ahead of linking is shared by all contexts, cleanup() only drops its own
+first, second = JITContext(), JITContext()
+first.wasmjit('def first_kernel(x: int) -> int:\n    return x + 1\n', eager=True)
+second_kernel = second.wasmjit('def second_kernel(x: int) -> int:\n    return x + 2\n', eager=True)
+first.wait_ready()
+second.wait_ready()
+dropped, kept = set(first.compiled_keys), set(second.compiled_keys)
+first.cleanup()
+assert dropped and kept and not dropped & compiled_artifacts.keys() and kept <= compiled_artifacts.keys()
+print(second_kernel(40))
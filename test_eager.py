@@ -0,0 +1,48 @@
+import time
+import asyncio
+import pywasmjit
+from unittest.mock import patch
+from pywasmjit import JITContext
+from pywasmjit.codegen import WASMCodeGen
+from kernels import declare_kernels
+
+
+for eager in (False, True):
+    pywasmjit.cleanup()
+    kernels = declare_kernels(eager=eager)
+    time.sleep(0.5)  # the worker serves other requests meanwhile
+
+    start_time = time.perf_counter()
+    result = kernels[-1](1000)
+    elapsed = (time.perf_counter() - start_time) * 1000
+    print(f'eager={eager}: kernel_49(1000) = {result}, first call elapsed: {elapsed} ms')
+
+
+async def serve():
+    pywasmjit.cleanup()
+    kernels = declare_kernels(eager=True)
+    await pywasmjit.ready()
+
+    start_time = time.perf_counter()
+    result = kernels[0](1000)
+    elapsed = (time.perf_counter() - start_time) * 1000
+    print(f'after ready(): kernel_0(1000) = {result}, first call elapsed: {elapsed} ms')
+
+
+asyncio.run(serve())
+
+
+# A module rejected by the runtime fails the first call the same way, whether compiled eagerly or lazily
+errors = []
+for eager in (False, True):
+    ctx = JITContext()
+    with patch.object(WASMCodeGen, 'get_bytes', lambda self, func_name: b'\x00asm\x01\x00\x00\x00\x0a'):
+        broken = ctx.wasmjit('def broken(n: int) -> int:\n    return n + 1\n', eager=eager)
+        ctx.join_background_compile()
+        try:
+            broken(1)
+        except RuntimeError as e:
+            errors.append(str(e))
+    assert ctx.background_thread is None
+assert len(errors) == 2 and errors[0] == errors[1], errors
+print(f'invalid module: {errors[1]}')
@@ -0,0 +1,61 @@
+import time
+from wasmer import Store, Module
+from pywasmjit.wasm.builder import Builder, FunctionContext
+from pywasmjit.wasm.components import WASMType
+
+i32, i64, f64 = WASMType('i32'), WASMType('i64'), WASMType('f64')
+
+
+def build(statements: int) -> Builder:
+    # A function shaped like the generated code: arithmetic on locals, buffer accesses, branches and calls
+    builder = Builder()
+    builder.import_memory('env', 'memory')
+    builder.add_imported_function('helper', [i64], i64, 'jit', 'helper')
+    ctx = FunctionContext(func_name='kernel', is_export=True, return_type=f64, params=[('ptr', i32), ('n', i32)])
+    a, b, x = ctx.new_local('a', i32), ctx.new_local('b', i64), ctx.new_local('x', f64)
+    for k in range(statements):
+        ctx.add_instruction(('local.get', a))
+        ctx.add_instruction(('i32.const', (k * 7919) % 200000 - 100000))
+        ctx.add_instruction(('i32.add',))
+        ctx.add_instruction(('local.set', a))
+        ctx.add_instruction(('local.get', b))
+        ctx.add_instruction(('i64.const', k * 2 ** 40 - 2 ** 62 if k % 3 else k - 64))
+        ctx.add_instruction(('i64.mul',))
+        ctx.add_instruction(('call', 'helper'))
+        ctx.add_instruction(('local.set', b))
+        ctx.add_instruction(('block', 'emptyblock'))
+        ctx.add_instruction(('local.get', a))
+        ctx.add_instruction(('local.get', ctx.get_local_index('n')))
+        ctx.add_instruction(('i32.ge_u',))
+        ctx.add_instruction(('br_if', 0))
+        ctx.add_instruction(('local.get', x))
+        ctx.add_instruction(('local.get', ctx.get_local_index('ptr')))
+        ctx.add_instruction(('f64.load', 3, 8 * (k % 16)))
+        ctx.add_instruction(('f64.const', k / 3.0))
+        ctx.add_instruction(('f64.mul',))
+        ctx.add_instruction(('f64.add',))
+        ctx.add_instruction(('local.set', x))
+        ctx.add_instruction(('end',))
+    ctx.add_instruction(('local.get', x))
+    builder.add_function(ctx)
+    return builder
+
+
+store = Store()
+for statements in (100, 1000, 5000):
+    builder = build(statements)
+    instructions = statements * 22 + 1
+
+    start_time = time.perf_counter()
+    component_bytes = builder.to_module().to_bytes()
+    component_elapsed = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    builder.build()
+    encoded = builder.get_bytes()
+    encoder_elapsed = time.perf_counter() - start_time
+
+    Module(store, encoded)
+    print(f'{instructions} instructions, {len(encoded)} bytes: Module.to_bytes() {component_elapsed:.4f}s, '
+          f'encoder {encoder_elapsed:.4f}s, x{component_elapsed / encoder_elapsed:.1f}, '
+          f'same bytes: {encoded == component_bytes}')
@@ -0,0 +1,84 @@
+import time
+from pywasmjit import JITContext
+
+HELPERS = '''
+def clamp(x: int, low: int, high: int) -> int:
+    if x < low:
+        return low
+    if x > high:
+        return high
+    return x
+
+def square(x: int) -> int:
+    return x * x
+
+def lerp(a: float, b: float, t: float) -> float:
+    return a + (b - a) * t
+
+def is_odd(x: int) -> bool:
+    return x % 2 == 1
+
+def count_down(n: int):
+    while n > 0:
+        if n == 3:
+            return
+        n = n - 1
+'''
+
+KERNEL = '''
+def kernel(n: int) -> float:
+    total = 0
+    acc = 0.0
+    for i in range(n):
+        total += clamp(square(i % 100) - 2500, -1000, 1000)
+        if is_odd(i):
+            acc += lerp(0.0, 1.0, float(i % 10) / 10.0)
+        count_down(i % 5)
+    return acc + float(total)
+'''
+
+
+def build(inline_threshold: int):
+    ctx = JITContext()
+    ctx.set_inline_threshold(inline_threshold)
+    for source in HELPERS.split('\ndef ')[1:]:
+        ctx.wasmjit('def ' + source)
+    kernel = ctx.wasmjit(KERNEL.strip())
+    return ctx, kernel
+
+
+N = 3000000
+
+results = []
+for threshold in (0, 32):
+    ctx, kernel = build(threshold)
+    kernel(10)
+    start_time = time.perf_counter()
+    result = kernel(N)
+    elapsed = time.perf_counter() - start_time
+    results.append(result)
+    print(f'inline threshold {threshold}: kernel({N}) = {result}, {elapsed:.4f}s, '
+          f'{ctx.codegen.query_instruction_count("kernel")} instructions')
+
+print(f'same results: {results[0] == results[1]}')
+
+# The threshold is a setting of the context, functions compiled after cleanup() still follow it
+ctx, kernel = build(0)
+ctx.cleanup()
+for source in HELPERS.split('\ndef ')[1:]:
+    ctx.wasmjit('def ' + source)
+kernel = ctx.wasmjit(KERNEL.strip())
+assert kernel(N) == results[0]
+assert ctx.codegen.query_instruction_count('kernel') == build(0)[0].codegen.query_instruction_count('kernel')
+print(f'inline threshold after cleanup: {ctx.codegen.inline_threshold}')
+
+# Dead code elimination may leave nothing of a body, calls to it are not inlined and trap at its end
+ctx = JITContext()
+ctx.wasmjit('def never_returns(x: int) -> int:\n    if False:\n        return x\n')
+call_never_returns = ctx.wasmjit('def call_never_returns(x: int) -> int:\n    return never_returns(x) + 1\n')
+try:
+    call_never_returns(1)
+except RuntimeError as e:
+    print('empty body:', str(e).splitlines()[0])
+else:
+    raise AssertionError('falling off the end of a function returning int traps')
@@ -0,0 +1,63 @@
+import time
+import threading
+from array import array
+import pywasmjit
+from pywasmjit import wasmjit, wasmreg
+
+
+@wasmreg
+def weight(x: int) -> int:
+    # Releases the GIL in the middle of a wasm call, like a callback doing I/O would
+    time.sleep(0.002)
+    return x % 7
+
+
+@wasmjit
+def work(n: int) -> int:
+    total = 0
+    for i in range(n):
+        total += i % 13
+    return total + weight(n)
+
+
+@wasmjit
+def nested(n: int) -> int:
+    return work(n) - work(n)
+
+
+@wasmjit
+def total(xs: list[int]) -> int:
+    result = 0
+    for i in range(len(xs)):
+        result += xs[i]
+    return result
+
+
+def handler(results: list, index: int):
+    # Every thread gets an instance of its own, with its own linear memory
+    values = array('i', range(index * 10, index * 10 + 10))
+    results[index] = (work(2000000), nested(1000), total(values), sum(values))
+
+
+for size in (1, 4):
+    pywasmjit.enable_instance_pool(size)
+    pywasmjit.warmup()
+
+    results = [None] * 8
+    threads = [threading.Thread(target=handler, args=(results, i)) for i in range(8)]
+    start_time = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = (time.perf_counter() - start_time) * 1000
+
+    print(f'size={size}: 8 threads, elapsed: {elapsed} ms')
+    print(f'size={size}: results consistent: {len(set(result[:2] for result in results)) == 1}, '
+          f'buffers: {all(result[2] == result[3] for result in results)}')
+    stats = pywasmjit.pool_stats()
+    print(f'size={size}: instances = {stats["instances"]}, calls = {stats["calls"]}, waits = {stats["waits"]}, '
+          f'wait_time = {stats["wait_time"] * 1000} ms')
+
+pywasmjit.disable_instance_pool()
+print(work(10), pywasmjit.pool_stats())
@@ -0,0 +1,121 @@
+import time
+from array import array
+from pywasmjit import wasmjit, wasmreg
+
+
+@wasmjit
+def sum_squares_i32(n: int) -> int:
+    total = 0
+    for i in range(n):
+        total += i * i
+    return total
+
+
+@wasmjit(int64=True)
+def sum_squares_i64(n: int) -> int:
+    total = 0
+    for i in range(n):
+        total += i * i
+    return total
+
+
+@wasmjit(checked=True)
+def sum_squares_checked(n: int) -> int:
+    total = 0
+    for i in range(n):
+        total += i * i
+    return total
+
+
+@wasmjit(int64=True, checked=True)
+def fibonacci(n: int) -> int:
+    a = 0
+    b = 1
+    for i in range(n):
+        c = a + b
+        a = b
+        b = c
+    return a
+
+
+@wasmjit(int64=True, checked=True)
+def negate(x: int) -> int:
+    return -x
+
+
+@wasmjit(int64=True, checked=True)
+def product(x: int, y: int) -> int:
+    return x * y
+
+
+@wasmreg
+def report(x: int) -> None:
+    print('report:', x)
+
+
+@wasmjit(int64=True)
+def scaled_total(values: list[int], factor: int) -> int:
+    total = 0
+    for i in range(len(values)):
+        total += values[i] * factor
+    report(total)
+    return total
+
+
+@wasmjit(int64=True)
+def mix(x: int) -> int:
+    # i64 function calling an i32 one
+    return sum_squares_i32(int(x)) + x
+
+
+@wasmjit(int64=True)
+def divide(x: int, y: int) -> int:
+    return x / y
+
+
+@wasmjit(int64=True)
+def remainder(x: int, y: int) -> int:
+    return x % y
+
+
+@wasmjit(int64=True, opt_level=0)
+def divide_by_constants(x: int) -> int:
+    return x / 1000 + x % 7
+
+
+def sum_squares_nojit(n: int) -> int:
+    total = 0
+    for i in range(n):
+        total += i * i
+    return total
+
+
+N = 1000000
+print(f'i32: {sum_squares_i32(N)}, i64: {sum_squares_i64(N)}, python: {sum_squares_nojit(N)}')
+
+start_time = time.perf_counter()
+ret = sum_squares_checked(1000)
+elapsed = (time.perf_counter() - start_time) * 1000
+print(f'checked, in range: {ret}, elapsed: {elapsed} ms')
+
+start_time = time.perf_counter()
+ret = sum_squares_checked(N)
+elapsed = (time.perf_counter() - start_time) * 1000
+print(f'checked, overflowing: {ret}, elapsed: {elapsed} ms')
+
+print(f'fibonacci(90) = {fibonacci(90)}, fibonacci(100) = {fibonacci(100)}')
+print(negate(-2 ** 63), negate(5), product(2 ** 40, 2 ** 30), product(-1, -2 ** 63), product(3 * 10 ** 9, 7))
+print(product(2 ** 70, 1))
+
+print(scaled_total(array('q', [2 ** 40, 1, 2]), 3), scaled_total([1, 2, 3], 2))
+print(mix(10))
+print(sum_squares_i64.map(array('q', [10, 100, 1000000])))
+
+# int / and % are the truncating i64.div_s / i64.rem_s, the remainder takes the sign of the dividend
+for x, y in ((7, 2), (-7, 2), (7, -2), (-7, -2), (2 ** 62, 3), (-2 ** 63, 2 ** 40 + 1), (2 ** 63 - 1, -7)):
+    quotient = abs(x) // abs(y) * (1 if (x < 0) == (y < 0) else -1)
+    assert divide(x, y) == quotient, (x, y, divide(x, y))
+    assert remainder(x, y) == x - y * quotient, (x, y, remainder(x, y))
+assert divide_by_constants(-2 ** 50 - 5) == -((2 ** 50 + 5) // 1000) - (2 ** 50 + 5) % 7
+print(f'divide(-7, 2) = {divide(-7, 2)}, remainder(-7, 2) = {remainder(-7, 2)}, '
+      f'divide_by_constants(-2 ** 50 - 5) = {divide_by_constants(-2 ** 50 - 5)}')
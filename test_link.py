@@ -0,0 +1,27 @@
+import time
+from pywasmjit import wasmjit
+
+
+@wasmjit
+def square(x: int) -> int:
+    return x * x
+
+
+print(square(7))
+
+
+# Decorated after the first call, linked against the already instantiated module of square()
+@wasmjit
+def sum_of_squares(x: int, y: int) -> int:
+    return square(x) + square(y)
+
+
+print(sum_of_squares(3, 4))
+print(square(5))
+
+start_time = time.perf_counter()
+for i in range(100):
+    func = wasmjit(f'def late_{i}(x: int) -> int:\n    return sum_of_squares(x, {i})\n')
+    func(i)
+elapsed = (time.perf_counter() - start_time) * 1000
+print(f'100 late decorations + first calls, elapsed: {elapsed} ms')
@@ -0,0 +1,73 @@
+import time
+from array import array
+from pywasmjit import wasmjit, wasmreg
+
+
+@wasmjit
+def digit_sum(x: int) -> int:
+    total = 0
+    while x > 0:
+        total += x % 10
+        x = x / 10
+    return total
+
+
+@wasmjit
+def lerp(a: float, b: float, t: float) -> float:
+    return a + (b - a) * t
+
+
+@wasmjit
+def is_even(x: int):
+    return x % 2 == 0
+
+
+N = 200000
+xs = array('i', range(1, N + 1))
+
+start_time = time.perf_counter()
+result = [digit_sum(x) for x in xs]
+elapsed = (time.perf_counter() - start_time) * 1000
+print(f'digit_sum() per element: max = {max(result)}, elapsed: {elapsed} ms')
+
+start_time = time.perf_counter()
+result_map = digit_sum.map(xs)
+elapsed_map = (time.perf_counter() - start_time) * 1000
+print(f'digit_sum.map(): max = {max(result_map)}, elapsed: {elapsed_map} ms')
+print('same results:', list(result_map) == result)
+print('rate:', 'Infinite' if elapsed_map == 0 else elapsed / elapsed_map)
+
+print(list(lerp.map([0.0, 1.0, 2.0], [10.0, 11.0, 12.0], [0.5, 0.25, 1.0])))
+print(list(is_even.map([1, 2, 3, 4])))
+
+
+@wasmjit
+def sum_list(xs: list[int]) -> int:
+    total = 0
+    for i in range(len(xs)):
+        total += xs[i]
+    return total
+
+
+@wasmreg
+def window_sum(x: int) -> int:
+    # Passes a buffer of its own to wasm while a map is running
+    return sum_list([x, x + 1, x + 2])
+
+
+@wasmjit
+def with_window(x: int) -> int:
+    return x * 100 + window_sum(x)
+
+
+xs = list(range(200))
+result_map = list(with_window.map(xs))
+assert result_map == [with_window(x) for x in xs] == [x * 100 + 3 * x + 3 for x in xs]
+print('callback buffers during map():', result_map[:5])
+
+try:
+    import numpy as np
+    values = lerp.map(np.zeros(5), np.arange(5, dtype=np.float64), np.full(5, 0.5))
+    print(type(values).__name__, values)
+except ImportError:
+    pass
@@ -0,0 +1,108 @@
+import ast
+import glob
+from unittest.mock import patch
+from pywasmjit import JITContext
+from pywasmjit.wasm import encoder
+
+# Functions calling others of the same signature, their modules import them
+EXTRA_KERNELS = '''
+def poly_a(x: int) -> int:
+    return x * x + 1
+
+def poly_b(x: int) -> int:
+    return poly_a(x) * 3 - x
+
+def poly_c(x: int) -> int:
+    return poly_a(x) + poly_b(x) - poly_a(poly_b(x % 10))
+
+def mixed_locals(n: int) -> float:
+    a = 0
+    b = 1
+    x = 0.5
+    c = 2
+    y = 1.5
+    for i in range(n):
+        a = a + i
+        x = x * 0.5 + float(a)
+        b = b * 3 % 1000
+        y = y + x
+        c = c + b
+    return x + y + float(a + b + c)
+'''
+
+
+def load_kernels() -> list[str]:
+    # The decorated functions of the bundled tests
+    kernels = []
+    for filename in sorted(glob.glob('test_*.py')):
+        with open(filename) as f:
+            tree = ast.parse(f.read())
+        for node in tree.body:
+            if isinstance(node, ast.FunctionDef) and \
+                    any('wasmjit' in ast.unparse(decorator) for decorator in node.decorator_list):
+                node.decorator_list = []
+                kernels.append(ast.unparse(node))
+    kernels.extend(ast.unparse(node) for node in ast.parse(EXTRA_KERNELS).body)
+    return kernels
+
+
+class Unshared(tuple):
+    # A (params, returns) type section key equal only to itself, every function gets an entry of its own
+    __hash__ = object.__hash__
+
+    def __eq__(self, other):
+        return self is other
+
+
+def unshared_signature(sig_indices: dict, params, returns) -> int:
+    return sig_indices.setdefault(Unshared((tuple(params), tuple(returns))), len(sig_indices))
+
+
+def unshared_locals(locals) -> list[tuple[int, str]]:
+    return [(1, loc_type) for loc_type in locals]
+
+
+def compile_modules(opt_level: int, interned: bool) -> tuple[JITContext, dict]:
+    ctx = JITContext()
+    ctx.set_opt_level(opt_level)
+    ctx.set_inline_threshold(0)
+    names = []
+    for source in load_kernels():
+        try:
+            ctx.wasmjit(source)
+        except (RuntimeError, NotImplementedError):
+            # Needs callbacks or a mode set by the test itself
+            continue
+        names.append(source.split('(')[0][4:])
+    if interned:
+        ctx.compose_wasm()
+    else:
+        with patch.object(encoder, 'intern_signature', unshared_signature), \
+                patch.object(encoder, 'local_entries', unshared_locals):
+            ctx.compose_wasm()
+    return ctx, {name: len(buf) for name, buf in zip(names, ctx.wasm_modules)}
+
+
+for opt_level in (0, 2):
+    ctx, sizes = compile_modules(opt_level, True)
+    plain_ctx, plain_sizes = compile_modules(opt_level, False)
+    print(f'-O{opt_level}: ' + ', '.join(f'{name} {size}' for name, size in sizes.items()))
+    print(f'-O{opt_level}: {len(sizes)} modules, {sum(sizes.values())} bytes, '
+          f'{sum(plain_sizes.values())} bytes without shared types and local runs')
+
+    # Sharing never costs bytes, and saves some on modules importing functions of their own signature
+    # and on functions with runs of locals of the same type
+    assert sizes.keys() == plain_sizes.keys()
+    assert all(sizes[name] <= plain_sizes[name] for name in sizes)
+    assert sizes['poly_c'] < plain_sizes['poly_c'] and sizes['mixed_locals'] < plain_sizes['mixed_locals']
+    assert sum(sizes.values()) < sum(plain_sizes.values())
+
+    # Every module still has to be accepted by the runtime, and compute the same results
+    values = []
+    for context in (ctx, plain_ctx):
+        context.warmup()
+        poly_c = context.wasm_exec_instance.get_function('poly_c')
+        mixed_locals = context.wasm_exec_instance.get_function('mixed_locals')
+        values.append((poly_c(7), mixed_locals(10)))
+    assert values[0] == values[1]
+    print(f'-O{opt_level}: poly_c(7) = {values[0][0]}, mixed_locals(10) = {values[0][1]}')
@@ -0,0 +1,29 @@
+import time
+import tempfile
+import pywasmjit
+from pywasmjit import main
+from kernels import declare_kernels
+
+
+def measure_instantiate(run: str):
+    funcs = declare_kernels()
+    main.default_context.compose_wasm()
+    start_time = time.perf_counter()
+    main.default_context.init_instance()
+    elapsed = (time.perf_counter() - start_time) * 1000
+    print(f'{run}: kernel_49(1000) = {funcs[49](1000)}, instantiate elapsed: {elapsed} ms')
+
+
+pywasmjit.cleanup()
+pywasmjit.disable_cache()
+measure_instantiate('no cache')
+
+with tempfile.TemporaryDirectory() as cache_dir:
+    for run in ('cold native cache', 'warm native cache'):
+        pywasmjit.cleanup()
+        pywasmjit.enable_cache(cache_dir, native=True)
+        measure_instantiate(run)
+        stats = pywasmjit.cache_stats()['native']
+        print(f'{run}: hits = {stats["hits"]}, misses = {stats["misses"]}, rejects = {stats["rejects"]}')
+
+    pywasmjit.disable_cache()
@@ -0,0 +1,210 @@
+import ast
+import glob
+import time
+from pywasmjit import JITContext
+
+# Extra kernels with folding, dead code and peephole opportunities, on top of the ones in the bundled tests
+EXTRA_KERNELS = '''
+def fold_buffer_size(n: int) -> int:
+    size = 2 * 1024
+    total = 0
+    for i in range(n):
+        total += size * 4 + i % size
+    return total
+
+def fold_float(n: int) -> float:
+    scale = float(3) / 2.0
+    total = 0.0
+    for i in range(n):
+        total += float(i) * scale - -1.5
+    return total
+
+def fold_branches(n: int) -> int:
+    debug = False
+    limit = 100 - 1
+    total = 0
+    for i in range(n):
+        if debug:
+            print(i)
+        if limit > 50:
+            total += i % 7
+        else:
+            total = total - 1
+    return total
+
+def peephole_negate(n: int) -> int:
+    total = 0
+    i = 0
+    while i < n:
+        total = total + -i
+        total = total - -(i % 3)
+        if total == 0:
+            total = total + 1
+        i = i + 1
+    return total
+
+def peephole_float(n: int) -> float:
+    total = 0.0
+    for i in range(n):
+        x = float(i)
+        total = total - -x + -0.5
+    return total
+
+def peephole_return(n: int) -> int:
+    i = 0
+    while i < n:
+        i = i + 3
+        return i
+    return -i
+
+def licm_nested(n: int) -> float:
+    total = 0.0
+    for i in range(n):
+        for j in range(n):
+            total += float(j) / float(n) * (float(i) * 0.5 + float(n * n))
+    return total
+
+def licm_while(n: int) -> int:
+    count = 0
+    for i in range(1, n):
+        j = 0
+        while j < n * n / 100:
+            count += (j * i + n * 3) % 7
+            j = j + 1
+    return count
+
+def dce_unreachable(n: int) -> int:
+    total = 0
+    unused = n * 3
+    for i in range(n):
+        if i > 5:
+            break
+            total += 100
+        total += i
+    return total
+    total = total + 1
+
+def dce_branches(n: int) -> int:
+    scale = 1
+    if n > 0:
+        return n
+    else:
+        return -n
+    print(scale)
+
+def expr_statements(n: int) -> int:
+    total = 0
+    for i in range(n):
+        fold_buffer_size(i % 3)
+        total + i
+        float(i) * 0.5
+        total += i
+    return total
+
+def sequential_loops(n: int) -> int:
+    total = 0
+    for i in range(n):
+        total += i
+    for j in range(n, 0, -1):
+        total += j % 3
+    for k in range(0, n, total % 3 + 1):
+        total += k
+    m = 0
+    while m < n:
+        t = m * 2
+        total += t
+        m = m + 1
+    return total
+'''
+
+OPT_LEVELS = (0, 1, 2)
+
+
+def load_kernels() -> list[tuple[str, str]]:
+    kernels = []
+    for filename in sorted(glob.glob('test_*.py')):
+        with open(filename) as f:
+            tree = ast.parse(f.read())
+        for node in tree.body:
+            decorated = any('wasmjit' in ast.unparse(decorator) for decorator in node.decorator_list)\
+                if isinstance(node, ast.FunctionDef) else False
+            if decorated:
+                node.decorator_list = []
+                kernels.append((filename, ast.unparse(node)))
+    for node in ast.parse(EXTRA_KERNELS).body:
+        kernels.append(('extra', ast.unparse(node)))
+    return kernels
+
+
+def compile_kernels(opt_level: int) -> tuple[JITContext, dict, dict, dict]:
+    ctx = JITContext()
+    ctx.set_opt_level(opt_level)
+    # Inlining trades size for speed, it is measured by test_inline.py
+    ctx.set_inline_threshold(0)
+    counts = {}
+    locals_counts = {}
+    wrappers = {}
+    for filename, source in load_kernels():
+        name = source.split('(')[0][4:]
+        try:
+            wrappers[name] = ctx.wasmjit(source)
+        except (RuntimeError, NotImplementedError):
+            # Needs callbacks, other functions of its file or a mode set by the test itself
+            continue
+        counts[name] = ctx.codegen.query_instruction_count(name)
+        locals_counts[name] = ctx.codegen.query_local_count(name)
+    return ctx, counts, wrappers, locals_counts
+
+
+results = {level: compile_kernels(level) for level in OPT_LEVELS}
+
+print(f'{"kernel":<24}' + ''.join(f'{f"-O{level}":>8}' for level in OPT_LEVELS))
+for name in results[0][1]:
+    print(f'{name:<24}' + ''.join(f'{results[level][1].get(name, "-"):>8}' for level in OPT_LEVELS))
+totals = [sum(results[level][1].values()) for level in OPT_LEVELS]
+print(f'{"total":<24}' + ''.join(f'{total:>8}' for total in totals))
+# Later levels also trade size for speed (strength reduction), only the passes targeted by a kernel have to shrink it
+shrunk = {}
+for prefix, level in (('fold_', 1), ('dce_', 1), ('peephole_', 2)):
+    names = [name for name in results[level][1] if name.startswith(prefix)]
+    shrunk[prefix] = all(results[level][1][name] < results[level - 1][1][name] for name in names)
+    print(f'{prefix}* kernels smaller at -O{level} than at -O{level - 1}: {shrunk[prefix]}')
+assert shrunk['fold_']
+assert shrunk['dce_']
+assert shrunk['peephole_']
+
+locals_totals = [sum(results[level][3].values()) for level in OPT_LEVELS]
+print(f'{"locals declared":<24}' + ''.join(f'{total:>8}' for total in locals_totals))
+print(f'sequential_loops locals: ' + ', '.join(f'-O{level} {results[level][3]["sequential_loops"]}'
+                                              for level in OPT_LEVELS))
+assert results[2][3]['sequential_loops'] < results[0][3]['sequential_loops']
+
+# Module size and the time wasmer takes to compile all of them
+for level in OPT_LEVELS:
+    ctx = results[level][0]
+    start_time = time.perf_counter()
+    ctx.warmup()
+    elapsed = time.perf_counter() - start_time
+    print(f'-O{level}: {sum(len(buf) for buf in ctx.wasm_modules)} module bytes, compiled in {elapsed:.4f}s')
+
+# Optimized code has to compute the same results
+for name, args in (('fold_buffer_size', (1000,)), ('fold_float', (1000,)), ('fold_branches', (1000,)),
+                   ('peephole_negate', (1000,)), ('peephole_float', (1000,)), ('peephole_return', (10,)),
+                   ('peephole_return', (0,)),
+                   ('licm_nested', (100,)), ('licm_while', (100,)),
+                   ('dce_unreachable', (10,)), ('dce_branches', (-3,)), ('sequential_loops', (100,)),
+                   ('expr_statements', (100,)),
+                   ('fibonacci', (20,)), ('test_for', (1000,)), ('test_while', (1000,))):
+    values = [results[level][2][name](*args) for level in OPT_LEVELS]
+    print(f'{name}{args}: ' + ', '.join(f'-O{level} {value}' for level, value in zip(OPT_LEVELS, values)))
+    assert all(value == values[0] for value in values), (name, args, values)
+
+for name, args in (('licm_nested', (1000,)), ('licm_while', (300,))):
+    timings = []
+    for level in OPT_LEVELS:
+        func = results[level][2][name]
+        func(*args)
+        start_time = time.perf_counter()
+        func(*args)
+        timings.append(time.perf_counter() - start_time)
+    print(f'{name}{args}: ' + ', '.join(f'-O{level} {timing:.4f}s' for level, timing in zip(OPT_LEVELS, timings)))
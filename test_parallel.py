@@ -0,0 +1,45 @@
+import os
+import time
+from pywasmjit import wasmjit
+
+
+@wasmjit
+def count_primes(lo: int, hi: int) -> int:
+    count = 0
+    for n in range(lo, hi):
+        is_prime = n >= 2
+        i = 2
+        while i * i <= n:
+            if n % i == 0:
+                is_prime = False
+                break
+            i += 1
+        if is_prime:
+            count += 1
+    return count
+
+
+@wasmjit(int64=True, checked=True)
+def square(x: int) -> int:
+    return x * x
+
+
+if __name__ == '__main__':
+    ranges = [(i * 20000, (i + 1) * 20000) for i in range(64)]
+
+    start_time = time.perf_counter()
+    ret = sum(count_primes(lo, hi) for lo, hi in ranges)
+    elapsed = (time.perf_counter() - start_time) * 1000
+    print(f'count_primes() sequential = {ret}, elapsed: {elapsed} ms')
+
+    workers = os.cpu_count()
+    for i in range(2):
+        start_time = time.perf_counter()
+        ret = sum(count_primes.parallel_map(ranges, workers=workers))
+        elapsed_parallel = (time.perf_counter() - start_time) * 1000
+        print(f'count_primes.parallel_map(workers={workers}) = {ret}, elapsed: {elapsed_parallel} ms'
+              f'{" (pool startup included)" if i == 0 else ""}')
+    print('rate:', 'Infinite' if elapsed_parallel == 0 else elapsed / elapsed_parallel)
+
+    # Overflowing calls are rerun by Python in the calling process
+    print(square.parallel_map([3, 2 ** 31, 2 ** 40, 2 ** 70], workers=2))
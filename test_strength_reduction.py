@@ -0,0 +1,61 @@
+import time
+from pywasmjit import JITContext
+from pywasmjit.constant_folder import wrap_int, div_trunc
+
+CONSTANTS = (2, 3, 5, 7, 8, 9, 15, 16, 1024, -2, -8, -1024)
+OPS = {
+    'mul': ('*', lambda x, c, int_type: wrap_int(x * c, int_type)),
+    'div': ('/', lambda x, c, int_type: wrap_int(div_trunc(x, c), int_type)),
+    'mod': ('%', lambda x, c, int_type: x - c * div_trunc(x, c))
+}
+
+
+def build(opt_level: int, int64: bool) -> dict:
+    ctx = JITContext()
+    ctx.set_opt_level(opt_level)
+    ctx.set_int_mode(int64=int64)
+    funcs = {}
+    for name, (symbol, _) in OPS.items():
+        for c in CONSTANTS:
+            func_name = f'{name}_{"m" if c < 0 else ""}{abs(c)}'
+            funcs[name, c] = ctx.wasmjit(f'def {func_name}(x: int) -> int:\n    return x {symbol} {c}\n')
+    return funcs
+
+
+# int / and % compile to the truncating wasm div_s / rem_s, the references are computed with the same rounding
+for int_type, bits in (('i32', 32), ('i64', 64)):
+    values = [0, 1, -1, 2, -2, 3, -3, 7, -7, 8, -8, 1023, -1023, 1024, -1025, 123456789, -123456789,
+              2 ** (bits - 1) - 1, -2 ** (bits - 1), -2 ** (bits - 1) + 1]
+    optimized = build(2, int_type == 'i64')
+    baseline = build(0, int_type == 'i64')
+    mismatches = 0
+    for (name, c), func in optimized.items():
+        reference = OPS[name][1]
+        for x in values:
+            expected = reference(x, c, int_type)
+            if not func(x) == baseline[name, c](x) == expected:
+                mismatches += 1
+                print(f'{int_type} {x} {OPS[name][0]} {c}: {func(x)}, -O0 {baseline[name, c](x)}, expected {expected}')
+    print(f'{int_type}: {len(optimized) * len(values)} results checked, {mismatches} mismatches')
+    assert mismatches == 0
+
+KERNEL = '''
+def bucket_sum(n: int) -> int:
+    total = 0
+    for i in range(-n, n):
+        total += i / 16 + i % 1024 + i * 9
+    return total
+'''
+
+results = []
+for opt_level in (0, 2):
+    ctx = JITContext()
+    ctx.set_opt_level(opt_level)
+    bucket_sum = ctx.wasmjit(KERNEL.strip())
+    bucket_sum(10)
+    start_time = time.perf_counter()
+    result = bucket_sum(5000000)
+    elapsed = time.perf_counter() - start_time
+    results.append(result)
+    print(f'-O{opt_level}: bucket_sum(5000000) = {result}, {elapsed:.4f}s')
+assert results[0] == results[1]
@@ -0,0 +1,54 @@
+import time
+from pywasmjit import JITContext
+
+KERNELS = '''
+def gcd(a: int, b: int) -> int:
+    if b == 0:
+        return a
+    return gcd(b, a % b)
+
+def digit_sum_to(n: int, acc: int) -> int:
+    if n == 0:
+        return acc
+    return digit_sum_to(n - 1, acc + n % 10)
+
+def collatz_steps(n: int, steps: int) -> int:
+    if n == 1:
+        return steps
+    if n % 2 == 0:
+        return collatz_steps(n / 2, steps + 1)
+    else:
+        return collatz_steps(3 * n + 1, steps + 1)
+
+def harmonic(n: int, acc: float) -> float:
+    while n > 0:
+        return harmonic(n - 1, acc + 1.0 / float(n))
+    return acc
+'''
+
+
+def build(opt_level: int) -> dict:
+    ctx = JITContext()
+    ctx.set_opt_level(opt_level)
+    funcs = {}
+    for source in KERNELS.split('\ndef ')[1:]:
+        func = ctx.wasmjit('def ' + source)
+        funcs[source.split('(')[0]] = func
+    return funcs
+
+
+for opt_level in (0, 2):
+    funcs = build(opt_level)
+    print(f'-O{opt_level}: gcd(1071, 462) = {funcs["gcd"](1071, 462)}, '
+          f'collatz_steps(27, 0) = {funcs["collatz_steps"](27, 0)}, '
+          f'harmonic(1000, 0.0) = {funcs["harmonic"](1000, 0.0)}')
+
+    for depth in (1000, 1000000):
+        start_time = time.perf_counter()
+        try:
+            result = funcs['digit_sum_to'](depth, 0)
+        except RuntimeError as e:
+            # Without the loop every call takes a wasm stack frame
+            result = str(e).splitlines()[0]
+        elapsed = time.perf_counter() - start_time
+        print(f'-O{opt_level}: digit_sum_to({depth}, 0) = {result}, {elapsed:.4f}s')
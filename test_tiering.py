@@ -0,0 +1,30 @@
+import time
+import pywasmjit
+from kernels import declare_kernels
+
+
+for tiered in (False, True):
+    pywasmjit.cleanup()
+    if tiered:
+        pywasmjit.enable_tiering(call_threshold=10, time_threshold=0.005)
+    else:
+        pywasmjit.disable_tiering()
+
+    kernels = declare_kernels()
+    start_time = time.perf_counter()
+    pywasmjit.warmup()
+    elapsed = (time.perf_counter() - start_time) * 1000
+    print(f'tiered={tiered}: startup compile elapsed: {elapsed} ms')
+
+    hot = kernels[7]
+    start_time = time.perf_counter()
+    for _ in range(20):
+        result = hot(100000)
+    elapsed = (time.perf_counter() - start_time) * 1000
+    print(f'tiered={tiered}: 20 x kernel_7(100000) = {result}, elapsed: {elapsed} ms')
+
+    if tiered:
+        stats = pywasmjit.tier_stats()
+        print(f'promoted: {stats["promoted"]}, kernel_7: {stats["functions"]["kernel_7"]}')
+
+pywasmjit.disable_tiering()